@@ -0,0 +1,114 @@
+"""Scale benchmark for the generation history store: batched inserts, keyset pages and full-text search.
+
+Usage (from writer-pro-backend): python benchmarks/bench_history.py [--rows 1000000] [--path history-bench.sqlite3]
+
+Fills a scratch database with synthetic generations, then reports p50/p99 latency of the first and of a
+deep page (listing and filtered by request type), of searches for a common and a rare word, of the
+response cache lookup by inputs hash, and the cost on the request path of recording one generation.
+An existing --path with enough rows is reused, so repeated runs skip the fill.
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+WORDS = ("onboarding retention launch pricing roadmap hiring feedback design release metrics customers growth "
+         "product engineering marketing story lessons mistakes team culture remote meeting writing habits").split()
+REQUEST_TYPES = ("optimize", "rewrite", "reply", "outline")
+CALLERS = ("key:bench", "ip:203.0.113.9")  # Reads are scoped to one caller; half the rows belong to someone else
+
+def synthetic_rows(start: int, count: int, rng: random.Random, now: float) -> list[tuple]:
+    rows = []
+    for i in range(start, start + count):
+        prompt = " ".join(rng.choices(WORDS, k=30))
+        output = " ".join(rng.choices(WORDS, k=80))
+        if i % 50000 == 0:
+            output += " quasar"  # A rare word: 20 matches per million rows
+        rows.append((now - (10_000_000 - i) * 0.01, REQUEST_TYPES[i % 4], "/bench", hashlib.sha256(str(i).encode()).hexdigest(),
+                     "gpt-4o", prompt, output, 120, 300, 0, 850.0, 0, CALLERS[i // 4 % len(CALLERS)]))
+    return rows
+
+def percentiles(samples_ns: list[int]) -> tuple[float, float]:
+    ordered = sorted(samples_ns)
+    return ordered[len(ordered) // 2] / 1e6, ordered[int(len(ordered) * 0.99)] / 1e6
+
+def timed(fn, repeats: int) -> tuple[float, float]:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+    return percentiles(samples)
+
+def fill(store, rows: int, batch: int):
+    existing = store._conn.execute("SELECT COALESCE(MAX(id), 0) FROM generations").fetchone()[0]
+    if existing >= rows:
+        print(f"reusing {existing} existing rows")
+        return
+    rng = random.Random(existing)
+    now = time.time()
+    started = time.perf_counter()
+    for offset in range(existing, rows, batch):
+        store.insert_many(synthetic_rows(offset, min(batch, rows - offset), rng, now))
+    elapsed = time.perf_counter() - started
+    print(f"inserted {rows - existing} rows in batches of {batch}: {elapsed:.1f}s ({(rows - existing) / elapsed:,.0f} rows/s)")
+
+def bench_record(requests: int) -> tuple[float, float]:
+    """Per-call cost of GenerationHistory.record, which is all a request pays for its history entry."""
+    from services.history import GenerationHistory
+    history = GenerationHistory()
+    history.store = object()  # Only checked for None; nothing is flushed here
+    samples = []
+    for i in range(requests):
+        start = time.perf_counter_ns()
+        history.record("reply", "0" * 64, "gpt-4o", "prompt text", "output text", {"prompt_tokens": 12, "completion_tokens": 30}, 0.8)
+        samples.append(time.perf_counter_ns() - start)
+        if len(history._pending) >= 200:
+            history._pending = []
+    return percentiles(samples)
+
+def main(args):
+    from services.history import HistoryStore, search_query
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = args.path or os.path.join(scratch, "history.sqlite3")
+        store = HistoryStore(path)
+        fill(store, args.rows, args.batch)
+        max_id = store._conn.execute("SELECT MAX(id) FROM generations").fetchone()[0]
+        deep = max(2, max_id // 100)  # 99% of the way back
+        hashes = [hashlib.sha256(str(random.randrange(max_id)).encode()).hexdigest() for _ in range(args.repeats)]
+
+        rows = [
+            ("page 1", timed(lambda: store.page(CALLERS[0], None, 20), args.repeats)),
+            ("deep page", timed(lambda: store.page(CALLERS[0], deep, 20), args.repeats)),
+            ("page 1, type=reply", timed(lambda: store.page(CALLERS[0], None, 20, "reply"), args.repeats)),
+            ("deep page, type=reply", timed(lambda: store.page(CALLERS[0], deep, 20, "reply"), args.repeats)),
+            ("search common word", timed(lambda: store.search(CALLERS[0], search_query("onboarding"), None, 20), args.repeats)),
+            ("search common, deep", timed(lambda: store.search(CALLERS[0], search_query("onboarding"), deep, 20), args.repeats)),
+            ("search two words", timed(lambda: store.search(CALLERS[0], search_query("pricing hiring"), None, 20), args.repeats)),
+            ("search rare word", timed(lambda: store.search(CALLERS[0], search_query("quasar"), None, 20), args.repeats)),
+            ("search prefix", timed(lambda: store.search(CALLERS[0], search_query("roadm*"), None, 20, "outline"), args.repeats)),
+            ("cache lookup by hash", timed(lambda: store.lookup(hashes.pop() if hashes else "0", 0), args.repeats)),
+        ]
+        store.close()
+
+        print(f"\n{max_id:,} rows, {os.path.getsize(path) / 1e6:,.0f} MB on disk\n")
+        print(f"{'query':<26}{'p50 ms':>10}{'p99 ms':>10}")
+        for label, (p50, p99) in rows:
+            print(f"{label:<26}{p50:>10.3f}{p99:>10.3f}")
+        p50, p99 = bench_record(100000)
+        print(f"\nrecord() on the request path: p50 {p50 * 1000:.2f} us, p99 {p99 * 1000:.2f} us")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--path", help="Keep the database here instead of a temporary directory")
+    main(parser.parse_args())
@@ -0,0 +1,70 @@
+"""Compares a new AsyncClient per call against the shared pooled client.
+
+Usage (from writer-pro-backend): python benchmarks/bench_http_client.py [--requests 500] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from stub_openai import run_stub_server
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_workload(call_openai_api, client, total: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await call_openai_api(f"Benchmark prompt {i}", "You are a benchmark.", None, "optimize", client, False)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rps": total / elapsed,
+    }
+
+async def main(args):
+    from services.http_client import create_http_client
+    from services.openai import call_openai_api
+
+    # Before: client=None makes call_openai_api open a fresh AsyncClient per request
+    before = await run_workload(call_openai_api, None, args.requests, args.concurrency)
+    async with create_http_client() as client:
+        after = await run_workload(call_openai_api, client, args.requests, args.concurrency)
+
+    print(f"{'mode':<16}{'p50 (ms)':>12}{'p99 (ms)':>12}{'req/s':>12}")
+    for name, result in (("per-call client", before), ("shared client", after)):
+        print(f"{name:<16}{result['p50_ms']:>12.1f}{result['p99_ms']:>12.1f}{result['rps']:>12.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    # Measure the client alone, without the scheduler's rate budgets throttling the run
+    os.environ["SCHEDULER_REQUESTS_PER_MINUTE"] = "1000000"
+    os.environ["SCHEDULER_TOKENS_PER_MINUTE"] = "1000000000"
+    os.environ["SCHEDULER_INITIAL_CONCURRENCY"] = str(args.concurrency)
+    os.environ["SCHEDULER_MAX_CONCURRENCY"] = str(args.concurrency)
+    with run_stub_server(args.port, STUB_LATENCY_MS=args.latency_ms) as url:
+        os.environ["OPENAI_API_URL"] = url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+        asyncio.run(main(args))
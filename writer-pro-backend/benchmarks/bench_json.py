@@ -0,0 +1,153 @@
+"""Micro-benchmarks for response parsing and JSON encoding on large, recorded-shape payloads.
+
+Usage (from writer-pro-backend): python benchmarks/bench_json.py [--seconds 0.5]
+
+The payloads follow the shapes of recorded OpenAI responses (a long chat completion, a Responses API
+answer with web_search_call items and hundreds of url_citation annotations, a 2k-chunk stream).
+They are generated from a fixed seed rather than stored, so no real user content is kept in the repo.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+WORDS = ("content strategy audience growth engagement platform post thread hook story data insight "
+         "launch team product customer feedback community newsletter brand voice").split()
+
+def prose(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def chat_completion(rng: random.Random) -> dict:
+    # A long outline: ~8k words of markdown in a single choice
+    sections = [f"## Section {i}\n\n" + prose(rng, 400) for i in range(20)]
+    return {
+        "id": "chatcmpl-recorded",
+        "object": "chat.completion",
+        "created": 1735689600,
+        "model": "gpt-4.5-preview",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "\n\n".join(sections), "refusal": None}, "logprobs": None, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1432, "completion_tokens": 10811, "total_tokens": 12243, "prompt_tokens_details": {"cached_tokens": 1024}},
+        "system_fingerprint": "fp_recorded",
+    }
+
+def responses_with_search(rng: random.Random) -> dict:
+    # Search-grounded answer: several web_search_call items, then a message with many citations
+    text = prose(rng, 3000)
+    annotations = [
+        {"type": "url_citation", "start_index": i * 50, "end_index": i * 50 + 40, "url": f"https://example.com/articles/{i}?utm_source=openai", "title": prose(rng, 8)}
+        for i in range(300)
+    ]
+    output = [{"type": "web_search_call", "id": f"ws_{i}", "status": "completed", "action": {"type": "search", "query": prose(rng, 6)}} for i in range(6)]
+    output.append({
+        "type": "message", "id": "msg_recorded", "status": "completed", "role": "assistant",
+        "content": [{"type": "output_text", "text": text, "annotations": annotations}],
+    })
+    return {"id": "resp_recorded", "object": "response", "model": "gpt-4o-search-preview", "output": output,
+            "usage": {"input_tokens": 2200, "output_tokens": 4100, "total_tokens": 6300, "input_tokens_details": {"cached_tokens": 0}}}
+
+def stream_lines(rng: random.Random) -> list:
+    chunk = {"id": "chatcmpl-recorded", "object": "chat.completion.chunk", "created": 1735689600, "model": "gpt-4.5-preview", "system_fingerprint": "fp_recorded"}
+    return [json.dumps({**chunk, "choices": [{"index": 0, "delta": {"content": rng.choice(WORDS) + " "}, "logprobs": None, "finish_reason": None}]}) for _ in range(2000)]
+
+def request_body(rng: random.Random) -> dict:
+    return {
+        "model": "gpt-4.5-preview",
+        "messages": [{"role": "system", "content": prose(rng, 600)}, {"role": "user", "content": prose(rng, 5000)}],
+        "max_tokens": 4096, "temperature": 1.0, "top_p": 1.0,
+    }
+
+def bench(fn, seconds: float) -> float:
+    """Microseconds per call, best of three timed batches."""
+    fn()
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        if time.perf_counter() - start > seconds / 10:
+            break
+        calls *= 2
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best * 1e6
+
+def available_backends():
+    from services import jsoncodec
+    backends = {"json": jsoncodec._select_backend("json")}
+    for name in ("orjson", "msgspec"):
+        if importlib.util.find_spec(name) is not None:
+            backends[name] = jsoncodec._select_backend(name)
+    return backends
+
+def legacy_extract(data):
+    """What post_completion did before the single-pass parser: check choices, then walk the tree."""
+    from services.openai import extract_text_from_output
+    if "choices" in data and len(data["choices"]) > 0:
+        content = data["choices"][0].get("message", {}).get("content", "")
+        if content:
+            return content
+    return extract_text_from_output(data)
+
+def main(args):
+    from fastapi.responses import JSONResponse
+    from services.jsoncodec import FastJSONResponse
+    from services.openai import extract_text_from_delta, parse_completion
+
+    rng = random.Random(7)
+    payloads = {
+        "chat completion": json.dumps(chat_completion(rng)).encode(),
+        "responses + search": json.dumps(responses_with_search(rng)).encode(),
+    }
+    lines = stream_lines(rng)
+    body = request_body(rng)
+    backends = available_backends()
+    rows = []
+
+    for name, raw in payloads.items():
+        base = bench(lambda: legacy_extract(json.loads(raw)), args.seconds)
+        rows.append((f"parse {name} ({len(raw) // 1024} KB)", "json + legacy walk", base, base))
+        for backend, (_, _, loads) in backends.items():
+            rows.append(("", f"{backend} + parse_completion", bench(lambda: parse_completion(loads(raw)), args.seconds), base))
+
+    base = bench(lambda: [extract_text_from_delta(json.loads(line)) for line in lines], args.seconds)
+    rows.append((f"stream {len(lines)} chunks", "json", base, base))
+    for backend, (_, _, loads) in backends.items():
+        if backend != "json":
+            rows.append(("", backend, bench(lambda: [extract_text_from_delta(loads(line)) for line in lines], args.seconds), base))
+
+    size = len(json.dumps(body)) // 1024
+    base = bench(lambda: json.dumps(body, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode(), args.seconds)
+    rows.append((f"encode request body ({size} KB)", "json (httpx json=)", base, base))
+    for backend, (_, dumps, _) in backends.items():
+        if backend != "json":
+            rows.append(("", backend, bench(lambda: dumps(body), args.seconds), base))
+
+    response = {"outline": chat_completion(rng)["choices"][0]["message"]["content"], "tokenEstimate": {"chunks": 1, "maxTokens": 4096}}
+    base = bench(lambda: JSONResponse(response), args.seconds)
+    rows.append(("render API response", "JSONResponse", base, base))
+    rows.append(("", "FastJSONResponse", bench(lambda: FastJSONResponse(response), args.seconds), base))
+
+    print(f"{'benchmark':<34}{'implementation':<30}{'us/op':>12}{'speedup':>10}")
+    for label, impl, micros, baseline in rows:
+        print(f"{label:<34}{impl:<30}{micros:>12.1f}{baseline / micros:>9.2f}x")
+
+    # The legacy walk never looked at Responses API `output`, so it found no text there
+    print()
+    for name, raw in payloads.items():
+        text, usage = parse_completion(json.loads(raw))
+        print(f"{name}: legacy walk found text={bool(legacy_extract(json.loads(raw)))}, parse_completion found text={bool(text)}, usage={usage is not None}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=0.5, help="Approximate time budget per measurement")
+    main(parser.parse_args())
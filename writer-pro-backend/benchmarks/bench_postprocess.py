@@ -0,0 +1,167 @@
+"""Corpus benchmark for the optimize post-processing stage (services/platform_text.py).
+
+Usage (from writer-pro-backend): python benchmarks/bench_postprocess.py [--posts 100000] [--corpus posts.jsonl]
+
+Builds a synthetic corpus of generated posts for every platform in PLATFORM_LIMITS. Lengths cluster just
+around the limit, with a tail to about 1.8x. The posts mix markdown, links, hashtags, emoji sequences (skin
+tones, ZWJ families, flags), decomposed accents and CJK. `--corpus` reads JSON lines with "platform" and
+"text" instead.
+
+For each platform it reports the per-post p50/p99 of measuring and of the full fit. It counts how many posts
+each local fix settled and how many would still need a "shorten" model call. It then checks that every post
+fits once the model fallback is disabled. Finally it compares grapheme counting with the regex module and
+with the fallback segmenter. Exits non-zero if any fitted post is over its limit.
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import config
+from services import platform_text
+
+WORDS = ("we shipped the new editor after months of work it is faster simpler and works offline thanks to every "
+         "beta tester who sent feedback bug reports and ideas pricing roadmap hiring launch customers growth").split()
+EMOJI = ["🚀", "🎉", "👍🏽", "👩‍💻", "👨‍👩‍👧‍👦", "🇺🇸", "🇯🇵", "❤️", "✅", "1️⃣"]
+EXTRAS = ["café", "naïve", "cafe\u0301", "日本語のテキスト", "한국어", "Ünïcödé", "—", "“quoted”"]  # One accent is decomposed
+HASHTAGS = ["#launch", "#editor", "#productivity", "#buildinpublic", "#startup", "#saas", "#ai", "#writing"]
+
+def sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(6, 18))
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), rng.choice(EMOJI))
+    if rng.random() < 0.15:
+        words.insert(rng.randrange(len(words)), rng.choice(EXTRAS))
+    if rng.random() < 0.1:
+        words.insert(rng.randrange(len(words)), f"https://example.com/{rng.choice(WORDS)}/{rng.randrange(10**6)}?ref=post_{rng.randrange(99)}")
+    if rng.random() < 0.03:
+        words[0] = f"**{words[0]}**"
+    return " ".join(words).capitalize() + rng.choice(".!?")
+
+def synthetic_post(platform: str, rng: random.Random) -> str:
+    # Models mostly land near the limit they were given, sometimes well past it
+    target = config.PLATFORM_LIMITS[platform] * rng.triangular(0.5, 1.8, 0.95)
+    parts = []
+    if rng.random() < 0.05:
+        parts.append(f"## {sentence(rng)}\n\n")
+    length = 0
+    while True:
+        piece = sentence(rng)
+        if parts and length + len(piece) > target:
+            break
+        if rng.random() < 0.03:
+            piece = f"* {piece}\n"
+        elif rng.random() < 0.15:
+            piece += "\n\n"
+        else:
+            piece += "  " if rng.random() < 0.02 else " "
+        parts.append(piece)
+        length += len(piece)
+    text = "".join(parts).strip()
+    if rng.random() < 0.7:
+        text += "\n\n" + " ".join(rng.sample(HASHTAGS, rng.randint(1, 6)))
+    return f'"{text}"' if rng.random() < 0.2 else text
+
+def load_corpus(args) -> list[tuple[str, str]]:
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as corpus:
+            return [(row["platform"], row["text"]) for row in map(json.loads, corpus) if row.get("text")]
+    rng = random.Random(args.seed)
+    platforms = [platform for platform in config.PLATFORM_LIMITS if platform != "default"]
+    # Long-form platforms get fewer posts, so short and long posts carry similar total work
+    weights = [1 / config.PLATFORM_LIMITS[platform] ** 0.5 for platform in platforms]
+    return [(platform, synthetic_post(platform, rng)) for platform in rng.choices(platforms, weights, k=args.posts)]
+
+def percentiles(samples_ns: list[int]) -> tuple[float, float]:
+    ordered = sorted(samples_ns)
+    return ordered[len(ordered) // 2] / 1e3, ordered[int(len(ordered) * 0.99)] / 1e3
+
+def bench_platforms(posts: list[tuple[str, str]]) -> bool:
+    by_platform = collections.defaultdict(list)
+    for platform, text in posts:
+        by_platform[platform].append(text)
+
+    print(f"{'platform':<11}{'posts':>8}{'over':>7}{'measure p50/p99 us':>21}{'fit p50/p99 us':>18}  strongest fix per post")
+    ok = True
+    totals = collections.Counter()
+    for platform, texts in sorted(by_platform.items()):
+        measure, _ = platform_text.length_function(platform)
+        limit = platform_text.character_limit(platform)
+        measure_ns, fit_ns, outcomes, over = [], [], collections.Counter(), 0
+        for text in texts:
+            start = time.perf_counter_ns()
+            over += measure(text) > limit
+            measure_ns.append(time.perf_counter_ns() - start)
+            start = time.perf_counter_ns()
+            result = platform_text.fit_to_limit(text, platform, config.POSTPROCESS_MAX_TRIM_RATIO)
+            fit_ns.append(time.perf_counter_ns() - start)
+            if result.needs_model:
+                outcomes["shorten_call"] += 1
+                # The same post with the model fallback unavailable must still come back within the limit
+                result = platform_text.fit_to_limit(text, platform)
+            else:
+                outcomes[result.outcome] += 1
+            if measure(result.text) > limit or not result.text:
+                ok = False
+                print(f"  over limit after fitting ({platform}): {result.report()}")
+        totals += outcomes
+        totals["over"] += over
+        (m50, m99), (f50, f99) = percentiles(measure_ns), percentiles(fit_ns)
+        summary = ", ".join(f"{outcome} {count}" for outcome, count in outcomes.most_common())
+        print(f"{platform:<11}{len(texts):>8}{over:>7}{m50:>11.1f}/{m99:<9.1f}{f50:>8.1f}/{f99:<9.1f}  {summary}")
+
+    print(f"\n{totals['over']} of {len(posts)} posts were over their limit: {totals['over'] - totals['shorten_call']} fixed locally, "
+          f"{totals['shorten_call']} would need a shorten call (POSTPROCESS_MAX_TRIM_RATIO={config.POSTPROCESS_MAX_TRIM_RATIO})")
+    return ok
+
+def bench_throughput(posts: list[tuple[str, str]]):
+    start = time.perf_counter()
+    for platform, text in posts:
+        platform_text.fit_to_limit(text, platform, config.POSTPROCESS_MAX_TRIM_RATIO)
+    elapsed = time.perf_counter() - start
+    characters = sum(len(text) for _, text in posts)
+    print(f"throughput: {len(posts) / elapsed:,.0f} posts/s, {characters / elapsed / 1e6:.1f}M characters/s on one core")
+
+def bench_segmenters(posts: list[tuple[str, str]]):
+    texts = [text for _, text in posts if not text.isascii()][:5000]
+    if not texts:
+        return
+    rows = []
+    if platform_text._GRAPHEME is not None:
+        start = time.perf_counter()
+        counts = [len(platform_text._GRAPHEME.findall(text)) for text in texts]
+        rows.append(("regex \\X", time.perf_counter() - start))
+    start = time.perf_counter()
+    fallback_counts = [len(platform_text._graphemes_fallback(text)) for text in texts]
+    rows.append(("fallback", time.perf_counter() - start))
+    characters = sum(len(text) for text in texts)
+    print(f"\ngrapheme counting over {len(texts)} non-ASCII posts:")
+    for label, elapsed in rows:
+        print(f"  {label:<10}{characters / elapsed / 1e6:>8.1f}M characters/s")
+    if platform_text._GRAPHEME is not None:
+        differing = sum(a != b for a, b in zip(counts, fallback_counts))
+        print(f"  fallback count differs from regex on {differing} of {len(texts)} posts")
+    else:
+        print("  regex is not installed; only the fallback segmenter is available")
+
+def main(args):
+    posts = load_corpus(args)
+    print(f"{len(posts)} posts, {sum(len(text) for _, text in posts) / 1e6:.1f}M characters\n")
+    ok = bench_platforms(posts)
+    bench_throughput(posts)
+    bench_segmenters(posts)
+    print("\nOK" if ok else "\nFAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--corpus", help="JSON lines with 'platform' and 'text', instead of the synthetic corpus")
+    main(parser.parse_args())
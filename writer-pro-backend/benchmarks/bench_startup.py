@@ -0,0 +1,137 @@
+"""Cold start and graceful drain of the production server (server.py) against the stub OpenAI server.
+
+Usage (from writer-pro-backend): python benchmarks/bench_startup.py [--runs 5] [--workers 1,2] [--target 3.0]
+
+For each worker count it starts `python server.py` several times and reports the median time from launch
+until /healthz answers (the process serves HTTP) and until /readyz returns 200 (warm-up finished). It then
+starts a slow streamed reply, sends SIGTERM mid-stream and checks that the stream still ends with its
+`done` event and that the server exits. Exits non-zero past `--target` seconds or if the drain check fails.
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import httpx
+from stub_openai import run_stub_server
+
+STUB_PORT = 9104
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(port: int, workers: int, scratch: str, stub_url: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENAI_API_URL": stub_url,
+        "OPENAI_API_KEY": "bench",
+        "JOBS_DB_PATH": os.path.join(scratch, f"jobs-{port}.sqlite3"),
+        "INSTRUCTIONS_DB_PATH": os.path.join(scratch, f"instructions-{port}.sqlite3"),
+        "RATE_LIMIT_DB_PATH": os.path.join(scratch, f"ratelimit-{port}.sqlite3"),
+        "HISTORY_DB_PATH": os.path.join(scratch, f"history-{port}.sqlite3"),
+        "RATE_LIMIT_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    return subprocess.Popen(
+        [sys.executable, "server.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+def wait_for(url: str, started: float, timeout: float = 30.0) -> float:
+    """Seconds from `started` until `url` returns 200."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=0.5).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} did not return 200 within {timeout:.0f}s")
+
+def stop(proc: subprocess.Popen, timeout: float = 30.0) -> int:
+    proc.send_signal(signal.SIGTERM)
+    try:
+        return proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        return proc.wait()
+
+def cold_start(workers: int, runs: int, scratch: str, stub_url: str) -> tuple[float, float]:
+    healthy, ready = [], []
+    for _ in range(runs):
+        port = free_port()
+        started = time.perf_counter()
+        proc = start_server(port, workers, scratch, stub_url)
+        try:
+            healthy.append(wait_for(f"http://127.0.0.1:{port}/healthz", started))
+            ready.append(wait_for(f"http://127.0.0.1:{port}/readyz", started))
+        finally:
+            stop(proc)
+    return statistics.median(healthy), statistics.median(ready)
+
+def drain_check(workers: int, scratch: str, stub_url: str) -> bool:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    proc = start_server(port, workers, scratch, stub_url)
+    events, body = [], {"comment": "How long did the new onboarding flow take to build?", "tone": "friendly"}
+    try:
+        wait_for(f"{base}/readyz", time.perf_counter())
+
+        def stream():
+            with httpx.stream("POST", f"{base}/generate-reply/stream", json=body, timeout=30) as response:
+                for line in response.iter_lines():
+                    if line.startswith("event:"):
+                        events.append(line.split(":", 1)[1].strip())
+
+        reader = threading.Thread(target=stream)
+        reader.start()
+        time.sleep(0.5)  # Mid-stream: the stub takes a few seconds to send the whole completion
+        signalled = time.perf_counter()
+        code = stop(proc)
+        exit_seconds = time.perf_counter() - signalled
+        reader.join(30)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+    completed = "done" in events
+    # A single-process uvicorn re-raises the SIGTERM it caught once shutdown completes
+    clean = code in (0, -signal.SIGTERM)
+    print(f"drain ({workers} worker{'s' if workers > 1 else ''}): stream {'completed' if completed else 'CUT OFF'}, "
+          f"server exited {'cleanly' if clean else f'with {code}'} {exit_seconds:.2f}s after SIGTERM")
+    return completed and clean
+
+def main(args):
+    failed = False
+    with tempfile.TemporaryDirectory() as scratch, \
+            run_stub_server(STUB_PORT, STUB_LATENCY_MS=20, STUB_COMPLETION_WORDS=150, STUB_CHUNK_DELAY_MS=15) as stub_url:
+        print(f"{'workers':<10}{'healthz s':>12}{'readyz s':>12}")
+        for workers in args.workers:
+            healthy, ready = cold_start(workers, args.runs, scratch, stub_url)
+            print(f"{workers:<10}{healthy:>12.2f}{ready:>12.2f}")
+            if ready > args.target:
+                print(f"  OVER the {args.target:.1f}s target")
+                failed = True
+        print()
+        for workers in args.workers:
+            failed |= not drain_check(workers, scratch, stub_url)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=lambda value: [int(n) for n in value.split(",")], default=[1, 2])
+    parser.add_argument("--target", type=float, default=3.0, help="Seconds from launch to /readyz 200")
+    main(parser.parse_args())
@@ -0,0 +1,128 @@
+"""End-to-end check of request deadlines and client-disconnect cancellation against the stub OpenAI server.
+
+Usage (from writer-pro-backend): python benchmarks/check_cancellation.py [--clients 12] [--concurrency 2]
+
+Runs the backend under uvicorn with a small scheduler concurrency limit and a slow stub, then:
+  1. abandons many distinct blocking requests after 0.3s and checks that only the requests already holding a
+     scheduler slot reached the stub, that the queue drained and that no slot stayed taken;
+  2. abandons a streamed reply after its first delta and checks the upstream stream was cancelled in flight;
+  3. sends X-Request-Timeout: 0.5 and checks the 504 arrives near 0.5s instead of after the stub's latency.
+Prints the estimated upstream seconds and tokens saved. Exits non-zero if any scenario does not behave as expected.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import httpx
+from stub_openai import run_stub_server, run_uvicorn
+
+STUB_PORT = 9105
+BACKEND_PORT = 9106
+STUB = f"http://127.0.0.1:{STUB_PORT}"
+BACKEND = f"http://127.0.0.1:{BACKEND_PORT}"
+SLOW_MS = 2000
+
+def reply_body(i: int) -> dict:
+    # Distinct comments, so the response cache and request coalescing stay out of the way
+    return {"comment": f"Comment number {i} about shipping the release", "tone": "helpful"}
+
+async def upstream_requests(control: httpx.AsyncClient) -> int:
+    return (await control.get(f"{STUB}/stub/stats")).json()["requests"]
+
+async def scheduler_busy(control: httpx.AsyncClient) -> tuple[int, int]:
+    stats = (await control.get(f"{BACKEND}/upstream/stats")).json()["scheduler"]
+    return (sum(model["active"] for model in stats.values()),
+            sum(sum(model["queue_depth"].values()) for model in stats.values()))
+
+async def abandoned_requests(control: httpx.AsyncClient, clients: int, concurrency: int) -> bool:
+    before = await upstream_requests(control)
+
+    async def give_up(client: httpx.AsyncClient, i: int):
+        await client.post(f"{BACKEND}/generate-reply", json=reply_body(1000 + i), headers={"Cache-Control": "no-cache"})
+
+    # Every client hangs up at the same moment; per-client timeouts would spread the disconnects over tens of
+    # milliseconds, and a slot freed by an early leaver rightly goes to a waiter whose client is still there
+    async with httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_connections=clients)) as client:
+        requests = [asyncio.create_task(give_up(client, i)) for i in range(clients)]
+        await asyncio.sleep(0.3)
+        for request in requests:
+            request.cancel()  # Closing the connection is the disconnect
+        await asyncio.gather(*requests, return_exceptions=True)
+    await asyncio.sleep(SLOW_MS / 1000 + 0.5)  # Long enough for any queued call that was not cancelled to reach the stub
+    sent = await upstream_requests(control) - before
+    active, queued = await scheduler_busy(control)
+    print(f"abandoned {clients} requests: {sent} reached upstream (limit {concurrency}), active slots {active}, queued {queued}")
+    return sent <= concurrency and active == 0 and queued == 0
+
+async def abandoned_stream(control: httpx.AsyncClient) -> bool:
+    before = (await control.get(f"{BACKEND}/upstream/stats")).json()["cancellations"]["cancelled_in_flight"]
+    await control.post(f"{STUB}/stub/faults", json={"latency_ms": 50, "chunk_delay_ms": 200})
+    async with httpx.AsyncClient(timeout=10) as client:
+        async with client.stream("POST", f"{BACKEND}/generate-reply/stream", json=reply_body(2000)) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    break  # Hang up after the first delta
+    await asyncio.sleep(0.5)
+    after = (await control.get(f"{BACKEND}/upstream/stats")).json()["cancellations"]["cancelled_in_flight"]
+    active, _ = await scheduler_busy(control)
+    print(f"abandoned stream: {after - before} in-flight upstream stream(s) cancelled, active slots {active}")
+    return after - before == 1 and active == 0
+
+async def header_deadline(control: httpx.AsyncClient) -> bool:
+    await control.post(f"{STUB}/stub/faults", json={"latency_ms": SLOW_MS, "chunk_delay_ms": 0})
+    async with httpx.AsyncClient(timeout=10) as client:
+        started = time.perf_counter()
+        response = await client.post(f"{BACKEND}/generate-reply", json=reply_body(3000), headers={"X-Request-Timeout": "0.5"})
+        elapsed = time.perf_counter() - started
+    print(f"X-Request-Timeout 0.5: status {response.status_code} after {elapsed:.2f}s")
+    return response.status_code == 504 and elapsed < 1.0
+
+async def run(args) -> bool:
+    async with httpx.AsyncClient(timeout=30) as control:
+        # Warm calls give the router a latency estimate and the metrics a mean completion size to estimate savings from
+        await control.post(f"{STUB}/stub/faults", json={"latency_ms": 200, "chunk_delay_ms": 0})
+        for i in range(5):
+            (await control.post(f"{BACKEND}/generate-reply", json=reply_body(i))).raise_for_status()
+        await control.post(f"{STUB}/stub/faults", json={"latency_ms": SLOW_MS})
+
+        results = [
+            await abandoned_requests(control, args.clients, args.concurrency),
+            await abandoned_stream(control),
+            await header_deadline(control),
+        ]
+        await control.post(f"{STUB}/stub/reset")
+        stats = (await control.get(f"{BACKEND}/upstream/stats")).json()["cancellations"]
+        print(f"\nclient disconnects {stats['client_disconnects']}, cancelled queued {stats['cancelled_queued']}, "
+              f"in flight {stats['cancelled_in_flight']}")
+        print(f"estimated upstream time saved {stats['saved_upstream_seconds']}s, tokens saved {stats['saved_tokens']}")
+        return all(results)
+
+def main(args):
+    with tempfile.TemporaryDirectory() as scratch, run_stub_server(STUB_PORT) as stub_url:
+        env = {
+            "OPENAI_API_URL": stub_url,
+            "OPENAI_API_KEY": "bench",
+            "SCHEDULER_INITIAL_CONCURRENCY": args.concurrency,
+            "SCHEDULER_MAX_CONCURRENCY": args.concurrency,
+            "RATE_LIMIT_ENABLED": "false",
+            "JOBS_DB_PATH": os.path.join(scratch, "jobs.sqlite3"),
+            "INSTRUCTIONS_DB_PATH": os.path.join(scratch, "instructions.sqlite3"),
+            "HISTORY_DB_PATH": os.path.join(scratch, "history.sqlite3"),
+        }
+        with run_uvicorn("main:app", BACKEND_PORT, BACKEND_DIR, env):
+            ok = asyncio.run(run(args))
+    print("\nOK" if ok else "\nFAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=2)
+    main(parser.parse_args())
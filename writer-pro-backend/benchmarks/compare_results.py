@@ -0,0 +1,62 @@
+"""Compares two loadtest.py JSON reports and flags regressions.
+
+Usage (from writer-pro-backend): python benchmarks/compare_results.py before.json after.json [--threshold 10]
+Exits non-zero when throughput drops or p95/p99 latency grows by more than the threshold (percent).
+"""
+import argparse
+import json
+import sys
+
+def load_results(path: str) -> tuple[dict, dict]:
+    with open(path) as report_file:
+        report = json.load(report_file)
+    keyed = {(r["scenario"], r["route"], r["stream"], r["concurrency"]): r for r in report["results"]}
+    return report["meta"], keyed
+
+def change(before, after):
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent before it counts as a regression")
+    args = parser.parse_args()
+
+    before_meta, before = load_results(args.before)
+    after_meta, after = load_results(args.after)
+    print(f"before: {before_meta.get('commit')}{' (dirty)' if before_meta.get('dirty') else ''}  after: {after_meta.get('commit')}{' (dirty)' if after_meta.get('dirty') else ''}")
+    print(f"{'scenario':<10}{'route':<10}{'conc':>6}{'req/s':>26}{'p95 ms':>26}{'p99 ms':>26}")
+
+    regressions = []
+    for key in sorted(before.keys() & after.keys(), key=str):
+        old, new = before[key], after[key]
+        scenario, route, stream, concurrency = key
+        cells = []
+        # Higher is better for throughput, lower is better for latency
+        for metric, old_value, new_value, worse_if in (
+            ("req/s", old["throughput_rps"], new["throughput_rps"], -1),
+            ("p95", (old["latency_ms"] or {}).get("p95"), (new["latency_ms"] or {}).get("p95"), 1),
+            ("p99", (old["latency_ms"] or {}).get("p99"), (new["latency_ms"] or {}).get("p99"), 1),
+        ):
+            delta = change(old_value, new_value) if old_value is not None and new_value is not None else None
+            if delta is not None and delta * worse_if > args.threshold:
+                regressions.append(f"{scenario}/{route}{'/stream' if stream else ''}@{concurrency} {metric} {delta:+.1f}%")
+            cells.append(f"{old_value} -> {new_value} ({delta:+.0f}%)" if delta is not None else f"{old_value} -> {new_value}")
+        label = route + ("*" if stream else "")
+        print(f"{scenario:<10}{label:<10}{concurrency:>6}  " + "  ".join(f"{cell:>24}" for cell in cells))
+
+    missing = sorted(before.keys() ^ after.keys(), key=str)
+    if missing:
+        print(f"{len(missing)} result(s) only present in one report were skipped")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0f}%:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions beyond the threshold")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""Offline load test: runs the real backend under uvicorn against the stub OpenAI server and reports
+throughput, p50/p95/p99 latency, server event-loop lag and memory as JSON.
+
+Usage (from writer-pro-backend):
+    python benchmarks/loadtest.py [--scenarios sweep,burst,soak] [--routes outline,optimize,rewrite,reply]
+                                  [--stream] [--output results.json]
+Compare two reports with: python benchmarks/compare_results.py before.json after.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import httpx
+from stub_openai import run_stub_server, run_uvicorn
+
+INSTRUCTION = "You are a helpful writing assistant. Keep the author's voice and facts."
+PARAGRAPH = (
+    "Our team shipped a new onboarding flow this week. Sign-ups that finish setup went up, "
+    "support tickets about first steps went down, and we learned a lot about where people get stuck. "
+)
+
+# Request bodies for each route in routes/content.py; `i` keeps every body unique so nothing is served from cache
+ROUTES = {
+    "outline": ("/generate-outline", lambda i: {
+        "contentDescription": f"Run {i}: a practical guide to onboarding new users for a SaaS product",
+        "contentType": "blog post",
+        "base_system_instruction": INSTRUCTION,
+    }),
+    "optimize": ("/optimize-content", lambda i: {
+        "content": f"Update {i}. " + PARAGRAPH * 3,
+        "platform": "linkedin",
+        "base_system_instruction": INSTRUCTION,
+    }),
+    "rewrite": ("/rewrite-content", lambda i: {
+        "content": f"Draft {i}. " + PARAGRAPH * 3,
+        "style": "casual",
+        "base_system_instruction": INSTRUCTION,
+    }),
+    "reply": ("/generate-reply", lambda i: {
+        "comment": f"Comment {i}: this is great, how long did the new flow take to build?",
+        "tone": "friendly",
+    }),
+}
+
+# --- Report Helpers --- -
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def latency_summary(seconds):
+    if not seconds:
+        return None
+    return {
+        "p50": round(percentile(seconds, 50) * 1000, 2),
+        "p95": round(percentile(seconds, 95) * 1000, 2),
+        "p99": round(percentile(seconds, 99) * 1000, 2),
+        "max": round(max(seconds) * 1000, 2),
+        "mean": round(sum(seconds) / len(seconds) * 1000, 2),
+    }
+
+METRIC_LINE = re.compile(r'^(?P<name>[a-z_]+)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+
+def parse_server_metrics(text: str) -> dict:
+    """Pulls the event-loop lag histogram and resident memory out of the /metrics exposition."""
+    lag_buckets, lag_sum, lag_count, rss = {}, 0.0, 0, None
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match["name"], match["labels"] or "", float(match["value"])
+        if name == "writer_pro_event_loop_lag_seconds_bucket":
+            lag_buckets[float(labels.split('"')[1].replace("+Inf", "inf"))] = value
+        elif name == "writer_pro_event_loop_lag_seconds_sum":
+            lag_sum = value
+        elif name == "writer_pro_event_loop_lag_seconds_count":
+            lag_count = value
+        elif name == "process_resident_memory_bytes":
+            rss = value
+    return {"lag_buckets": lag_buckets, "lag_sum": lag_sum, "lag_count": lag_count, "rss": rss}
+
+def histogram_quantile(q: float, buckets: dict):
+    """Same estimate as PromQL histogram_quantile: linear interpolation inside the bucket holding the quantile."""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]] if bounds else 0
+    if not total:
+        return 0.0
+    rank = q * total
+    lower_bound, lower_count = 0.0, 0.0
+    for bound in bounds:
+        if buckets[bound] >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / max(buckets[bound] - lower_count, 1e-9)
+        lower_bound, lower_count = bound, buckets[bound]
+    return lower_bound
+
+def loop_lag_summary(before: dict, after: dict):
+    buckets = {bound: after["lag_buckets"][bound] - before["lag_buckets"].get(bound, 0) for bound in after["lag_buckets"]}
+    count = after["lag_count"] - before["lag_count"]
+    return {
+        "samples": int(count),
+        "mean": round((after["lag_sum"] - before["lag_sum"]) / count * 1000, 3) if count else 0.0,
+        "p99": round(histogram_quantile(0.99, buckets) * 1000, 3),
+    }
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+# --- Load Generation --- -
+class Target:
+    def __init__(self, base_url: str, stream: bool):
+        self.base_url = base_url
+        self.stream = stream
+        self.ids = itertools.count()
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(120.0),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=None),
+        )
+
+    async def scrape(self) -> dict:
+        response = await self.client.get("/metrics")
+        return parse_server_metrics(response.text)
+
+    async def request(self, route: str):
+        """One request; returns (status, total seconds, seconds to first body byte)."""
+        path, body = ROUTES[route]
+        payload = body(next(self.ids))
+        start = time.perf_counter()
+        try:
+            if not self.stream:
+                response = await self.client.post(path, json=payload)
+                return response.status_code, time.perf_counter() - start, None
+            ttfb = None
+            status = None
+            async with self.client.stream("POST", f"{path}/stream", json=payload) as response:
+                status = response.status_code
+                async for line in response.aiter_lines():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start
+                    if line.startswith("event: error"):
+                        status = "stream_error"
+            return status, time.perf_counter() - start, ttfb
+        except httpx.HTTPError as e:
+            return type(e).__name__, time.perf_counter() - start, None
+
+    async def run(self, routes: list, concurrency: int, total: int | None = None, duration: float | None = None):
+        """Runs `total` requests (or as many as fit in `duration` seconds) with `concurrency` in flight."""
+        samples = []
+        route_cycle = itertools.cycle(routes)
+        deadline = time.perf_counter() + duration if duration else None
+        remaining = itertools.count() if total is None else iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                route = next(route_cycle)
+                samples.append((route, *await self.request(route)))
+
+        peak_rss = 0
+        async def sample_memory():
+            nonlocal peak_rss
+            while True:
+                rss = (await self.scrape())["rss"] or 0
+                peak_rss = max(peak_rss, rss)
+                await asyncio.sleep(1.0)
+
+        before = await self.scrape()
+        sampler = asyncio.create_task(sample_memory())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+        after = await self.scrape()
+        return samples, elapsed, before, after, max(peak_rss, after["rss"] or 0)
+
+def summarize(scenario: str, route: str, stream: bool, concurrency: int, samples, elapsed, before, after, peak_rss):
+    ok = [latency for _, status, latency, _ in samples if status == 200]
+    ttfb = [first for _, status, _, first in samples if status == 200 and first is not None]
+    errors = {}
+    for _, status, _, _ in samples:
+        if status != 200:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    mb = 1024 * 1024
+    return {
+        "scenario": scenario,
+        "route": route,
+        "stream": stream,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary(ok),
+        "ttfb_ms": latency_summary(ttfb) if stream else None,
+        "event_loop_lag_ms": loop_lag_summary(before, after),
+        "memory_mb": {
+            "start": round((before["rss"] or 0) / mb, 1),
+            "end": round((after["rss"] or 0) / mb, 1),
+            "peak": round(peak_rss / mb, 1),
+        },
+    }
+
+# --- Scenarios --- -
+async def sweep(target: Target, args):
+    results = []
+    for route in args.routes:
+        for concurrency in args.concurrency:
+            await target.run([route], min(concurrency, 4), total=min(concurrency, 4) * 2)  # Warm connections
+            run = await target.run([route], concurrency, total=max(args.requests, concurrency))
+            results.append(summarize("sweep", route, target.stream, concurrency, *run))
+    return results
+
+async def burst(target: Target, args):
+    results = []
+    for route in args.routes:
+        # Every request arrives at once after an idle period, like a client fan-out or a retry storm
+        await asyncio.sleep(1.0)
+        run = await target.run([route], args.burst, total=args.burst)
+        results.append(summarize("burst", route, target.stream, args.burst, *run))
+    return results
+
+async def soak(target: Target, args):
+    # Mixed traffic for a sustained period; memory start/end/peak shows leaks and unbounded caches
+    run = await target.run(args.routes, args.soak_concurrency, duration=args.soak_seconds)
+    return [summarize("soak", "mixed", target.stream, args.soak_concurrency, *run)]
+
+SCENARIOS = {"sweep": sweep, "burst": burst, "soak": soak}
+
+def print_table(results):
+    header = f"{'scenario':<10}{'route':<10}{'conc':>6}{'reqs':>7}{'err%':>7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'lag p99':>9}{'rss MB':>8}"
+    print(header)
+    for r in results:
+        latency = r["latency_ms"] or {"p50": 0, "p95": 0, "p99": 0}
+        print(
+            f"{r['scenario']:<10}{r['route']:<10}{r['concurrency']:>6}{r['requests']:>7}{r['error_rate'] * 100:>7.1f}"
+            f"{r['throughput_rps']:>9.1f}{latency['p50']:>9.1f}{latency['p95']:>9.1f}{latency['p99']:>9.1f}"
+            f"{r['event_loop_lag_ms']['p99']:>9.2f}{r['memory_mb']['peak']:>8.1f}"
+        )
+
+async def main(args, app_url: str, stub_settings: dict):
+    target = Target(app_url, args.stream)
+    results = []
+    try:
+        for name in args.scenarios:
+            results.extend(await SCENARIOS[name](target, args))
+    finally:
+        await target.client.aclose()
+
+    commit, dirty = git_revision()
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "stub": stub_settings,
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "results": results,
+    }
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+def csv_list(value: str):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=csv_list, default=["sweep", "burst", "soak"])
+    parser.add_argument("--routes", type=csv_list, default=list(ROUTES))
+    parser.add_argument("--stream", action="store_true", help="Use the /stream variant of each route")
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in csv_list(v)], default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per sweep level")
+    parser.add_argument("--burst", type=int, default=200)
+    parser.add_argument("--soak-seconds", type=float, default=30)
+    parser.add_argument("--soak-concurrency", type=int, default=32)
+    parser.add_argument("--latency-dist", default="lognormal", choices=["fixed", "uniform", "normal", "lognormal", "exponential"])
+    parser.add_argument("--latency-ms", type=float, default=200, help="Stub mean latency (median for lognormal)")
+    parser.add_argument("--latency-jitter-ms", type=float, default=50)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--completion-words", type=int, default=120)
+    parser.add_argument("--chunk-delay-ms", type=float, default=2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--respect-limits", action="store_true", help="Keep the scheduler's production rate budgets and the per-caller rate limiter")
+    parser.add_argument("--stub-port", type=int, default=9120)
+    parser.add_argument("--app-port", type=int, default=9121)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS] + [name for name in args.routes if name not in ROUTES]
+    if unknown:
+        parser.error(f"Unknown scenario or route: {', '.join(unknown)}")
+
+    stub_settings = {
+        "STUB_LATENCY_DIST": args.latency_dist,
+        "STUB_LATENCY_MS": args.latency_ms,
+        "STUB_LATENCY_JITTER_MS": args.latency_jitter_ms,
+        "STUB_LATENCY_SIGMA": args.latency_sigma,
+        "STUB_COMPLETION_WORDS": args.completion_words,
+        "STUB_CHUNK_DELAY_MS": args.chunk_delay_ms,
+        "STUB_ERROR_RATE": args.error_rate,
+        "STUB_RATE_LIMIT_RATE": args.rate_limit_rate,
+    }
+    with tempfile.TemporaryDirectory() as scratch, run_stub_server(args.stub_port, **stub_settings) as stub_url:
+        app_env = {
+            "OPENAI_API_URL": stub_url,
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-loadtest"),
+            "JOBS_DB_PATH": os.path.join(scratch, "jobs.sqlite3"),
+            "INSTRUCTIONS_DB_PATH": os.path.join(scratch, "instructions.sqlite3"),
+            "HISTORY_DB_PATH": os.path.join(scratch, "history.sqlite3"),
+            "LOG_LEVEL": "WARNING",
+        }
+        if not args.respect_limits:
+            # Measure the backend itself rather than the production requests/min and tokens/min budgets
+            top = max(args.concurrency + [args.burst, args.soak_concurrency])
+            app_env.update({
+                "RATE_LIMIT_ENABLED": "false",
+                "SCHEDULER_REQUESTS_PER_MINUTE": "10000000",
+                "SCHEDULER_TOKENS_PER_MINUTE": "10000000000",
+                "SCHEDULER_INITIAL_CONCURRENCY": str(top),
+                "SCHEDULER_MAX_CONCURRENCY": str(top),
+                "HTTP_MAX_CONNECTIONS": str(top),
+                "HTTP_MAX_KEEPALIVE_CONNECTIONS": str(top),
+            })
+        with run_uvicorn("main:app", args.app_port, BACKEND_DIR, app_env):
+            asyncio.run(main(args, f"http://127.0.0.1:{args.app_port}", stub_settings))
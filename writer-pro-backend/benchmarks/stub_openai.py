@@ -0,0 +1,179 @@
+"""Local stand-in for the OpenAI chat completions API, used by the benchmark scripts.
+
+Run directly with: uvicorn stub_openai:app --port 9100 (from this directory)
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Fault injection and latency shape, adjustable at runtime through POST /stub/faults
+faults = {
+    "latency_ms": float(os.getenv("STUB_LATENCY_MS", "50")),  # Mean (median for lognormal) time before the response starts
+    "latency_dist": os.getenv("STUB_LATENCY_DIST", "fixed"),  # fixed, uniform, normal, lognormal or exponential
+    "latency_jitter_ms": float(os.getenv("STUB_LATENCY_JITTER_MS", "0")),  # Half-width (uniform) or std dev (normal)
+    "latency_sigma": float(os.getenv("STUB_LATENCY_SIGMA", "0.5")),  # Shape of the lognormal tail
+    "chunk_delay_ms": float(os.getenv("STUB_CHUNK_DELAY_MS", "5")),  # Gap between streamed chunks
+    "completion_words": int(os.getenv("STUB_COMPLETION_WORDS", "0")),  # 0 echoes the prompt start instead
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),  # Fraction of calls answered with error_status
+    "error_status": int(os.getenv("STUB_ERROR_STATUS", "500")),
+    "rate_limit_rate": float(os.getenv("STUB_RATE_LIMIT_RATE", "0")),  # Fraction answered with a 429
+    "retry_after": os.getenv("STUB_RETRY_AFTER", "1"),
+    "slow_rate": float(os.getenv("STUB_SLOW_RATE", "0")),  # Fraction of calls that take slow_ms instead
+    "slow_ms": float(os.getenv("STUB_SLOW_MS", "2000")),
+}
+LOREM = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+counters = {"requests": 0, "errors": 0, "rate_limited": 0, "slow": 0, "streams": 0}
+
+app = FastAPI()
+
+@app.post("/stub/faults")
+async def set_faults(request: Request):
+    faults.update(await request.json())
+    return faults
+
+@app.get("/stub/stats")
+async def stub_stats():
+    return counters
+
+@app.post("/stub/reset")
+async def reset_stats():
+    for key in counters:
+        counters[key] = 0
+    seen_prefixes.clear()
+    return counters
+
+def sample_latency_ms() -> float:
+    mean = faults["latency_ms"]
+    dist = faults["latency_dist"]
+    if dist == "uniform":
+        return random.uniform(max(0.0, mean - faults["latency_jitter_ms"]), mean + faults["latency_jitter_ms"])
+    if dist == "normal":
+        return max(0.0, random.gauss(mean, faults["latency_jitter_ms"]))
+    if dist == "lognormal":
+        return random.lognormvariate(math.log(mean), faults["latency_sigma"]) if mean > 0 else 0.0
+    if dist == "exponential":
+        return random.expovariate(1 / mean) if mean > 0 else 0.0
+    return mean
+
+def completion_text(body: dict) -> str:
+    words = faults["completion_words"]
+    if words:
+        return " ".join(LOREM[i % len(LOREM)] for i in range(words))
+    return "Stub completion for: " + body["messages"][-1]["content"][:80]
+
+# System messages seen so far, to mimic OpenAI's prompt cache
+seen_prefixes: set[str] = set()
+
+def usage_for(body: dict, text: str) -> dict:
+    # Roughly 4 characters per token, the same ratio OpenAI documents for English text
+    messages = body.get("messages", [])
+    prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 4 + 1
+    completion_tokens = len(text) // 4 + 1
+    # A repeated system message of 1024+ tokens counts as cached, in 128-token increments like the real API
+    cached_tokens = 0
+    if messages and messages[0].get("role") == "system":
+        prefix = messages[0].get("content") or ""
+        prefix_tokens = len(prefix) // 4
+        if prefix_tokens >= 1024 and prefix in seen_prefixes:
+            cached_tokens = prefix_tokens // 128 * 128
+        seen_prefixes.add(prefix)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+@app.get("/v1/models")
+async def list_models():
+    # The backend's warm-up opens its upstream connections with this request
+    return {"object": "list", "data": [{"id": "stub", "object": "model"}]}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    counters["requests"] += 1
+    roll = random.random()
+    if roll < faults["error_rate"]:
+        counters["errors"] += 1
+        return JSONResponse({"error": {"message": "Injected server error", "type": "server_error"}}, status_code=faults["error_status"])
+    if roll < faults["error_rate"] + faults["rate_limit_rate"]:
+        counters["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"message": "Injected rate limit", "type": "rate_limit_error"}},
+            status_code=429,
+            headers={"Retry-After": str(faults["retry_after"])},
+        )
+    latency_ms = sample_latency_ms()
+    if random.random() < faults["slow_rate"]:
+        counters["slow"] += 1
+        latency_ms = faults["slow_ms"]
+    await asyncio.sleep(latency_ms / 1000)
+    text = completion_text(body)
+    if body.get("stream"):
+        counters["streams"] += 1
+        return StreamingResponse(stream_chunks(body, text), media_type="text/event-stream")
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": usage_for(body, text),
+    }
+
+async def stream_chunks(body: dict, text: str):
+    for word in text.split(" "):
+        chunk = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(faults["chunk_delay_ms"] / 1000)
+    if (body.get("stream_options") or {}).get("include_usage"):
+        chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "model": body.get("model"), "choices": [], "usage": usage_for(body, text)}
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+def _wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Stub server did not start on port {port}")
+
+@contextmanager
+def run_uvicorn(app: str, port: int, cwd: str, env: dict | None = None, extra_args: tuple = ()):
+    """Starts `app` under uvicorn in a separate process and yields the process once the port accepts connections."""
+    proc_env = {**os.environ, **{key: str(value) for key, value in (env or {}).items()}}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning", *extra_args],
+        cwd=cwd,
+        env=proc_env,
+    )
+    try:
+        _wait_for_port(port)
+        yield proc
+    finally:
+        proc.terminate()
+        proc.wait()
+
+@contextmanager
+def run_stub_server(port: int = 9100, **env):
+    """Starts the stub in a separate process and yields its chat completions URL."""
+    with run_uvicorn("stub_openai:app", port, os.path.dirname(os.path.abspath(__file__)), env):
+        yield f"http://127.0.0.1:{port}/v1/chat/completions"
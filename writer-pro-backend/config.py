@@ -11,9 +11,38 @@ CORS_ORIGINS = [origin.strip() for origin in cors_origins_str.split(",")]
 
 # OpenAI API Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
 
-# Model Configuration
+# Shared HTTP client configuration (one pooled client for the app lifetime)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "10"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+
+# Production server (server.py): worker processes, warm-up and graceful drain
+SERVER_HOST = os.getenv("HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("WEB_CONCURRENCY", "0"))  # 0 = one per available CPU, up to SERVER_MAX_WORKERS
+SERVER_MAX_WORKERS = int(os.getenv("SERVER_MAX_WORKERS", "8"))
+SERVER_LOOP = os.getenv("SERVER_LOOP", "auto")  # auto uses uvloop when installed
+SERVER_HTTP = os.getenv("SERVER_HTTP", "auto")  # auto uses httptools when installed
+SERVER_KEEPALIVE_SECONDS = int(os.getenv("SERVER_KEEPALIVE_SECONDS", "5"))
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "2"))  # Upstream connections opened per provider before /readyz passes
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "5"))
+DRAIN_DELAY_SECONDS = float(os.getenv("DRAIN_DELAY_SECONDS", "0"))  # Keep serving after SIGTERM while /readyz fails, so load balancers stop routing here first
+
+# Logging and metrics
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "%(asctime)s %(levelname)s [%(name)s] %(message)s")
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.1"))  # Seconds between event-loop lag samples
+
+# Model Configuration (the preferred model per request type)
 MODELS = {
     "outline": "gpt-4o-search-preview",
     "optimize": "gpt-4.5-preview",
@@ -21,6 +50,164 @@ MODELS = {
     "reply": "gpt-4.5-preview"
 }
 
+# Model routing across OpenAI-compatible providers. A model is named "model" (the OpenAI provider) or "provider:model"
+PROVIDERS = {"openai": {"url": OPENAI_API_URL, "api_key": OPENAI_API_KEY}}
+# Extra providers as "name=url,name=url"; each reads its key from PROVIDER_<NAME>_API_KEY
+for provider_spec in filter(None, os.getenv("PROVIDER_URLS", "").split(",")):
+    provider_name, provider_url = (part.strip() for part in provider_spec.split("=", 1))
+    PROVIDERS[provider_name] = {"url": provider_url, "api_key": os.getenv(f"PROVIDER_{provider_name.upper()}_API_KEY")}
+# Fallback models per request type, tried after MODELS[request_type] (e.g. MODEL_FALLBACKS_REPLY=gpt-4o,backup:gpt-4o)
+MODEL_CANDIDATES = {
+    request_type: [model] + [name.strip() for name in os.getenv(f"MODEL_FALLBACKS_{request_type.upper()}", "").split(",") if name.strip()]
+    for request_type, model in MODELS.items()
+}
+# Optional self-hosted OpenAI-compatible server (llama.cpp, vLLM, Ollama) used as the last resort for every request type
+LOCAL_MODEL_URL = os.getenv("LOCAL_MODEL_URL")  # e.g. http://localhost:11434/v1/chat/completions
+LOCAL_MODEL = os.getenv("LOCAL_MODEL", "llama3.1")
+if LOCAL_MODEL_URL:
+    PROVIDERS["local"] = {"url": LOCAL_MODEL_URL, "api_key": os.getenv("LOCAL_MODEL_API_KEY")}
+    for candidates in MODEL_CANDIDATES.values():
+        candidates.append(f"local:{LOCAL_MODEL}")
+# Cheap/fast model tried first for short inputs (Twitter-length optimizes, replies); unset disables the tier
+FAST_TIER_MODEL = os.getenv("FAST_TIER_MODEL")  # e.g. gpt-4o-mini
+FAST_TIER_REQUEST_TYPES = os.getenv("FAST_TIER_REQUEST_TYPES", "optimize,reply").split(",")
+FAST_TIER_MAX_INPUT_TOKENS = int(os.getenv("FAST_TIER_MAX_INPUT_TOKENS", "400"))  # User prompt only, not the system instruction
+FAST_TIER_MAX_COMPLETION_TOKENS = int(os.getenv("FAST_TIER_MAX_COMPLETION_TOKENS", "512"))
+# USD per million (input, output) tokens, for the router's cost term
+MODEL_COSTS = {
+    "gpt-4.5-preview": (75.0, 150.0),
+    "gpt-4o-search-preview": (2.5, 10.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))  # Below this a candidate keeps its configured position
+ROUTER_ERROR_PENALTY_SECONDS = float(os.getenv("ROUTER_ERROR_PENALTY_SECONDS", "30"))  # Score added at a 100% error rate
+ROUTER_COST_WEIGHT = float(os.getenv("ROUTER_COST_WEIGHT", "10"))  # Seconds of latency worth one dollar of estimated cost
+ROUTER_ORDER_BIAS_SECONDS = float(os.getenv("ROUTER_ORDER_BIAS_SECONDS", "2"))  # Per position, so later candidates must be clearly better
+ROUTER_EXPLORE_RATIO = float(os.getenv("ROUTER_EXPLORE_RATIO", "0.02"))  # Share of calls sent to a non-best candidate to refresh its stats
+ROUTER_ATTEMPTS_BEFORE_FAILOVER = int(os.getenv("ROUTER_ATTEMPTS_BEFORE_FAILOVER", "1"))  # The last candidate gets RETRY_MAX_ATTEMPTS
+
+# JSON backend for upstream bodies and API responses: auto picks orjson, then msgspec, then the json module
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto").lower()
+
+# Token budgeting: pre-flight counting, completion size and chunking of oversized input
+TOKENIZER_ENCODING = "o200k_base"
+# Directory holding the tokenizer vocabulary so counting works offline (tiktoken's cache layout)
+TOKENIZER_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tiktoken"))
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "2048"))
+DEFAULT_MAX_TOKENS = 2048
+MAX_COMPLETION_TOKENS = int(os.getenv("MAX_COMPLETION_TOKENS", "4096"))
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o-search-preview": 128000,
+    "gpt-4.5-preview": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    f"local:{LOCAL_MODEL}": int(os.getenv("LOCAL_MODEL_CONTEXT_TOKENS", "8192")),
+}
+CHUNK_INPUT_TOKENS = int(os.getenv("CHUNK_INPUT_TOKENS", "3000"))  # Content above this is split and processed per chunk
+CHUNK_MAX_CONCURRENCY = int(os.getenv("CHUNK_MAX_CONCURRENCY", "4"))
+
+# Response cache configuration
+# Request types (keys of MODELS) whose responses may be served from the cache
+cache_request_types_str = os.getenv("CACHE_REQUEST_TYPES", "optimize,rewrite,reply")
+CACHE_ENABLED = {request_type: request_type in cache_request_types_str.split(",") for request_type in MODELS}
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "3600"))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH")  # Optional on-disk tier that survives restarts
+CACHE_BYPASS_HEADER = "X-Cache-Bypass"
+
+# Upstream scheduler configuration (applied per model)
+SCHEDULER_MIN_CONCURRENCY = int(os.getenv("SCHEDULER_MIN_CONCURRENCY", "1"))
+SCHEDULER_INITIAL_CONCURRENCY = int(os.getenv("SCHEDULER_INITIAL_CONCURRENCY", "8"))
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "32"))
+SCHEDULER_REQUESTS_PER_MINUTE = int(os.getenv("SCHEDULER_REQUESTS_PER_MINUTE", "500"))
+SCHEDULER_TOKENS_PER_MINUTE = int(os.getenv("SCHEDULER_TOKENS_PER_MINUTE", "150000"))
+SCHEDULER_DEFAULT_RETRY_AFTER = float(os.getenv("SCHEDULER_DEFAULT_RETRY_AFTER", "1"))
+
+# Resilience configuration: retries, hedged requests and per-model circuit breakers
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+# Per request type, covering queueing, retries and the upstream call (streams included); REQUEST_DEADLINE_<TYPE>_SECONDS overrides
+REQUEST_DEADLINES = {
+    request_type: float(os.getenv(f"REQUEST_DEADLINE_{request_type.upper()}_SECONDS", "30" if request_type == "reply" else str(REQUEST_DEADLINE_SECONDS)))
+    for request_type in MODELS
+}
+# Request type whose budget bounds a whole request to each route (stream variants included); /batch gets the longest
+ROUTE_REQUEST_TYPES = {"/generate-outline": "outline", "/optimize-content": "optimize", "/rewrite-content": "rewrite", "/generate-reply": "reply"}
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"  # Seconds a client is willing to wait; replaces the per-type deadline for that request
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "120"))  # Upper bound for the header
+REQUEST_DEADLINE_MIN_SECONDS = float(os.getenv("REQUEST_DEADLINE_MIN_SECONDS", "0.25"))  # Lower bound, so a near-zero budget never reaches the scheduler
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.25"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "4"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))  # Max hedged calls as a fraction of all attempts
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# Shutdown waits this long for in-flight requests (streams, long outlines) and running jobs; covers the longest request deadline
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", str(max(REQUEST_DEADLINES.values()) + 5)))
+
+# Batch endpoint limits
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "20"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+# Background job queue (long outline generations); the SQLite store is shared by all worker processes
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Concurrent jobs per server process
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "86400"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "120"))  # Requeue running jobs whose worker stopped heartbeating
+
+# Registered system instructions (POST /instructions), referenced by hash; the SQLite store is shared by all worker processes
+INSTRUCTIONS_DB_PATH = os.getenv("INSTRUCTIONS_DB_PATH", "instructions.sqlite3")
+INSTRUCTIONS_MEMORY_ENTRIES = int(os.getenv("INSTRUCTIONS_MEMORY_ENTRIES", "1024"))
+INSTRUCTION_MAX_CHARACTERS = int(os.getenv("INSTRUCTION_MAX_CHARACTERS", "100000"))
+PROMPT_CACHE_MIN_TOKENS = 1024  # OpenAI only caches prompt prefixes of at least this many tokens
+
+# Generation history (GET /history); written in batches in the background, shared by all worker processes
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() == "true"
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "history.sqlite3")
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))  # Seconds between batched writes
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "200"))  # Write sooner once this many records are waiting
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "10000"))  # Oldest unwritten records are dropped past this
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "90"))  # 0 keeps everything
+HISTORY_CACHE_LOOKUP = os.getenv("HISTORY_CACHE_LOOKUP", "true").lower() == "true"  # Serve cache misses from recent history
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "100"))
+
+# Per-caller rate limiting: callers are a known API key (X-API-Key header) or else the client address, which
+# uvicorn takes from X-Forwarded-For only when the connecting proxy is listed in FORWARDED_ALLOW_IPS
+RATE_LIMIT_API_KEYS = [key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()]
+CLIENT_ADDRESSES_FORWARDED = "FORWARDED_ALLOW_IPS" in os.environ
+# "auto" only enforces limits once callers can be told apart; behind a proxy they would otherwise share one address
+RATE_LIMIT_MODE = os.getenv("RATE_LIMIT_ENABLED", "auto").lower()
+RATE_LIMIT_ENABLED = RATE_LIMIT_MODE == "true" or (RATE_LIMIT_MODE == "auto" and bool(RATE_LIMIT_API_KEYS or CLIENT_ADDRESSES_FORWARDED))
+RATE_LIMIT_WINDOW_SECONDS = float(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "60"))  # Per caller and endpoint per window
+# Tighter limits for endpoints that start long or fanned-out generations
+RATE_LIMIT_ENDPOINT_REQUESTS = {
+    "/generate-outline": int(os.getenv("RATE_LIMIT_OUTLINE_REQUESTS", "20")),
+    "/generate-outline/stream": int(os.getenv("RATE_LIMIT_OUTLINE_REQUESTS", "20")),
+    "/jobs/generate-outline": int(os.getenv("RATE_LIMIT_OUTLINE_REQUESTS", "20")),
+    "/batch": int(os.getenv("RATE_LIMIT_BATCH_REQUESTS", "10")),
+}
+TOKEN_QUOTA = int(os.getenv("TOKEN_QUOTA", "500000"))  # Upstream tokens per caller per quota window; 0 disables
+TOKEN_QUOTA_WINDOW_SECONDS = float(os.getenv("TOKEN_QUOTA_WINDOW_SECONDS", "3600"))
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH")  # Share counters between uvicorn workers through this SQLite file
+RATE_LIMIT_SYNC_INTERVAL = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "0.25"))  # Seconds between syncs with the shared store
+
+# Lower value = scheduled first; interactive replies go ahead of long outlines
+REQUEST_PRIORITIES = {
+    "reply": 0,
+    "optimize": 1,
+    "rewrite": 1,
+    "outline": 2
+}
+
 # Platform character limits
 PLATFORM_LIMITS = {
     "twitter": 280,
@@ -28,4 +215,12 @@ PLATFORM_LIMITS = {
     "instagram": 2200,
     "blog": 10000,
     "default": 5000
-} 
\ No newline at end of file
+}
+# Platforms that render markdown; elsewhere it is converted to plain text before length checks
+PLATFORMS_WITH_MARKDOWN = {"blog"}
+TWITTER_URL_LENGTH = 23  # Every link counts as this many characters once t.co shortens it
+
+# Optimize output post-processing: normalise per platform, then trim to the platform limit locally
+POSTPROCESS_ENABLED = os.getenv("POSTPROCESS_ENABLED", "true").lower() == "true"
+POSTPROCESS_MAX_TRIM_RATIO = float(os.getenv("POSTPROCESS_MAX_TRIM_RATIO", "0.25"))  # Cutting more of the text than this asks the model to shorten instead
+POSTPROCESS_SHORTEN_WITH_MODEL = os.getenv("POSTPROCESS_SHORTEN_WITH_MODEL", "true").lower() == "true"
@@ -0,0 +1,11 @@
+import asyncio
+import pytest
+
+@pytest.fixture
+def settle():
+    """Returns a coroutine that yields to the event loop a few times, so tasks just created reach their first await."""
+    async def settle():
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    return settle
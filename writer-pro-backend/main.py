@@ -1,16 +1,100 @@
-import os
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-import config
-from routes import content, root
+import config  # Loads .env
+from routes import batch, content, health, history, instructions, jobs, root
+from services.cache import response_cache
+from services.deadlines import DeadlineMiddleware
+from services.history import generation_history
+from services.http_client import create_http_client
+from services.instructions import InstructionStore
+from services.jobs import JobStore, JobWorkerPool
+from services.jsoncodec import JSON_BACKEND, FastJSONResponse
+from services.lifecycle import InFlightMiddleware, lifecycle, warm_up
+from services.log import configure_logging
+from services.metrics import MetricsMiddleware, monitor_event_loop_lag
+from services.ratelimit import CallerMiddleware, RateLimitMiddleware, rate_limiter
 
-load_dotenv()  # Load environment variables from .env file
-print("[STARTUP] Writer Pro Backend starting...")
-print(f"[STARTUP] OpenAI API Key present: {bool(config.OPENAI_API_KEY)}")
+configure_logging()
+logger = logging.getLogger("startup")
 
-app = FastAPI()
+def log_settings():
+    logger.info("Writer Pro Backend starting...")
+    logger.info("OpenAI API Key present: %s", bool(config.OPENAI_API_KEY))
+    logger.info("JSON backend: %s", JSON_BACKEND)
+    logger.info("CORS configured for origins: %s", config.CORS_ORIGINS)
+    if config.RATE_LIMIT_ENABLED:
+        logger.info("Rate limiting: %d requests/%.0fs per endpoint, %d tokens/%.0fs per caller%s", config.RATE_LIMIT_REQUESTS,
+                    config.RATE_LIMIT_WINDOW_SECONDS, config.TOKEN_QUOTA, config.TOKEN_QUOTA_WINDOW_SECONDS,
+                    " (shared across workers)" if rate_limiter.shared else "")
+        if not config.RATE_LIMIT_API_KEYS and not config.CLIENT_ADDRESSES_FORWARDED:
+            logger.warning("Rate limiting keys callers on the connecting address; behind a proxy every user shares one limit "
+                           "unless FORWARDED_ALLOW_IPS names the proxy")
+    elif config.RATE_LIMIT_MODE == "auto":
+        logger.info("Rate limiting off: set RATE_LIMIT_API_KEYS, or FORWARDED_ALLOW_IPS behind a proxy, to turn it on")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_settings()
+    lifecycle.reset()
+    # One pooled upstream client for the whole app lifetime, so connections are reused across requests
+    app.state.http_client = create_http_client()
+    logger.info("Upstream HTTP client ready (max_connections=%d, http2=%s)", config.HTTP_MAX_CONNECTIONS, config.HTTP2_ENABLED)
+    # Background outline jobs; every worker process polls the same SQLite store
+    app.state.job_store = JobStore(config.JOBS_DB_PATH)
+    job_workers = JobWorkerPool(app.state.job_store, app.state.http_client, config.JOB_WORKERS)
+    job_workers.start()
+    # Registered system instructions, shared by hash across worker processes
+    app.state.instruction_store = InstructionStore(config.INSTRUCTIONS_DB_PATH, config.INSTRUCTIONS_MEMORY_ENTRIES)
+    # Generation history, written in batches off the request path; recent entries also answer response cache misses
+    history_flush = None
+    if config.HISTORY_ENABLED:
+        generation_history.open(config.HISTORY_DB_PATH)
+        history_flush = asyncio.create_task(generation_history.flush_forever(config.HISTORY_FLUSH_INTERVAL))
+        if config.HISTORY_CACHE_LOOKUP:
+            response_cache.attach_history(generation_history)
+    loop_monitor = asyncio.create_task(monitor_event_loop_lag(config.EVENT_LOOP_LAG_INTERVAL)) if config.METRICS_ENABLED else None
+    # Exchanges rate limit counts with the other worker processes (when shared) and drops idle callers
+    limit_sync = asyncio.create_task(rate_limiter.sync_forever(config.RATE_LIMIT_SYNC_INTERVAL)) if config.RATE_LIMIT_ENABLED else None
+    # Requests are served straight away; /readyz waits until DNS, upstream connections and the tokenizer are warm
+    warm = asyncio.create_task(warm_up(app.state.http_client))
+    lifecycle.on_drain(job_workers.drain)
+    lifecycle.install_drain_handler(config.DRAIN_DELAY_SECONDS)
+    yield
+    # The server has already waited for in-flight requests; running jobs get what is left of the grace period
+    drain_started = time.monotonic()
+    lifecycle.begin_drain()
+    warm.cancel()
+    await job_workers.stop(max(0.0, config.SHUTDOWN_GRACE_SECONDS - (drain_started - lifecycle.drain_started)))
+    if loop_monitor is not None:
+        loop_monitor.cancel()
+    if limit_sync is not None:
+        limit_sync.cancel()
+        await rate_limiter.sync()
+    if history_flush is not None:
+        history_flush.cancel()
+    await generation_history.close()
+    rate_limiter.close()
+    app.state.job_store.close()
+    app.state.instruction_store.close()
+    await app.state.http_client.aclose()
+    response_cache.close()
+    logger.info("Upstream HTTP client closed")
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 #version check = v1
+# --- Request Deadlines and Disconnect Cancellation --- - Innermost, so a rejected request never starts a watcher
+app.add_middleware(DeadlineMiddleware)
+
+# --- Per-Caller Rate Limiting --- - Added before CORS so rejections still carry CORS headers
+if config.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+# Names the caller for the limiter, token charging and generation history, so it is mounted either way
+app.add_middleware(CallerMiddleware)
+
 # --- CORS Configuration --- - Allow requests from React frontend
 app.add_middleware(
     CORSMiddleware,
@@ -19,15 +103,23 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all methods
     allow_headers=["*"],  # Allow all headers
 )
-print(f"[STARTUP] CORS configured for origins: {config.CORS_ORIGINS}")
+
+# Per-request timings and status counts for /metrics; added after CORS so it wraps CORS handling too
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Outermost: counts every request still being served, for /readyz and drain logging
+app.add_middleware(InFlightMiddleware)
 
 # --- Include Routers --- -
 app.include_router(content.router)
+app.include_router(batch.router)
+app.include_router(jobs.router)
+app.include_router(instructions.router)
+app.include_router(history.router)
 app.include_router(root.router)
-
-# Print startup message
-print("[STARTUP] FastAPI application ready to accept requests")
-print("-" * 50)
+app.include_router(health.router)
 
 # --- Run Command (for reference) --- -
-# uvicorn main:app --reload --port 8000 
\ No newline at end of file
+# Development: uvicorn main:app --reload --port 8000
+# Production:  python server.py 
\ No newline at end of file
@@ -1,24 +1,62 @@
-from pydantic import BaseModel
+from typing import Literal
+from pydantic import BaseModel, model_validator
 
-class OutlineRequest(BaseModel):
+class InstructionRequired(BaseModel):
+    """Mixin: the system instruction may be sent inline or as the hash returned by POST /instructions."""
+
+    @model_validator(mode="after")
+    def check_instruction(self):
+        # An empty string is still an explicit (if blank) instruction, as before hashes existed
+        if self.base_system_instruction is None and not self.instruction_hash:
+            raise ValueError("Either base_system_instruction or instruction_hash is required")
+        return self
+
+class OutlineRequest(InstructionRequired):
     contentDescription: str
     contentType: str | None = None
     customSystemInstruction: str | None = None  # Legacy parameter, kept for compatibility
-    base_system_instruction: str  # Primary instruction from ConfigPage
+    base_system_instruction: str | None = None  # Primary instruction from ConfigPage
+    instruction_hash: str | None = None  # Registered instruction, instead of sending the text again
 
-class OptimizeRequest(BaseModel):
+class OptimizeRequest(InstructionRequired):
     content: str
     platform: str
     contentType: str | None = None # Keep consistent with frontend
     customSystemInstruction: str | None = None  # Legacy parameter, kept for compatibility
-    base_system_instruction: str  # Primary instruction from ConfigPage
+    base_system_instruction: str | None = None  # Primary instruction from ConfigPage
+    instruction_hash: str | None = None  # Registered instruction, instead of sending the text again
 
-class RewriteRequest(BaseModel):
+class RewriteRequest(InstructionRequired):
     content: str
     style: str # Style of rewriting (professional, casual, etc.)
-    base_system_instruction: str  # Primary instruction from ConfigPage
+    base_system_instruction: str | None = None  # Primary instruction from ConfigPage
+    instruction_hash: str | None = None  # Registered instruction, instead of sending the text again
 
 class ReplyRequest(BaseModel):
     comment: str # The comment text to reply to
     tone: str # Desired tone for the reply (e.g., helpful, appreciative)
-    base_system_instruction: str | None = None # Optional instruction from ConfigPage 
\ No newline at end of file
+    base_system_instruction: str | None = None # Optional instruction from ConfigPage 
+    instruction_hash: str | None = None # Registered instruction, instead of sending the text again
+
+class BatchJob(BaseModel):
+    type: Literal["optimize", "rewrite", "reply"]
+    id: str | None = None # Optional client-side id echoed back with the result
+    content: str | None = None # optimize / rewrite
+    platform: str | None = None # optimize
+    style: str | None = None # rewrite
+    comment: str | None = None # reply
+    tone: str | None = None # reply
+    base_system_instruction: str | None = None # Overrides the batch-level instruction
+    instruction_hash: str | None = None # Registered instruction overriding the batch-level one
+
+class BatchRequest(BaseModel):
+    jobs: list[BatchJob] = []
+    # Shorthand: one content body optimized for each platform and/or rewritten in each style
+    content: str | None = None
+    platforms: list[str] = []
+    styles: list[str] = []
+    base_system_instruction: str | None = None
+    instruction_hash: str | None = None
+
+class InstructionRegistration(BaseModel):
+    instruction: str # System instruction to store; referenced afterwards by the returned hash
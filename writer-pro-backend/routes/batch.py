@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+import httpx
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+import models
+from services.cache import cache_allowed
+from services.deadlines import start_item_deadline
+from services.http_client import get_http_client
+from services.instructions import InstructionStore, get_instruction_store, resolve_instruction
+from services.jsoncodec import dumps
+from services.metrics import TimedRoute
+from services import preflight
+from services.openai import call_openai_api
+from services.prompts import DEFAULT_REPLY_INSTRUCTION, build_reply_prompt
+from services.tokens import completion_budget
+import config
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TimedRoute)
+
+def expand_jobs(request: models.BatchRequest):
+    """Explicit jobs first, then the content x platforms / content x styles shorthand."""
+    jobs = list(request.jobs)
+    if request.content is not None:
+        jobs += [models.BatchJob(type="optimize", content=request.content, platform=platform) for platform in request.platforms]
+        jobs += [models.BatchJob(type="rewrite", content=request.content, style=style) for style in request.styles]
+    return jobs
+
+def job_instruction(job: models.BatchJob, default_instruction: str | None):
+    """Returns the job's system instruction, or raises HTTPException(422) if a required field is missing."""
+    instruction = job.base_system_instruction or default_instruction
+    if job.type == "optimize":
+        required = {"content": job.content, "platform": job.platform, "base_system_instruction": instruction}
+    elif job.type == "rewrite":
+        required = {"content": job.content, "style": job.style, "base_system_instruction": instruction}
+    else:
+        required = {"comment": job.comment, "tone": job.tone}
+    missing = [field for field, value in required.items() if not value]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Missing field(s) for '{job.type}' job: {', '.join(missing)}")
+    return instruction or DEFAULT_REPLY_INSTRUCTION
+
+async def run_job_call(job: models.BatchJob, instruction: str, client: httpx.AsyncClient, use_cache: bool):
+    """Same pre-flight, prompts and post-processing as the single-item endpoints; returns (text, token estimate or None,
+    length check or None)."""
+    if job.type == "optimize":
+        return await preflight.optimize_content(job.content, job.platform, instruction, client, use_cache)
+    if job.type == "rewrite":
+        return (*await preflight.rewrite_content(job.content, job.style, instruction, client, use_cache), None)
+    text = await call_openai_api(build_reply_prompt(job.comment, job.tone), instruction, None, "reply", client, use_cache, completion_budget("reply"))
+    return text, None, None
+
+@router.post("/batch")
+async def batch_endpoint(request: models.BatchRequest, client: httpx.AsyncClient = Depends(get_http_client), use_cache: bool = Depends(cache_allowed), store: InstructionStore = Depends(get_instruction_store)):
+    """Runs many optimize/rewrite/reply jobs concurrently and streams each result as NDJSON when it completes."""
+    jobs = expand_jobs(request)
+    logger.info("/batch - %d jobs", len(jobs))
+    if not jobs:
+        raise HTTPException(status_code=422, detail="Batch contains no jobs.")
+    if len(jobs) > config.BATCH_MAX_JOBS:
+        raise HTTPException(status_code=422, detail=f"Batch has {len(jobs)} jobs, the maximum is {config.BATCH_MAX_JOBS}.")
+
+    # An unknown batch-level hash fails the whole request; an unknown per-job hash only fails that job
+    default_instruction = await resolve_instruction(store, request.base_system_instruction, request.instruction_hash)
+    semaphore = asyncio.Semaphore(config.BATCH_MAX_CONCURRENCY)
+
+    async def run_job(index: int, job: models.BatchJob):
+        result = {"index": index, "id": job.id, "type": job.type}
+        if job.platform:
+            result["platform"] = job.platform
+        if job.style:
+            result["style"] = job.style
+        start = time.perf_counter()
+        try:
+            instruction = job_instruction(job, await resolve_instruction(store, job.base_system_instruction, job.instruction_hash, default_instruction))
+            async with semaphore:
+                # The item's deadline starts once it has a slot, not when the batch arrived
+                start_item_deadline(job.type)
+                result["result"], token_estimate, length_check = await run_job_call(job, instruction, client, use_cache)
+            if token_estimate:
+                result["tokenEstimate"] = token_estimate
+            if length_check:
+                result["lengthCheck"] = length_check
+            result["status"] = "ok"
+        except HTTPException as e:
+            result["status"] = "error"
+            result["error"] = {"status": e.status_code, "detail": e.detail}
+        except Exception as e:
+            logger.exception("Unexpected error in batch job %d: %s", index, e)
+            result["status"] = "error"
+            result["error"] = {"status": 500, "detail": "Failed to run job due to an internal error."}
+        result["elapsedMs"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    async def result_stream():
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(run_job(index, job)) for index, job in enumerate(jobs)]
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                failed += result["status"] == "error"
+                yield dumps(result) + b"\n"
+        finally:
+            # The client went away mid-batch: stop the jobs that have not finished
+            for task in tasks:
+                task.cancel()
+        summary = {"done": True, "jobs": len(jobs), "failed": failed, "elapsedMs": round((time.perf_counter() - start) * 1000, 1)}
+        logger.info("/batch finished: %s", summary)
+        yield dumps(summary) + b"\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
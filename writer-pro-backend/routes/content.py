@@ -1,80 +1,155 @@
-from fastapi import APIRouter, HTTPException
+import logging
+import time
+import httpx
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 import models
-from services.openai import call_openai_api, generate_reply
-import config
+from services.cache import cache_allowed
+from services.http_client import get_http_client
+from services.instructions import InstructionStore, get_instruction_store, resolve_instruction
+from services.jsoncodec import dumps
+from services.metrics import TimedRoute
+from services import preflight
+from services.openai import call_openai_api, generate_reply, stream_openai_api
+from services.tokens import completion_budget, count_tokens
+from services.prompts import DEFAULT_REPLY_INSTRUCTION, build_optimize_prompt, build_outline_prompt, build_reply_prompt, build_rewrite_prompt
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TimedRoute)
 
 @router.post("/generate-outline")
-async def generate_outline_endpoint(request: models.OutlineRequest):
-    print(f"[ROUTE] /generate-outline - Type: {request.contentType}, DescLen: {len(request.contentDescription)}, InstrLen: {len(request.base_system_instruction)}")
+async def generate_outline_endpoint(request: models.OutlineRequest, client: httpx.AsyncClient = Depends(get_http_client), use_cache: bool = Depends(cache_allowed), store: InstructionStore = Depends(get_instruction_store)):
+    instruction = await resolve_instruction(store, request.base_system_instruction, request.instruction_hash)
+    logger.debug("/generate-outline - Type: %s, DescLen: %d, InstrLen: %d", request.contentType, len(request.contentDescription), len(instruction))
 
-    user_prompt = request.contentDescription
+    user_prompt = build_outline_prompt(request.contentDescription)
 
-    print("[ROUTE] Calling OpenAI service for outline...")
     generated_text = await call_openai_api(
         user_prompt,
-        request.base_system_instruction,
+        instruction,
         None,
-        "outline"
+        "outline",
+        client,
+        use_cache
     )
-    print(f"[ROUTE] OpenAI service returned {len(generated_text)} characters")
+    logger.info("/generate-outline returned %d characters", len(generated_text))
     return {"outline": generated_text}
 
 @router.post("/optimize-content")
-async def optimize_content_endpoint(request: models.OptimizeRequest):
-    print(f"[ROUTE] /optimize-content - Platform: {request.platform}, ContentLen: {len(request.content)}, InstrLen: {len(request.base_system_instruction)}")
-
-    character_limit = config.PLATFORM_LIMITS.get(request.platform, config.PLATFORM_LIMITS["default"])
-    print(f"[ROUTE] Platform character limit: {character_limit}")
-
-    user_prompt = f"Optimize the following content for the '{request.platform}' platform. Aim for a character limit of {character_limit}.\n\nOriginal Content:\n\"{request.content}\""
+async def optimize_content_endpoint(request: models.OptimizeRequest, client: httpx.AsyncClient = Depends(get_http_client), use_cache: bool = Depends(cache_allowed), store: InstructionStore = Depends(get_instruction_store)):
+    instruction = await resolve_instruction(store, request.base_system_instruction, request.instruction_hash)
+    logger.debug("/optimize-content - Platform: %s, ContentLen: %d, InstrLen: %d", request.platform, len(request.content), len(instruction))
 
-    print("[ROUTE] Calling OpenAI service for optimization...")
-    generated_text = await call_openai_api(
-        user_prompt,
-        request.base_system_instruction,
-        None,
-        "optimize"
+    generated_text, token_estimate, length_check = await preflight.optimize_content(
+        request.content,
+        request.platform,
+        instruction,
+        client,
+        use_cache
     )
-    print(f"[ROUTE] OpenAI service returned {len(generated_text)} characters")
-    return {"optimizedContent": generated_text}
+    logger.info("/optimize-content returned %d characters", len(generated_text))
+    response = {"optimizedContent": generated_text, "tokenEstimate": token_estimate}
+    if length_check is not None:
+        response["lengthCheck"] = length_check
+    return response
 
 @router.post("/rewrite-content")
-async def rewrite_content_endpoint(request: models.RewriteRequest):
-    print(f"[ROUTE] /rewrite-content - Style: {request.style}, ContentLen: {len(request.content)}, InstrLen: {len(request.base_system_instruction)}")
-
-    user_prompt = f"Rewrite the following content in a {request.style} style while maintaining the core meaning:\n\nOriginal Content:\n\"{request.content}\""
+async def rewrite_content_endpoint(request: models.RewriteRequest, client: httpx.AsyncClient = Depends(get_http_client), use_cache: bool = Depends(cache_allowed), store: InstructionStore = Depends(get_instruction_store)):
+    instruction = await resolve_instruction(store, request.base_system_instruction, request.instruction_hash)
+    logger.debug("/rewrite-content - Style: %s, ContentLen: %d, InstrLen: %d", request.style, len(request.content), len(instruction))
 
-    print("[ROUTE] Calling OpenAI service for rewrite...")
-    generated_text = await call_openai_api(
-        user_prompt,
-        request.base_system_instruction,
-        None,
-        "rewrite"
+    generated_text, token_estimate = await preflight.rewrite_content(
+        request.content,
+        request.style,
+        instruction,
+        client,
+        use_cache
     )
-    print(f"[ROUTE] OpenAI service returned {len(generated_text)} characters")
-    return {"rewrittenContent": generated_text}
+    logger.info("/rewrite-content returned %d characters", len(generated_text))
+    return {"rewrittenContent": generated_text, "tokenEstimate": token_estimate}
 
 @router.post("/generate-reply")
-async def generate_reply_endpoint(request: models.ReplyRequest):
+async def generate_reply_endpoint(request: models.ReplyRequest, client: httpx.AsyncClient = Depends(get_http_client), use_cache: bool = Depends(cache_allowed), store: InstructionStore = Depends(get_instruction_store)):
     """Endpoint to generate a reply to a comment."""
-    print(f"[ROUTE] /generate-reply - Tone: {request.tone}, CommentLen: {len(request.comment)}, InstrLen: {len(request.base_system_instruction)}")
+    base_instruction = await resolve_instruction(store, request.base_system_instruction, request.instruction_hash, DEFAULT_REPLY_INSTRUCTION)
+    logger.debug("/generate-reply - Tone: %s, CommentLen: %d, InstrLen: %d", request.tone, len(request.comment), len(base_instruction))
 
-    base_instruction = request.base_system_instruction or "You are a helpful assistant replying to comments."
-
-    print("[ROUTE] Calling generate_reply service...")
     try:
         generated_text = await generate_reply(
             comment=request.comment,
             tone=request.tone,
-            base_system_instruction=base_instruction
+            base_system_instruction=base_instruction,
+            client=client,
+            use_cache=use_cache
         )
-        print(f"[ROUTE] OpenAI service returned {len(generated_text)} characters for reply")
+        logger.info("/generate-reply returned %d characters", len(generated_text))
         return {"reply": generated_text}
     except HTTPException as e:
         # Re-raise HTTPException to let FastAPI handle it
         raise e
     except Exception as e:
-        print(f"[ERROR] Unexpected error in /generate-reply endpoint: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate reply due to an internal error.") 
\ No newline at end of file
+        logger.exception("Unexpected error in /generate-reply endpoint: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to generate reply due to an internal error.") 
+
+# --- Streaming Endpoints (Server-Sent Events) --- -
+def format_sse(data: dict, event: str | None = None):
+    message = b"data: " + dumps(data) + b"\n\n"
+    return b"event: " + event.encode() + b"\n" + message if event else message
+
+def stream_completion(user_prompt: str, instruction: str, request_type: str, client: httpx.AsyncClient, max_tokens: int | None = None):
+    """Forwards upstream deltas as SSE 'data' events, then a 'done' event with the measured timings."""
+    async def event_stream():
+        start = time.perf_counter()
+        ttfb_ms = None
+        total_chars = 0
+        try:
+            async for delta in stream_openai_api(user_prompt, instruction, request_type, client, max_tokens):
+                if ttfb_ms is None:
+                    ttfb_ms = (time.perf_counter() - start) * 1000
+                    logger.debug("'%s' stream time to first byte: %.0fms", request_type, ttfb_ms)
+                total_chars += len(delta)
+                yield format_sse({"delta": delta})
+        except HTTPException as e:
+            # Headers are already sent, so errors are reported in-band
+            yield format_sse({"status": e.status_code, "detail": e.detail}, "error")
+            return
+
+        total_ms = (time.perf_counter() - start) * 1000
+        logger.info("'%s' stream finished, %d characters in %.0fms", request_type, total_chars, total_ms)
+        yield format_sse({"ttfbMs": ttfb_ms, "totalMs": total_ms, "characters": total_chars}, "done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/generate-outline/stream")
+async def generate_outline_stream_endpoint(request: models.OutlineRequest, client: httpx.AsyncClient = Depends(get_http_client), store: InstructionStore = Depends(get_instruction_store)):
+    logger.debug("/generate-outline/stream - Type: %s, DescLen: %d", request.contentType, len(request.contentDescription))
+    instruction = await resolve_instruction(store, request.base_system_instruction, request.instruction_hash)
+    return stream_completion(build_outline_prompt(request.contentDescription), instruction, "outline", client)
+
+@router.post("/optimize-content/stream")
+async def optimize_content_stream_endpoint(request: models.OptimizeRequest, client: httpx.AsyncClient = Depends(get_http_client), store: InstructionStore = Depends(get_instruction_store)):
+    logger.debug("/optimize-content/stream - Platform: %s, ContentLen: %d", request.platform, len(request.content))
+    instruction = await resolve_instruction(store, request.base_system_instruction, request.instruction_hash)
+    user_prompt = build_optimize_prompt(request.content, request.platform)
+    max_tokens = completion_budget("optimize", request.platform)
+    return stream_completion(user_prompt, instruction, "optimize", client, max_tokens)
+
+@router.post("/rewrite-content/stream")
+async def rewrite_content_stream_endpoint(request: models.RewriteRequest, client: httpx.AsyncClient = Depends(get_http_client), store: InstructionStore = Depends(get_instruction_store)):
+    logger.debug("/rewrite-content/stream - Style: %s, ContentLen: %d", request.style, len(request.content))
+    instruction = await resolve_instruction(store, request.base_system_instruction, request.instruction_hash)
+    user_prompt = build_rewrite_prompt(request.content, request.style)
+    max_tokens = completion_budget("rewrite", content_tokens=count_tokens(request.content))
+    return stream_completion(user_prompt, instruction, "rewrite", client, max_tokens)
+
+@router.post("/generate-reply/stream")
+async def generate_reply_stream_endpoint(request: models.ReplyRequest, client: httpx.AsyncClient = Depends(get_http_client), store: InstructionStore = Depends(get_instruction_store)):
+    logger.debug("/generate-reply/stream - Tone: %s, CommentLen: %d", request.tone, len(request.comment))
+    instruction = await resolve_instruction(store, request.base_system_instruction, request.instruction_hash, DEFAULT_REPLY_INSTRUCTION)
+    user_prompt = build_reply_prompt(request.comment, request.tone)
+    return stream_completion(user_prompt, instruction, "reply", client, completion_budget("reply"))
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from services.lifecycle import lifecycle
+
+router = APIRouter()
+
+# --- Liveness and Readiness Probes --- -
+@router.get("/healthz")
+async def liveness():
+    """The process is up and its event loop answers; restart it only when this fails."""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readiness():
+    """503 while warming up or draining, so load balancers only route to workers that can serve at full speed."""
+    snapshot = lifecycle.snapshot()
+    return JSONResponse(status_code=200 if snapshot["status"] == "ready" else 503, content=snapshot)
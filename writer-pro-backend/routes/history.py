@@ -0,0 +1,72 @@
+import asyncio
+import sqlite3
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+import config
+from services.history import generation_history, search_query
+from services.metrics import TimedRoute
+from services.ratelimit import identify_caller
+
+router = APIRouter(route_class=TimedRoute)
+
+def history_entry(row: dict):
+    return {
+        "id": row["id"],
+        "createdAt": row["created_at"],
+        "requestType": row["request_type"],
+        "route": row["route"],
+        "model": row["model"],
+        "inputsHash": row["inputs_hash"],
+        "prompt": row["prompt"],
+        "output": row["output"],
+        "usage": {"prompt": row["prompt_tokens"], "completion": row["completion_tokens"], "cached": row["cached_tokens"]},
+        "latencyMs": row["latency_ms"],
+        "streamed": bool(row["streamed"]),
+    }
+
+def history_page(rows: list[dict], limit: int):
+    # A full page means there may be more: the client passes nextCursor back as `before`
+    return {"items": [history_entry(row) for row in rows], "nextCursor": rows[-1]["id"] if len(rows) == limit else None}
+
+def history_store():
+    if generation_history.store is None:
+        raise HTTPException(status_code=404, detail="Generation history is disabled on this server.")
+    return generation_history.store
+
+def history_caller(request: Request) -> str:
+    """FastAPI dependency naming whose history to read. Client addresses are shared behind proxies and NAT, so only
+    an API key is enough to hand out someone's prompts and outputs."""
+    caller = identify_caller(request.scope)
+    if not caller.startswith("key:"):
+        raise HTTPException(status_code=403, detail="Reading generation history needs an API key (X-API-Key).")
+    return caller
+
+PageSize = Query(config.HISTORY_PAGE_SIZE, ge=1, le=config.HISTORY_MAX_PAGE_SIZE)
+
+@router.get("/history")
+async def list_history(before: int | None = None, limit: int = PageSize, type: str | None = None, caller: str = Depends(history_caller)):
+    """The caller's generations, newest first."""
+    rows = await asyncio.to_thread(history_store().page, caller, before, limit, type)
+    return history_page(rows, limit)
+
+@router.get("/history/search")
+async def search_history(q: str = Query(..., min_length=1), before: int | None = None, limit: int = PageSize, type: str | None = None, caller: str = Depends(history_caller)):
+    """The caller's generations whose prompt or output contains every word of `q` (`word*` matches a prefix), newest first."""
+    store = history_store()
+    if not store.searchable:
+        raise HTTPException(status_code=501, detail="Full-text search needs SQLite with FTS5.")
+    query = search_query(q)
+    if not query:
+        raise HTTPException(status_code=400, detail="Search query has no words.")
+    try:
+        rows = await asyncio.to_thread(store.search, caller, query, before, limit, type)
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {e}")
+    return history_page(rows, limit)
+
+@router.get("/history/{record_id}")
+async def get_history_entry(record_id: int, caller: str = Depends(history_caller)):
+    # Another caller's record is reported as missing, so ids cannot be probed
+    row = await asyncio.to_thread(history_store().get, caller, record_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="History entry not found.")
+    return history_entry(row)
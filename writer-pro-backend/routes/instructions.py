@@ -0,0 +1,35 @@
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+import config
+import models
+from services.instructions import InstructionStore, get_instruction_store
+from services.metrics import TimedRoute
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TimedRoute)
+
+def instruction_summary(entry: dict):
+    return {
+        "instructionHash": entry["hash"],
+        "tokens": entry["tokens"],
+        "characters": entry["characters"],
+        # OpenAI only caches prompt prefixes from this length on, so shorter instructions save bandwidth but not tokens
+        "promptCacheEligible": entry["tokens"] >= config.PROMPT_CACHE_MIN_TOKENS,
+    }
+
+@router.post("/instructions", status_code=201)
+async def register_instruction(request: models.InstructionRegistration, store: InstructionStore = Depends(get_instruction_store)):
+    if len(request.instruction) > config.INSTRUCTION_MAX_CHARACTERS:
+        raise HTTPException(status_code=413, detail=f"Instruction exceeds {config.INSTRUCTION_MAX_CHARACTERS} characters.")
+    entry = await asyncio.to_thread(store.register, request.instruction)
+    logger.info("Registered instruction %s (%d tokens)", entry["hash"][:12], entry["tokens"])
+    return instruction_summary(entry)
+
+@router.get("/instructions/{instruction_hash}")
+async def describe_instruction(instruction_hash: str, store: InstructionStore = Depends(get_instruction_store)):
+    entry = await asyncio.to_thread(store.describe, instruction_hash)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Instruction not registered.")
+    return {**instruction_summary(entry), "createdAt": entry["createdAt"]}
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+import models
+from services.instructions import InstructionStore, get_instruction_store, resolve_instruction
+from services.jobs import JobStore, get_job_store
+from services.metrics import TimedRoute
+from services.ratelimit import current_caller
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TimedRoute)
+
+def job_summary(job: dict):
+    summary = {
+        "jobId": job["id"],
+        "type": job["type"],
+        "status": job["status"],
+        "createdAt": job["created_at"],
+        "startedAt": job["started_at"],
+        "finishedAt": job["finished_at"],
+    }
+    if job["error"]:
+        summary["error"] = json.loads(job["error"])
+    return summary
+
+async def load_job(store: JobStore, job_id: str):
+    job = await asyncio.to_thread(store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job
+
+@router.post("/jobs/generate-outline", status_code=202)
+async def submit_outline_job(request: models.OutlineRequest, store: JobStore = Depends(get_job_store), instructions: InstructionStore = Depends(get_instruction_store)):
+    logger.info("/jobs/generate-outline - Type: %s, DescLen: %d", request.contentType, len(request.contentDescription))
+    # Resolve a registered instruction now, so an unknown hash is a 404 here rather than a failed job later
+    payload = request.model_dump()
+    payload["base_system_instruction"] = await resolve_instruction(instructions, request.base_system_instruction, request.instruction_hash)
+    # The worker runs outside this request, so it needs to know whom to charge the generation to
+    payload["caller"] = current_caller()
+    job_id = await asyncio.to_thread(store.submit, "outline", payload)
+    return {"jobId": job_id, "status": "queued"}
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, store: JobStore = Depends(get_job_store)):
+    return job_summary(await load_job(store, job_id))
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, store: JobStore = Depends(get_job_store)):
+    job = await load_job(store, job_id)
+    if job["status"] == "succeeded":
+        return {"jobId": job_id, "outline": job["result"]}
+    if job["status"] == "failed":
+        error = json.loads(job["error"])
+        raise HTTPException(status_code=error["status"], detail=error["detail"])
+    if job["status"] == "cancelled":
+        raise HTTPException(status_code=410, detail="Job was cancelled.")
+    # Still queued or running: tell the client to poll again
+    return JSONResponse(status_code=202, content=job_summary(job), headers={"Retry-After": "2"})
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, store: JobStore = Depends(get_job_store)):
+    job = await load_job(store, job_id)
+    if not await asyncio.to_thread(store.cancel, job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}.")
+    logger.info("Job %s cancelled", job_id)
+    return {"jobId": job_id, "status": "cancelled"}
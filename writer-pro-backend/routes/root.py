@@ -1,8 +1,72 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services.cache import response_cache
+from services.deadlines import cancellation_stats
+from services.metrics import registry, token_usage_summary
+from services.resilience import resilient_caller
+from services.router import model_router
+from services.scheduler import upstream_scheduler
+from services.singleflight import upstream_calls
 
 router = APIRouter()
 
 @router.get("/")
 async def read_root():
-    print("[ENDPOINT] root endpoint called (health check)")
-    return {"message": "Writer Pro Backend is running."} 
\ No newline at end of file
+    return {"message": "Writer Pro Backend is running."} 
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+@router.get("/upstream/stats")
+async def upstream_stats():
+    return {
+        "singleflight": upstream_calls.stats(),
+        "scheduler": upstream_scheduler.stats(),
+        "resilience": resilient_caller.stats(),
+        "router": model_router.stats(),
+        "tokens": token_usage_summary(),
+        "cancellations": cancellation_stats(),
+    }
+
+# --- Prometheus Scrape Endpoint --- -
+def upstream_state_metrics():
+    """Cache, coalescing, scheduler and breaker state, read from the existing stats at scrape time."""
+    cache = response_cache.stats()
+    yield ("writer_pro_cache_events_total", "counter", "Response cache hits, misses, evictions, expirations and bypasses.",
+           [({"event": name}, value) for name, value in response_cache.counters.items()])
+    yield ("writer_pro_cache_entries", "gauge", "Entries held in the in-memory response cache.", [({}, cache["entries"])])
+    yield ("writer_pro_cache_bytes", "gauge", "Bytes held in the in-memory response cache.", [({}, cache["bytes"])])
+    yield ("writer_pro_singleflight_events_total", "counter", "Upstream calls started or joined by identical requests.",
+           [({"event": name}, value) for name, value in upstream_calls.counters.items()])
+
+    scheduler = upstream_scheduler.stats()
+    yield ("writer_pro_scheduler_concurrency_limit", "gauge", "Current adaptive concurrency limit per model.",
+           [({"model": model}, stats["concurrency_limit"]) for model, stats in scheduler.items()])
+    yield ("writer_pro_scheduler_active", "gauge", "Upstream calls holding a scheduler slot.",
+           [({"model": model}, stats["active"]) for model, stats in scheduler.items()])
+    yield ("writer_pro_scheduler_queue_depth", "gauge", "Calls waiting for a scheduler slot, by request type.",
+           [({"model": model, "request_type": request_type}, depth)
+            for model, stats in scheduler.items() for request_type, depth in stats["queue_depth"].items()])
+    yield ("writer_pro_scheduler_rate_limited_total", "counter", "429 responses that backed a model off.",
+           [({"model": model}, stats["rate_limited"]) for model, stats in scheduler.items()])
+
+    resilience = resilient_caller.stats()
+    yield ("writer_pro_resilience_events_total", "counter", "Upstream attempts, retries, hedges and deadline expiries.",
+           [({"event": name}, value) for name, value in resilient_caller.counters.items()])
+    yield ("writer_pro_circuit_open", "gauge", "1 while a model's circuit breaker is open or half-open.",
+           [({"model": model}, int(stats["state"] != "closed")) for model, stats in resilience["breakers"].items()])
+
+    routing = model_router.stats()
+    yield ("writer_pro_router_events_total", "counter", "Routing decisions: calls routed, sent to the fast tier, explored and failed over.",
+           [({"event": name}, value) for name, value in model_router.counters.items()])
+    yield ("writer_pro_router_latency_ewma_seconds", "gauge", "Smoothed upstream latency of successful calls per candidate model.",
+           [({"model": model}, stats["latency_ewma_s"]) for model, stats in routing["models"].items()])
+    yield ("writer_pro_router_error_rate", "gauge", "Smoothed share of failed calls per candidate model.",
+           [({"model": model}, stats["error_rate"]) for model, stats in routing["models"].items()])
+
+registry.register_collector(upstream_state_metrics)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
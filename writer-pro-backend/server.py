@@ -0,0 +1,66 @@
+"""Production entry point: several uvicorn worker processes with graceful drain.
+
+Usage (from writer-pro-backend): python server.py [--port 8000] [--workers N]
+
+For development with auto-reload keep using `uvicorn main:app --reload --port 8000`.
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import uvicorn
+import config
+from services.log import configure_logging
+
+logger = logging.getLogger("server")
+
+def available_cpus() -> int:
+    # Honours CPU affinity and container cpusets, which os.cpu_count() ignores
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def default_workers() -> int:
+    return config.SERVER_WORKERS or max(1, min(available_cpus(), config.SERVER_MAX_WORKERS))
+
+def resolve_implementation(setting: str, module: str, fallback: str) -> str:
+    """uvicorn's `auto` choice, made explicit so the startup log says which event loop and HTTP parser run."""
+    if setting != "auto":
+        return setting
+    return module if importlib.util.find_spec(module) is not None else fallback
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    args = parser.parse_args()
+
+    configure_logging()
+    loop = resolve_implementation(config.SERVER_LOOP, "uvloop", "asyncio")
+    http = resolve_implementation(config.SERVER_HTTP, "httptools", "h11")
+    if args.workers > 1 and not config.RATE_LIMIT_DB_PATH:
+        # Workers are separate processes; without a shared store each would enforce its own copy of every limit
+        os.environ["RATE_LIMIT_DB_PATH"] = "ratelimit.sqlite3"
+    logger.info("Starting %d worker(s) on %s:%d (loop=%s, http=%s, graceful shutdown %.0fs)",
+                args.workers, args.host, args.port, loop, http, config.SHUTDOWN_GRACE_SECONDS)
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        lifespan="on",
+        # In-flight requests, including streams and long outlines, finish before a worker exits
+        timeout_graceful_shutdown=int(config.SHUTDOWN_GRACE_SECONDS),
+        timeout_keep_alive=config.SERVER_KEEPALIVE_SECONDS,
+        proxy_headers=True,
+        forwarded_allow_ips=config.FORWARDED_ALLOW_IPS,
+        server_header=False,
+        log_config=None,  # Keep the queued logging set up by services/log.py
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from fastapi import Request
+import config
+
+# --- Content-Addressed Response Cache --- -
+def fingerprint(request_body: dict) -> str:
+    """Stable hash of the final upstream request (model, messages and sampling params)."""
+    canonical = json.dumps(request_body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class SQLiteCacheTier:
+    """On-disk tier so cached responses survive restarts. Calls are blocking, run them in a thread."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0], row[1]
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ResponseCache:
+    """In-process LRU with TTL, bounded by entry count and total text size, with an optional SQLite tier."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: int, sqlite_path: str | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[str, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._disk = SQLiteCacheTier(sqlite_path) if sqlite_path else None
+        self._history = None
+        self._sets_since_purge = 0
+        self.counters = {"hits": 0, "disk_hits": 0, "history_hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "bypasses": 0}
+
+    @staticmethod
+    def is_enabled(request_type: str) -> bool:
+        return config.CACHE_ENABLED.get(request_type, False)
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at, _ = entry
+            if expires_at >= time.time():
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return value
+            self._remove(key)
+            self.counters["expirations"] += 1
+
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk.get, key)
+            if row is not None:
+                value, expires_at = row
+                self._store(key, value, expires_at)
+                self.counters["disk_hits"] += 1
+                return value
+
+        if self._history is not None:
+            row = await self._history.lookup(key, time.time() - self.ttl_seconds)
+            if row is not None:
+                value, created_at = row
+                self._store(key, value, created_at + self.ttl_seconds)
+                self.counters["history_hits"] += 1
+                return value
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl_seconds
+        self._store(key, value, expires_at)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, expires_at)
+            self._sets_since_purge += 1
+            if self._sets_since_purge >= 100:
+                self._sets_since_purge = 0
+                await asyncio.to_thread(self._disk.purge_expired)
+
+    def attach_history(self, history):
+        """Falls back to `history.lookup(key, not_before)` on a miss, i.e. to generations recorded by any worker process."""
+        self._history = history
+
+    def close(self):
+        self._history = None
+        if self._disk is not None:
+            self._disk.close()
+
+    def record_bypass(self):
+        self.counters["bypasses"] += 1
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "disk_tier": self._disk is not None,
+            "history_tier": self._history is not None,
+        }
+
+    def _store(self, key: str, value: str, expires_at: float):
+        if key in self._entries:
+            self._remove(key)
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.counters["evictions"] += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+response_cache = ResponseCache(
+    max_entries=config.CACHE_MAX_ENTRIES,
+    max_bytes=config.CACHE_MAX_BYTES,
+    ttl_seconds=config.CACHE_TTL_SECONDS,
+    sqlite_path=config.CACHE_SQLITE_PATH,
+)
+
+def cache_allowed(request: Request) -> bool:
+    """FastAPI dependency: False when the caller asks for a fresh generation."""
+    bypass = request.headers.get(config.CACHE_BYPASS_HEADER, "").lower() in ("1", "true", "yes")
+    if bypass or "no-cache" in request.headers.get("Cache-Control", "").lower():
+        response_cache.record_bypass()
+        return False
+    return True
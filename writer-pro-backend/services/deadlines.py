@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import math
+import time
+from contextvars import ContextVar
+import config
+from services.metrics import Counter, average_completion_tokens, current_route, mark_disconnected, registry
+from services.router import model_router
+
+logger = logging.getLogger(__name__)
+
+client_disconnects = registry.register(Counter(
+    "writer_pro_client_disconnects_total", "Requests whose client went away before the response was complete.", ("route",)))
+cancelled_calls = registry.register(Counter(
+    "writer_pro_cancelled_upstream_total", "Upstream calls stopped early, by reason (client_disconnect, deadline) and stage (queued, in_flight).",
+    ("route", "model", "reason", "stage")))
+saved_seconds = registry.register(Counter(
+    "writer_pro_cancel_saved_upstream_seconds_total", "Estimated upstream seconds not spent because calls were stopped early.",
+    ("route", "model", "reason")))
+saved_tokens = registry.register(Counter(
+    "writer_pro_cancel_saved_tokens_total", "Estimated tokens not sent or generated because calls were stopped early.",
+    ("route", "model", "reason")))
+
+# --- Per-Request Deadline and Disconnect State --- -
+class RequestDeadline:
+    """Shared by every task the request spawns, including a coalesced upstream call it leads.
+
+    A /batch item runs under a child with a deadline of its own, which still hears about the client disconnecting.
+    `timeout` is what the client asked for in X-Request-Timeout, if anything.
+    """
+    __slots__ = ("deadline", "timeout", "parent", "_disconnected")
+
+    def __init__(self, deadline: float, timeout: float | None = None, parent: "RequestDeadline | None" = None):
+        self.deadline = deadline
+        self.timeout = timeout
+        self.parent = parent
+        self._disconnected = False
+
+    @property
+    def disconnected(self) -> bool:
+        return self._disconnected or (self.parent is not None and self.parent.disconnected)
+
+    @disconnected.setter
+    def disconnected(self, value: bool):
+        self._disconnected = value
+
+_request: ContextVar[RequestDeadline | None] = ContextVar("request_deadline", default=None)
+counters = {"client_disconnects": 0, "cancelled_queued": 0, "cancelled_in_flight": 0, "saved_upstream_seconds": 0.0, "saved_tokens": 0.0}
+
+def timeout_from_headers(headers) -> float | None:
+    """Seconds from the X-Request-Timeout header, clamped to REQUEST_DEADLINE_MIN/MAX_SECONDS; None if absent or invalid."""
+    name = config.REQUEST_TIMEOUT_HEADER.lower().encode()
+    for key, value in headers:
+        if key == name:
+            try:
+                seconds = float(value)
+            except ValueError:
+                return None
+            if not 0 < seconds < math.inf:
+                return None
+            return min(max(seconds, config.REQUEST_DEADLINE_MIN_SECONDS), config.REQUEST_DEADLINE_MAX_SECONDS)
+    return None
+
+def route_budget(path: str) -> float:
+    """Seconds a whole request to `path` may take: its request type's budget, or the longest one for other routes.
+
+    /batch items each get their own budget once they start (see start_item_deadline).
+    """
+    request_type = config.ROUTE_REQUEST_TYPES.get(path.removesuffix("/stream"))
+    if request_type is None:
+        return max(config.REQUEST_DEADLINES.values())
+    return config.REQUEST_DEADLINES[request_type]
+
+def request_deadline(request_type: str) -> float:
+    """time.monotonic() by which an upstream call must finish.
+
+    Inside a request this is the deadline fixed when the request arrived, so chunked calls and follow-up calls
+    share one budget. Outside one (background jobs, scripts) each call gets its request type's budget.
+    """
+    request = _request.get()
+    if request is not None:
+        return request.deadline
+    return time.monotonic() + config.REQUEST_DEADLINES.get(request_type, config.REQUEST_DEADLINE_SECONDS)
+
+def start_item_deadline(request_type: str):
+    """Gives the calling task, one /batch item, its own deadline starting now: the client's X-Request-Timeout if it
+    sent one, else the item type's budget. Items waiting for a BATCH_MAX_CONCURRENCY slot would otherwise spend the
+    batch's single deadline in the queue. Other tasks keep theirs, since each task runs in its own copy of the context.
+    """
+    request = _request.get()
+    timeout = request.timeout if request is not None else None
+    budget = timeout if timeout is not None else config.REQUEST_DEADLINES.get(request_type, config.REQUEST_DEADLINE_SECONDS)
+    _request.set(RequestDeadline(time.monotonic() + budget, timeout, request))
+
+def cancel_reason(deadline: float) -> str | None:
+    """Why an upstream call is being cancelled, or None when it is not ours to count (e.g. a losing hedge)."""
+    request = _request.get()
+    if request is not None and request.disconnected:
+        return "client_disconnect"
+    if time.monotonic() >= deadline - 0.01:
+        return "deadline"
+    return None
+
+def record_cancelled(model: str, reason: str, stage: str, elapsed: float, prompt_tokens: int, generated_tokens: int = 0):
+    """Counts a call stopped early, with its savings estimated from the model's smoothed latency and mean completion size.
+
+    A queued call saves the whole call, prompt included. An in-flight call has already been billed for its prompt,
+    so it saves the rest of the expected latency and the completion tokens not generated yet.
+    """
+    expected_seconds = model_router.stats_for(model).latency
+    expected_completion = average_completion_tokens(model)
+    if stage == "queued":
+        seconds, tokens = expected_seconds, prompt_tokens + expected_completion
+    else:
+        seconds, tokens = max(0.0, expected_seconds - elapsed), max(0.0, expected_completion - generated_tokens)
+    route = current_route()
+    cancelled_calls.inc(route=route, model=model, reason=reason, stage=stage)
+    saved_seconds.inc(seconds, route=route, model=model, reason=reason)
+    saved_tokens.inc(tokens, route=route, model=model, reason=reason)
+    counters[f"cancelled_{stage}"] += 1
+    counters["saved_upstream_seconds"] += seconds
+    counters["saved_tokens"] += tokens
+    logger.info("Stopped %s call to '%s' (%s), saving ~%.1fs and ~%.0f tokens", stage.replace("_", "-"), model, reason, seconds, tokens)
+
+def cancellation_stats() -> dict:
+    return {**counters, "saved_upstream_seconds": round(counters["saved_upstream_seconds"], 1), "saved_tokens": round(counters["saved_tokens"])}
+
+class DeadlineMiddleware:
+    """Pure ASGI middleware for POST requests: fixes the request deadline on arrival and cancels the handler when the client disconnects.
+
+    Once the request body has been read, a watcher waits for `http.disconnect`. If it arrives before the
+    response is complete, the handler task is cancelled, which cancels queued and in-flight upstream calls
+    that no other request is waiting on.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        timeout = timeout_from_headers(scope["headers"])
+        request = RequestDeadline(time.monotonic() + (timeout if timeout is not None else route_budget(scope["path"])), timeout)
+        token = _request.set(request)
+        disconnected = asyncio.Event()
+        body_read = False
+        response_complete = False
+        watcher = None
+
+        async def watch_disconnect():
+            message = await receive()
+            # After the response, servers answer receive() with http.disconnect too; that one is not an abort
+            if message["type"] == "http.disconnect" and not response_complete:
+                request.disconnected = True
+                mark_disconnected()
+                client_disconnects.inc(route=current_route())
+                counters["client_disconnects"] += 1
+                disconnected.set()
+                handler.cancel()
+
+        async def receive_then_watch():
+            nonlocal body_read, watcher
+            if body_read:
+                # The watcher owns receive() now; later readers (e.g. a streaming response) hear about disconnects from it
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                body_read = True
+                watcher = asyncio.create_task(watch_disconnect())
+            return message
+
+        async def send_and_track(message):
+            nonlocal response_complete
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        handler = asyncio.create_task(self.app(scope, receive_then_watch, send_and_track))
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not request.disconnected:
+                handler.cancel()
+                raise  # Cancelled from outside (server shutdown), not by the watcher
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            _request.reset(token)
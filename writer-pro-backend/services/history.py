@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import config
+from services.metrics import Counter, current_route, registry
+from services.ratelimit import current_caller
+
+logger = logging.getLogger(__name__)
+
+history_records = registry.register(Counter(
+    "writer_pro_history_records_total", "Generation history records written, dropped or failed.", ("outcome",)))
+
+# --- Generation History in SQLite, with a Full-Text Index --- -
+COLUMNS = ("id", "created_at", "request_type", "route", "inputs_hash", "model", "prompt", "output",
+           "prompt_tokens", "completion_tokens", "cached_tokens", "latency_ms", "streamed", "caller")
+SELECT_COLUMNS = ", ".join(f"g.{column}" for column in COLUMNS)
+PURGE_BATCH = 5000
+
+class HistoryStore:
+    """One row per upstream generation. Pages are keyset-paginated on the rowid, newest first, so reading deep
+    into millions of rows costs the same as reading the first page. Reads only ever return the given caller's
+    records. Calls block; run them in a thread.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS generations (
+                id INTEGER PRIMARY KEY,
+                created_at REAL NOT NULL,
+                request_type TEXT NOT NULL,
+                route TEXT NOT NULL,
+                inputs_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                output TEXT NOT NULL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                cached_tokens INTEGER,
+                latency_ms REAL,
+                streamed INTEGER NOT NULL DEFAULT 0,
+                caller TEXT
+            )"""
+        )
+        if "caller" not in {row[1] for row in self._conn.execute("PRAGMA table_info(generations)")}:
+            # Stores from before records were scoped to a caller; their rows stay readable by nobody
+            self._conn.execute("ALTER TABLE generations ADD COLUMN caller TEXT")
+        self._conn.execute("DROP INDEX IF EXISTS generations_type")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS generations_caller ON generations (caller, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS generations_caller_type ON generations (caller, request_type, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS generations_inputs ON generations (inputs_hash, id)")
+        self.searchable = self._create_search_index()
+
+    def _create_search_index(self) -> bool:
+        # External-content FTS5 table: the text is stored once, in `generations`; triggers keep the index in step
+        try:
+            self._conn.executescript(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5(
+                       prompt, output, content='generations', content_rowid='id', tokenize='unicode61 remove_diacritics 2');
+                   CREATE TRIGGER IF NOT EXISTS generations_ai AFTER INSERT ON generations BEGIN
+                       INSERT INTO generations_fts (rowid, prompt, output) VALUES (new.id, new.prompt, new.output);
+                   END;
+                   CREATE TRIGGER IF NOT EXISTS generations_ad AFTER DELETE ON generations BEGIN
+                       INSERT INTO generations_fts (generations_fts, rowid, prompt, output) VALUES ('delete', old.id, old.prompt, old.output);
+                   END;"""
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning("SQLite has no FTS5 (%s); history search is disabled", e)
+            return False
+        return True
+
+    def insert_many(self, records: list[tuple]):
+        """Writes a batch in one transaction; `records` are tuples in COLUMNS order without the id."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    f"INSERT INTO generations ({', '.join(COLUMNS[1:])}) VALUES ({', '.join('?' * (len(COLUMNS) - 1))})",
+                    records,
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def page(self, caller: str, before: int | None, limit: int, request_type: str | None = None) -> list[dict]:
+        where, params = self._filters(caller, before, request_type)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {SELECT_COLUMNS} FROM generations g {where} ORDER BY g.id DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, caller: str, query: str, before: int | None, limit: int, request_type: str | None = None) -> list[dict]:
+        """Newest matches first. Ordering by rowid rather than relevance lets FTS5 stop after `limit` matches."""
+        # The cursor constrains the FTS rowid itself, so FTS5 starts its scan there instead of filtering afterwards
+        where, params = self._filters(caller, before, request_type, "generations_fts.rowid")
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT {SELECT_COLUMNS} FROM generations_fts JOIN generations g ON g.id = generations_fts.rowid
+                    {where} AND generations_fts MATCH ? ORDER BY generations_fts.rowid DESC LIMIT ?""",
+                (*params, query, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, caller: str, record_id: int) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {SELECT_COLUMNS} FROM generations g WHERE g.id = ? AND g.caller = ?", (record_id, caller)).fetchone()
+        return dict(row) if row else None
+
+    def lookup(self, inputs_hash: str, not_before: float) -> tuple[str, float] | None:
+        """The newest output generated for `inputs_hash` since `not_before`, with its creation time."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output, created_at FROM generations WHERE inputs_hash = ? ORDER BY id DESC LIMIT 1", (inputs_hash,)
+            ).fetchone()
+        if row is None or row[1] < not_before:
+            return None
+        return row[0], row[1]
+
+    def purge(self, before: float) -> int:
+        """Deletes records created before `before`, in small transactions so writers are never blocked for long."""
+        purged = 0
+        while True:
+            with self._lock:
+                deleted = self._conn.execute(
+                    "DELETE FROM generations WHERE id IN (SELECT id FROM generations WHERE created_at < ? ORDER BY id LIMIT ?)",
+                    (before, PURGE_BATCH),
+                ).rowcount
+            purged += deleted
+            if deleted < PURGE_BATCH:
+                return purged
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _filters(caller: str, before: int | None, request_type: str | None, id_column: str = "g.id") -> tuple[str, tuple]:
+        clauses, params = ["g.caller = ?"], [caller]
+        if before is not None:
+            clauses.append(f"{id_column} < ?")
+            params.append(before)
+        if request_type:
+            clauses.append("g.request_type = ?")
+            params.append(request_type)
+        return "WHERE " + " AND ".join(clauses), tuple(params)
+
+def search_query(text: str) -> str:
+    """Turns free text into an FTS5 query matching every word; a trailing `*` keeps prefix matching."""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(terms)
+
+# --- Write-Behind Recording Off the Request Path --- -
+class GenerationHistory:
+    """Buffers records in memory and writes them in batches from a background task.
+
+    `record` only appends to a list, so the request that produced a generation never waits on SQLite.
+    Records still in the buffer are lost if the process is killed; a clean shutdown flushes them.
+    """
+
+    def __init__(self):
+        self.store: HistoryStore | None = None
+        self._pending: list[tuple] = []
+        self._wake: asyncio.Event | None = None
+        self._flushes_since_purge = 0
+        self.counters = {"recorded": 0, "written": 0, "dropped": 0, "flushes": 0, "write_errors": 0, "cache_lookups": 0}
+
+    def open(self, path: str):
+        self.store = HistoryStore(path)
+
+    def record(self, request_type: str, inputs_hash: str, model: str, prompt: str, output: str, usage: dict | None,
+               latency_seconds: float, streamed: bool = False):
+        if self.store is None:
+            return
+        usage = usage if isinstance(usage, dict) else {}
+        details = usage.get("prompt_tokens_details") or usage.get("input_tokens_details") or {}
+        self._pending.append((
+            time.time(), request_type, current_route(), inputs_hash, model, prompt, output,
+            usage.get("prompt_tokens", usage.get("input_tokens")),
+            usage.get("completion_tokens", usage.get("output_tokens")),
+            details.get("cached_tokens") if isinstance(details, dict) else None,
+            round(latency_seconds * 1000, 1),
+            int(streamed),
+            current_caller(),
+        ))
+        self.counters["recorded"] += 1
+        if len(self._pending) > config.HISTORY_MAX_PENDING:
+            # The store is not keeping up: losing the oldest history beats growing without bound
+            del self._pending[0]
+            self.counters["dropped"] += 1
+            history_records.inc(outcome="dropped")
+        if len(self._pending) >= config.HISTORY_BATCH_SIZE and self._wake is not None:
+            self._wake.set()
+
+    async def flush(self):
+        if self.store is None or not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self.store.insert_many, batch)
+        except sqlite3.Error as e:
+            self.counters["write_errors"] += 1
+            history_records.inc(len(batch), outcome="failed")
+            logger.warning("Could not write %d history record(s): %s", len(batch), e)
+            return
+        self.counters["written"] += len(batch)
+        self.counters["flushes"] += 1
+        history_records.inc(len(batch), outcome="written")
+
+    async def flush_forever(self, interval: float):
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+            self._flushes_since_purge += 1
+            if config.HISTORY_RETENTION_DAYS and self._flushes_since_purge >= 1000:
+                self._flushes_since_purge = 0
+                await self.purge()
+
+    async def purge(self):
+        try:
+            purged = await asyncio.to_thread(self.store.purge, time.time() - config.HISTORY_RETENTION_DAYS * 86400)
+        except sqlite3.Error as e:
+            logger.warning("History purge failed: %s", e)
+            return
+        if purged:
+            logger.info("Purged %d history record(s) older than %d days", purged, config.HISTORY_RETENTION_DAYS)
+
+    async def lookup(self, inputs_hash: str, not_before: float) -> tuple[str, float] | None:
+        """Response cache tier: a recent generation with the same inputs, written by any worker process."""
+        if self.store is None:
+            return None
+        self.counters["cache_lookups"] += 1
+        try:
+            return await asyncio.to_thread(self.store.lookup, inputs_hash, not_before)
+        except sqlite3.Error as e:
+            logger.warning("History lookup failed: %s", e)
+            return None
+
+    async def close(self):
+        if self.store is None:
+            return
+        await self.flush()
+        self.store.close()
+        self.store = None
+
+    def stats(self) -> dict:
+        return {**self.counters, "pending": len(self._pending), "enabled": self.store is not None}
+
+generation_history = GenerationHistory()
@@ -0,0 +1,43 @@
+import httpx
+import logging
+from fastapi import Request
+import config
+
+logger = logging.getLogger(__name__)
+
+# --- Shared HTTP Client for Upstream Calls --- -
+def create_http_client() -> httpx.AsyncClient:
+    """Creates the pooled client used for all OpenAI calls (keep-alive, HTTP/2, per-phase timeouts)."""
+    http2 = config.HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401 - only needed to check HTTP/2 support is installed
+        except ImportError:
+            logger.warning("HTTP/2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=config.HTTP_CONNECT_TIMEOUT,
+        read=config.HTTP_READ_TIMEOUT,
+        write=config.HTTP_WRITE_TIMEOUT,
+        pool=config.HTTP_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+def timeout_within(seconds: float) -> httpx.Timeout:
+    """Per-phase timeouts capped so a single call cannot outlive the remaining request deadline."""
+    return httpx.Timeout(
+        connect=min(config.HTTP_CONNECT_TIMEOUT, seconds),
+        read=min(config.HTTP_READ_TIMEOUT, seconds),
+        write=min(config.HTTP_WRITE_TIMEOUT, seconds),
+        pool=min(config.HTTP_POOL_TIMEOUT, seconds),
+    )
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    """FastAPI dependency returning the client created in the app lifespan."""
+    return request.app.state.http_client
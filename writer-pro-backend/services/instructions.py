@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+from services.tokens import count_tokens
+
+# --- Registered System Instructions, Referenced by Content Hash --- -
+def instruction_hash(instruction: str) -> str:
+    return hashlib.sha256(instruction.encode("utf-8")).hexdigest()
+
+class InstructionStore:
+    """Instructions keyed by their SHA-256, in SQLite so a hash registered on one worker process resolves on all of them.
+
+    Entries never change once written, so the in-process LRU in front of SQLite needs no invalidation.
+    Database calls block; `get` is meant to run in a thread. `_lock` guards the connection and `_memory_lock`
+    the LRU, which worker threads update while `cached` reads it on the event loop.
+    """
+
+    def __init__(self, path: str, memory_entries: int):
+        self.memory_entries = memory_entries
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS instructions (
+                hash TEXT PRIMARY KEY,
+                instruction TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+
+    def register(self, instruction: str) -> dict:
+        key = instruction_hash(instruction)
+        tokens = count_tokens(instruction)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO instructions (hash, instruction, tokens, created_at) VALUES (?, ?, ?, ?)",
+                (key, instruction, tokens, time.time()),
+            )
+        self._remember(key, instruction)
+        return {"hash": key, "tokens": tokens, "characters": len(instruction)}
+
+    def cached(self, key: str) -> str | None:
+        """Memory-only lookup, safe to call on the event loop."""
+        with self._memory_lock:
+            instruction = self._memory.get(key)
+            if instruction is not None:
+                self._memory.move_to_end(key)
+        return instruction
+
+    def get(self, key: str) -> str | None:
+        instruction = self.cached(key)
+        if instruction is not None:
+            return instruction
+        with self._lock:
+            row = self._conn.execute("SELECT instruction FROM instructions WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._remember(key, row[0])
+        return row[0]
+
+    def describe(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT tokens, length(instruction), created_at FROM instructions WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return {"hash": key, "tokens": row[0], "characters": row[1], "createdAt": row[2]}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, key: str, instruction: str):
+        with self._memory_lock:
+            self._memory[key] = instruction
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+async def resolve_instruction(store: InstructionStore, instruction: str | None, key: str | None, default: str | None = None) -> str | None:
+    """The inline instruction if given, else the registered one for `key` (404 if unknown), else `default`."""
+    if key and not instruction:
+        resolved = store.cached(key) or await asyncio.to_thread(store.get, key)
+        if resolved is None:
+            raise HTTPException(status_code=404, detail=f"Unknown instruction_hash '{key}'. Register the instruction with POST /instructions first.")
+        return resolved
+    if default is not None:
+        return instruction or default
+    return instruction
+
+def get_instruction_store(request: Request) -> InstructionStore:
+    """FastAPI dependency returning the store opened in the app lifespan."""
+    return request.app.state.instruction_store
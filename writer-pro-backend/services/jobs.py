@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import httpx
+from fastapi import HTTPException, Request
+import config
+from services.metrics import start_background
+from services.openai import call_openai_api
+from services.prompts import build_outline_prompt
+from services.ratelimit import act_for_caller
+
+logger = logging.getLogger(__name__)
+
+# --- Background Job Queue with a Shared SQLite Store --- -
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+class JobStore:
+    """Job rows in SQLite (WAL), so several uvicorn worker processes can share one queue. Calls block."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                worker_id TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat_at REAL,
+                expires_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)")
+
+    def submit(self, job_type: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, type, status, payload, created_at, expires_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, job_type, json.dumps(payload), now, now + config.JOB_RESULT_TTL_SECONDS),
+            )
+        return job_id
+
+    def claim_next(self, worker_id: str):
+        """Atomically moves the oldest queued job to 'running' for this worker."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                """UPDATE jobs SET status = 'running', worker_id = ?, started_at = ?, heartbeat_at = ?
+                   WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1)
+                   RETURNING id, type, payload""",
+                (worker_id, now, now),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Refreshes the lease; False means the job was cancelled (or taken over) and should stop."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running' AND worker_id = ?",
+                (time.time(), job_id, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: str, worker_id: str, status: str, result: str | None = None, error: dict | None = None):
+        with self._lock:
+            self._conn.execute(
+                """UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?
+                   WHERE id = ? AND status = 'running' AND worker_id = ?""",
+                (status, result, json.dumps(error) if error else None, time.time(), job_id, worker_id),
+            )
+
+    def requeue(self, job_id: str, worker_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL WHERE id = ? AND status = 'running' AND worker_id = ?",
+                (job_id, worker_id),
+            )
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            )
+        return cursor.rowcount == 1
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, type, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ? AND expires_at > ?",
+                (job_id, time.time()),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def maintain(self) -> tuple[int, int]:
+        """Requeues jobs whose worker died mid-run and deletes expired jobs."""
+        now = time.time()
+        with self._lock:
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL WHERE status = 'running' AND heartbeat_at < ?",
+                (now - config.JOB_STALE_SECONDS,),
+            ).rowcount
+            purged = self._conn.execute("DELETE FROM jobs WHERE expires_at < ?", (now,)).rowcount
+        return requeued, purged
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# --- Job Handlers --- -
+async def run_outline_job(payload: dict, client: httpx.AsyncClient):
+    # Same template as /generate-outline, so a job and a direct request for the same description share a cache entry
+    return await call_openai_api(build_outline_prompt(payload["contentDescription"]), payload["base_system_instruction"], None, "outline", client)
+
+JOB_HANDLERS = {
+    "outline": run_outline_job,
+}
+
+class JobWorkerPool:
+    """A bounded set of asyncio workers per process that claim jobs from the shared store."""
+
+    def __init__(self, store: JobStore, client: httpx.AsyncClient, size: int):
+        self.store = store
+        self.client = client
+        self.size = size
+        self.worker_prefix = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks = []
+        self._maintenance_task = None
+        self._draining = False
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker(f"{self.worker_prefix}-{n}")) for n in range(self.size)]
+        self._maintenance_task = asyncio.create_task(self._maintenance())
+        logger.info("Started %d job workers (%s)", self.size, self.worker_prefix)
+
+    def drain(self):
+        """Stops claiming new jobs; jobs already running carry on."""
+        self._draining = True
+
+    async def stop(self, grace_seconds: float = 0):
+        """Lets running jobs finish for up to `grace_seconds`, then cancels them; cancelled jobs go back to the queue."""
+        self.drain()
+        self._maintenance_task.cancel()
+        if grace_seconds > 0 and self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=grace_seconds)
+            if pending:
+                logger.warning("%d job(s) still running after %.0fs, requeueing them", len(pending), grace_seconds)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, self._maintenance_task, return_exceptions=True)
+
+    async def _worker(self, worker_id: str):
+        while not self._draining:
+            try:
+                job = await asyncio.to_thread(self.store.claim_next, worker_id)
+            except sqlite3.Error as e:
+                logger.error("Job worker %s could not claim a job: %s", worker_id, e)
+                job = None
+            if job is None:
+                await asyncio.sleep(config.JOB_POLL_INTERVAL)
+                continue
+            try:
+                if self._draining:
+                    # Claimed just as the drain started: give it to a worker that is staying up
+                    await asyncio.to_thread(self.store.requeue, job["id"], worker_id)
+                    return
+                await self._run(job, worker_id)
+            except Exception as e:
+                # Usually the store failing to record the outcome ("database is locked"); the worker must outlive it
+                logger.exception("Job worker %s failed on job %s: %s", worker_id, job["id"], e)
+                await self._mark_failed(job["id"], worker_id)
+
+    async def _mark_failed(self, job_id: str, worker_id: str):
+        try:
+            await asyncio.to_thread(self.store.finish, job_id, worker_id, "failed", None, {"status": 500, "detail": "Job failed due to an internal error."})
+        except sqlite3.Error as e:
+            # Its heartbeat stops here, so maintenance requeues it once the lease goes stale
+            logger.error("Could not mark job %s failed, leaving it to maintenance: %s", job_id, e)
+
+    async def _run(self, job: dict, worker_id: str):
+        logger.info("Worker %s running %s job %s", worker_id, job["type"], job["id"])
+        handler = JOB_HANDLERS.get(job["type"])
+        if handler is None:
+            await asyncio.to_thread(self.store.finish, job["id"], worker_id, "failed", None, {"status": 400, "detail": f"Unknown job type '{job['type']}'."})
+            return
+
+        # Spans and token usage from this job are labelled with the job type instead of an HTTP route
+        start_background(f"job:{job['type']}")
+        payload = json.loads(job["payload"])
+        # Charged to the caller's token quota like a request of theirs; jobs from before callers were stored charge nobody
+        act_for_caller(payload.get("caller"))
+        task = asyncio.create_task(handler(payload, self.client))
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=1.0)
+                if not task.done() and not await self._heartbeat(job["id"], worker_id):
+                    # Cancelled through the API (possibly from another process): stop the upstream call
+                    logger.info("Job %s was cancelled, stopping it", job["id"])
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    return
+        except asyncio.CancelledError:
+            # Server shutting down: hand the job back to the queue for another process
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.to_thread(self.store.requeue, job["id"], worker_id)
+            raise
+
+        try:
+            result = task.result()
+        except HTTPException as e:
+            await asyncio.to_thread(self.store.finish, job["id"], worker_id, "failed", None, {"status": e.status_code, "detail": e.detail})
+            return
+        except Exception as e:
+            logger.exception("Job %s failed unexpectedly: %s", job["id"], e)
+            await self._mark_failed(job["id"], worker_id)
+            return
+        await asyncio.to_thread(self.store.finish, job["id"], worker_id, "succeeded", result)
+        logger.info("Job %s succeeded, %d characters", job["id"], len(result))
+
+    async def _heartbeat(self, job_id: str, worker_id: str) -> bool:
+        try:
+            return await asyncio.to_thread(self.store.heartbeat, job_id, worker_id)
+        except sqlite3.Error as e:
+            # One missed heartbeat is harmless; the lease only goes stale after JOB_STALE_SECONDS
+            logger.warning("Heartbeat for job %s failed: %s", job_id, e)
+            return True
+
+    async def _maintenance(self):
+        while True:
+            await asyncio.sleep(60)
+            try:
+                requeued, purged = await asyncio.to_thread(self.store.maintain)
+                if requeued or purged:
+                    logger.info("Requeued %d stale jobs, purged %d expired jobs", requeued, purged)
+            except sqlite3.Error as e:
+                logger.error("Job maintenance failed: %s", e)
+
+def get_job_store(request: Request) -> JobStore:
+    """FastAPI dependency returning the store opened in the app lifespan."""
+    return request.app.state.job_store
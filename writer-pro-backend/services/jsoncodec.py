@@ -0,0 +1,40 @@
+import json
+import logging
+from typing import Any
+from fastapi.responses import JSONResponse
+import config
+
+logger = logging.getLogger(__name__)
+
+# --- JSON Encoding/Decoding with the Fastest Installed Backend --- -
+def _stdlib_dumps(obj: Any) -> bytes:
+    # Same output httpx and Starlette produce (compact, UTF-8, no NaN), so switching backends changes no bytes on the wire
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+def _select_backend(preferred: str):
+    """Returns (name, dumps, loads); `dumps` always returns bytes and `loads` accepts bytes or str."""
+    if preferred in ("auto", "orjson"):
+        try:
+            import orjson
+            return "orjson", orjson.dumps, orjson.loads
+        except ImportError:
+            if preferred == "orjson":
+                logger.warning("JSON_BACKEND=orjson but orjson is not installed, falling back")
+    if preferred in ("auto", "orjson", "msgspec"):
+        try:
+            import msgspec
+            encoder = msgspec.json.Encoder()
+            decoder = msgspec.json.Decoder()
+            return "msgspec", encoder.encode, decoder.decode
+        except ImportError:
+            if preferred == "msgspec":
+                logger.warning("JSON_BACKEND=msgspec but msgspec is not installed, falling back")
+    return "json", _stdlib_dumps, json.loads
+
+JSON_BACKEND, dumps, loads = _select_backend(config.JSON_BACKEND)
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: renders with the selected backend instead of json.dumps."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
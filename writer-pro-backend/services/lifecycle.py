@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import signal
+import threading
+import time
+from urllib.parse import urlsplit
+import httpx
+import config
+from services.router import model_router
+from services.tokens import get_encoding
+
+logger = logging.getLogger(__name__)
+
+# --- Process Lifecycle: Readiness, In-Flight Requests and Graceful Drain --- -
+class Lifecycle:
+    """Whether this worker should receive traffic: `starting` until warm-up ends, then `ready`, then `draining`."""
+
+    def __init__(self):
+        self.state = "starting"
+        self.created = time.monotonic()
+        self.ready_seconds: float | None = None
+        self.drain_started: float | None = None
+        self.in_flight = 0
+        self.warmup: dict = {}
+        self._drain_callbacks = []
+
+    def reset(self):
+        """Back to `starting` for a new app lifespan (tests and reloads run several in one process)."""
+        self.state = "starting"
+        self.ready_seconds = None
+        self.drain_started = None
+        self.warmup = {}
+        self._drain_callbacks = []
+
+    def mark_ready(self):
+        if self.state == "starting":
+            self.state = "ready"
+            self.ready_seconds = time.monotonic() - self.created
+            logger.info("Ready after %.2fs", self.ready_seconds)
+
+    def on_drain(self, callback):
+        self._drain_callbacks.append(callback)
+
+    def begin_drain(self):
+        if self.state == "draining":
+            return
+        self.state = "draining"
+        self.drain_started = time.monotonic()
+        logger.info("Draining: %d request(s) in flight", self.in_flight)
+        for callback in self._drain_callbacks:
+            callback()
+
+    def install_drain_handler(self, delay: float):
+        """Marks the worker as draining on SIGTERM/SIGINT before passing the signal on to the server.
+
+        Chains onto the handler uvicorn installs while it serves, which it restores on exit. With `delay`,
+        the server keeps accepting requests for that long while /readyz fails, so a load balancer can
+        deregister this worker before its listening socket closes.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return  # Signals only reach the main thread (e.g. not under a test client)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                first = self.state != "draining"
+                loop.call_soon_threadsafe(self.begin_drain)
+                if first and delay > 0:
+                    loop.call_soon_threadsafe(loop.call_later, delay, previous, signum, frame)
+                else:
+                    previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+    def snapshot(self) -> dict:
+        return {
+            "status": self.state,
+            "uptimeSeconds": round(time.monotonic() - self.created, 3),
+            "readyAfterSeconds": None if self.ready_seconds is None else round(self.ready_seconds, 3),
+            "inFlight": self.in_flight,
+            "warmup": self.warmup,
+        }
+
+lifecycle = Lifecycle()
+
+class InFlightMiddleware:
+    """Pure ASGI middleware counting HTTP requests that have not finished sending their response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        lifecycle.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lifecycle.in_flight -= 1
+
+# --- Warm-Up: DNS, Upstream Connections and the Tokenizer --- -
+async def warm_provider(client: httpx.AsyncClient, provider) -> dict:
+    """Resolves the provider's host and opens `WARMUP_CONNECTIONS` pooled connections with a cheap request."""
+    parts = urlsplit(provider.url)
+    started = time.perf_counter()
+    await asyncio.get_running_loop().getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+    dns_ms = (time.perf_counter() - started) * 1000
+    # Listing models is free and served by OpenAI-compatible servers; any status means the connection is up
+    models_url = provider.url.rsplit("/chat/completions", 1)[0] + "/models"
+    try:
+        headers = provider.headers()
+    except Exception:
+        headers = {}
+    responses = await asyncio.gather(
+        *(client.get(models_url, headers=headers) for _ in range(config.WARMUP_CONNECTIONS)), return_exceptions=True
+    )
+    errors = [str(r) for r in responses if isinstance(r, Exception)]
+    return {"dnsMs": round(dns_ms, 1), "connectMs": round((time.perf_counter() - started) * 1000 - dns_ms, 1), "errors": errors[:1]}
+
+async def warm_up(client: httpx.AsyncClient):
+    """Runs in the background after startup; /readyz passes once it finishes or times out."""
+    started = time.perf_counter()
+    providers = list(model_router.providers.values())
+
+    async def tokenizer():
+        await asyncio.to_thread(get_encoding)
+        return {"loaded": get_encoding() is not None}
+
+    tasks = {provider.name: warm_provider(client, provider) for provider in providers}
+    tasks["tokenizer"] = tokenizer()
+    try:
+        results = await asyncio.wait_for(asyncio.gather(*tasks.values(), return_exceptions=True), config.WARMUP_TIMEOUT_SECONDS)
+        for name, result in zip(tasks, results):
+            lifecycle.warmup[name] = {"error": str(result)} if isinstance(result, Exception) else result
+    except asyncio.TimeoutError:
+        lifecycle.warmup["timedOut"] = True
+        logger.warning("Warm-up did not finish within %.0fs, serving anyway", config.WARMUP_TIMEOUT_SECONDS)
+    lifecycle.warmup["totalMs"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Warm-up finished in %.0fms", lifecycle.warmup["totalMs"])
+    lifecycle.mark_ready()
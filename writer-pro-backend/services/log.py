@@ -0,0 +1,37 @@
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+import config
+
+_listener: QueueListener | None = None
+
+# --- Non-Blocking Logging Setup --- -
+def configure_logging(level: str | None = None):
+    """Routes all records through a queue so request handlers never block on stdout; a background thread writes them."""
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level or config.LOG_LEVEL)
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(config.LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    root.handlers = [QueueHandler(log_queue)]
+    # httpx logs every request at INFO (and httpcore every socket event at DEBUG), which would drown our own lines
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("httpcore").setLevel(logging.WARNING)
+
+def stop_logging():
+    """Flushes queued records; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
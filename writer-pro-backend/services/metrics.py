@@ -0,0 +1,306 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import os
+import time
+from collections import defaultdict
+from fastapi.routing import APIRoute
+import config
+
+# Seconds; covers sub-millisecond local spans up to full-length model calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+LOOP_LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+# --- Metric Types (Prometheus text exposition format) --- -
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels):
+        self.values[tuple(labels.get(name, "") for name in self.labelnames)] += amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts (non-cumulative, last one is +Inf), sum, count]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """`collect()` returns (name, type, documentation, [(labels dict, value), ...]) tuples, read at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, metric_type, documentation, samples in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "writer_pro_http_requests_total", "HTTP requests handled, by route, method and status.", ("route", "method", "status")))
+http_request_seconds = registry.register(Histogram(
+    "writer_pro_http_request_duration_seconds", "Wall time from request received to last body byte sent.", ("route", "method")))
+span_seconds = registry.register(Histogram(
+    "writer_pro_span_duration_seconds",
+    "Per-request phases: validation, prompt_build, queue_wait, upstream_connect, ttfb, upstream_total, parse, serialize.",
+    ("route", "model", "span")))
+upstream_requests = registry.register(Counter(
+    "writer_pro_upstream_requests_total", "Calls made to the OpenAI API, by outcome status.", ("route", "model", "status")))
+tokens_used = registry.register(Counter(
+    "writer_pro_tokens_total", "Token usage reported by OpenAI in the response 'usage' field.", ("route", "model", "kind")))
+
+event_loop_lag = registry.register(Histogram(
+    "writer_pro_event_loop_lag_seconds", "How late the event loop woke a timer; time spent blocked or saturated.", (), LOOP_LAG_BUCKETS))
+
+# --- Process Health --- -
+async def monitor_event_loop_lag(interval: float):
+    """Runs for the app lifetime; any delay beyond `interval` is time the loop could not serve other requests."""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, loop.time() - scheduled - interval))
+
+def resident_memory_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # No /proc (macOS): fall back to the peak, which getrusage reports in bytes there
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def process_metrics():
+    rss = resident_memory_bytes()
+    if rss is not None:
+        yield ("process_resident_memory_bytes", "gauge", "Resident memory of this server process.", [({}, rss)])
+
+registry.register_collector(process_metrics)
+
+# --- Per-Request Context --- -
+class RequestMetrics:
+    """Label values and timestamps for the request being handled; shared by the tasks it spawns."""
+    __slots__ = ("scope", "route_name", "model", "started", "handler_finished", "disconnected")
+
+    def __init__(self, scope: dict | None = None, route_name: str | None = None):
+        self.scope = scope
+        self.route_name = route_name
+        self.model = ""
+        self.started = time.perf_counter()
+        self.handler_finished = None
+        self.disconnected = False
+
+    @property
+    def route(self) -> str:
+        if self.route_name:
+            return self.route_name
+        # Starlette stores the matched route on the scope; templated paths keep label cardinality bounded
+        route = self.scope.get("route") if self.scope is not None else None
+        return getattr(route, "path", "unmatched")
+
+_current: contextvars.ContextVar[RequestMetrics | None] = contextvars.ContextVar("request_metrics", default=None)
+
+def start_background(route_name: str):
+    """Labels work done outside an HTTP request (e.g. job workers) with `route_name`."""
+    _current.set(RequestMetrics(route_name=route_name))
+
+def current_route() -> str:
+    request = _current.get()
+    return request.route if request is not None else "background"
+
+def mark_disconnected():
+    """Counts the current request as 499 (client closed request), whatever status it had started to send."""
+    request = _current.get()
+    if request is not None:
+        request.disconnected = True
+
+def observe_span(span: str, seconds: float, model: str = ""):
+    request = _current.get()
+    if request is None:
+        route = "background"
+    else:
+        route = request.route
+        if model:
+            request.model = model
+        else:
+            model = request.model
+    span_seconds.observe(seconds, route=route, model=model, span=span)
+
+def record_upstream(model: str, status: int | str):
+    upstream_requests.inc(route=current_route(), model=model, status=str(status))
+
+def record_usage(model: str, usage: dict | None):
+    """Counts prompt/completion/cached tokens; accepts both chat completions and Responses API field names."""
+    if not isinstance(usage, dict):
+        return
+    route = current_route()
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+    completion = usage.get("completion_tokens", usage.get("output_tokens"))
+    details = usage.get("prompt_tokens_details") or usage.get("input_tokens_details") or {}
+    cached = details.get("cached_tokens") if isinstance(details, dict) else None
+    for kind, value in (("prompt", prompt), ("completion", completion), ("cached", cached)):
+        if isinstance(value, (int, float)) and value:
+            tokens_used.inc(value, route=route, model=model, kind=kind)
+
+def average_completion_tokens(model: str) -> float:
+    """Mean completion tokens per successful upstream call to `model` so far; 0 before the first."""
+    completion = sum(value for (_, name, kind), value in tokens_used.values.items() if name == model and kind == "completion")
+    calls = sum(value for (_, name, status), value in upstream_requests.values.items() if name == model and status == "200")
+    return completion / calls if calls else 0.0
+
+def token_usage_summary() -> dict:
+    """Token totals per route since start, with the share of prompt tokens OpenAI served from its prompt cache."""
+    totals: dict[str, dict] = {}
+    for (route, _, kind), value in list(tokens_used.values.items()):
+        entry = totals.setdefault(route, {"prompt": 0, "completion": 0, "cached": 0})
+        entry[kind] += int(value)
+    for entry in totals.values():
+        entry["cached_ratio"] = round(entry["cached"] / entry["prompt"], 4) if entry["prompt"] else 0.0
+    return totals
+
+class UpstreamTrace:
+    """httpx 'trace' extension callback that turns connection events into upstream_connect and ttfb spans."""
+    __slots__ = ("model", "marks")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.marks: dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: dict):
+        # e.g. "connection.connect_tcp.started", "http11.receive_response_headers.complete"
+        _, _, event = event_name.partition(".")
+        now = time.perf_counter()
+        self.marks[event] = now
+        if event == "send_request_headers.started":
+            # Only new connections report connect/TLS events; reused keep-alive connections skip this span
+            connected = self.marks.get("start_tls.complete") or self.marks.get("connect_tcp.complete")
+            if connected is not None and "connect_tcp.started" in self.marks:
+                observe_span("upstream_connect", connected - self.marks["connect_tcp.started"], self.model)
+        elif event == "receive_response_headers.complete" and "send_request_headers.started" in self.marks:
+            observe_span("ttfb", now - self.marks["send_request_headers.started"], self.model)
+
+# --- Middleware and Route Class --- -
+class MetricsMiddleware:
+    """Pure ASGI middleware (no response buffering) that times every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics(scope)
+        token = _current.set(request)
+        status = 500
+        streaming = False
+
+        async def send_with_metrics(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-type":
+                        streaming = value.startswith((b"text/event-stream", b"application/x-ndjson"))
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Serialization only means something for buffered responses; streams are measured by their spans
+                if request.handler_finished is not None and not streaming:
+                    observe_span("serialize", time.perf_counter() - request.handler_finished)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            route = request.route
+            if request.disconnected:
+                status = 499
+            http_requests.inc(route=route, method=scope["method"], status=str(status))
+            http_request_seconds.observe(time.perf_counter() - request.started, route=route, method=scope["method"])
+            _current.reset(token)
+
+class TimedRoute(APIRoute):
+    """Marks when the endpoint starts and returns, so body parsing/validation and serialization get their own spans."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            request = _current.get()
+            if request is not None:
+                observe_span("validation", time.perf_counter() - request.started)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                if request is not None:
+                    request.handler_finished = time.perf_counter()
+
+        super().__init__(path, timed_endpoint if config.METRICS_ENABLED else endpoint, **kwargs)
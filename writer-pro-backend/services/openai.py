@@ -1,17 +1,35 @@
+import asyncio
 import httpx
-import json
+import logging
+import time
 from fastapi import HTTPException
 import config
+from services.cache import fingerprint, response_cache
+from services.deadlines import cancel_reason, record_cancelled, request_deadline
+from services.history import generation_history
+from services.http_client import create_http_client, timeout_within
+from services.jsoncodec import dumps, loads
+from services.metrics import UpstreamTrace, observe_span, record_upstream, record_usage
+from services.prompts import build_reply_prompt
+from services.ratelimit import charge_usage
+from services.resilience import resilient_caller
+from services.router import FAILOVER_STATUS_CODES, Candidate, model_router
+from services.scheduler import DeadlineExceeded, estimate_tokens, upstream_scheduler
+from services.singleflight import upstream_calls
+from services.tokens import completion_budget, count_tokens
+
+logger = logging.getLogger(__name__)
 
 # --- Helper Function to Extract Text from OpenAI Response --- -
 def extract_text_from_output(output_data):
     """Helper function to extract text from various output formats"""
-    # Minimal print: only log the type and length if it's a list/dict
-    output_type = type(output_data).__name__
-    if isinstance(output_data, (list, dict)):
-        print(f"[OPENAI_PARSE] Input type: {output_type}, Size: {len(output_data)}")
-    else:
-        print(f"[OPENAI_PARSE] Input type: {output_type}")
+    # Minimal log: only the type and length if it's a list/dict
+    if logger.isEnabledFor(logging.DEBUG):
+        output_type = type(output_data).__name__
+        if isinstance(output_data, (list, dict)):
+            logger.debug("Parsing input type: %s, Size: %d", output_type, len(output_data))
+        else:
+            logger.debug("Parsing input type: %s", output_type)
 
     # If output_data is a string, return it directly
     if isinstance(output_data, str):
@@ -37,7 +55,7 @@ def extract_text_from_output(output_data):
                             search_text.append(result["text"])
                     if search_text:
                         combined = "\n\n".join(search_text)
-                        print(f"[OPENAI_PARSE] Extracted text from web search, length: {len(combined)}")
+                        logger.debug("Extracted text from web search, length: %d", len(combined))
                         return combined
 
             # Case 1.1: Item is a message with content
@@ -62,12 +80,6 @@ def extract_text_from_output(output_data):
 
     # Case 2: Output is a dictionary
     elif isinstance(output_data, dict):
-        # Print keys safely to avoid serialization errors
-        try:
-            key_list = list(output_data.keys())
-        except Exception as e:
-            print(f"[OPENAI_PARSE] Error listing dictionary keys: {e}")
-
         # Case 2.1: Direct text field
         if output_data.get("text"):
             return output_data.get("text")
@@ -90,27 +102,96 @@ def extract_text_from_output(output_data):
                 return output_data["content"]
 
     # If we've tried everything and found nothing
-    print("[OPENAI_PARSE] Could not extract text from primary fields")
+    logger.debug("Could not extract text from primary fields")
     return None
 
-# --- Helper Function to Call OpenAI --- -
-async def call_openai_api(user_prompt: str, config_page_instruction: str, custom_instruction: str | None, request_type: str = "outline"):
-    print(f"[OPENAI_API] Requesting '{request_type}'. Prompt len: {len(user_prompt)}, Instruction len: {len(config_page_instruction)}")
+# --- Single-Pass Parser for the Known Response Shapes --- -
+def _message_text(message: dict):
+    """Text of a Responses API message item: its output_text parts joined in order."""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if not isinstance(content, list):
+        return None
+    parts = [part["text"] for part in content if isinstance(part, dict) and isinstance(part.get("text"), str)]
+    return "".join(parts) or None
 
-    if not config.OPENAI_API_KEY or config.OPENAI_API_KEY == "YOUR_OPENAI_API_KEY_HERE":
-        print("[ERROR] OpenAI API key not configured")
-        raise HTTPException(status_code=500, detail="OpenAI API key not configured on the server.")
+def parse_completion(data):
+    """Returns (text, usage) for chat completions, Responses API `output` lists and web_search_call results.
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {config.OPENAI_API_KEY}",
-    }
+    Each shape is recognised by its top-level key and walked once; anything else goes through
+    extract_text_from_output.
+    """
+    if not isinstance(data, dict):
+        return extract_text_from_output(data), None
+    usage = data.get("usage")
+
+    # Chat completions: choices[0].message.content (a string, or a list of content parts)
+    choices = data.get("choices")
+    if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+        message = choices[0].get("message")
+        if isinstance(message, dict):
+            text = _message_text(message)
+            if text:
+                return text, usage
+
+    # Responses API: message items hold the answer; web search results are only used when there is no message
+    output = data.get("output")
+    if isinstance(output, list):
+        message_text = None
+        search_text = []
+        for item in output:
+            if not isinstance(item, dict):
+                continue
+            item_type = item.get("type")
+            if item_type == "message":
+                text = _message_text(item)
+                if text:
+                    message_text = text if message_text is None else message_text + text
+            elif item_type == "web_search_call" and isinstance(item.get("web_search_results"), list):
+                search_text.extend(result["text"] for result in item["web_search_results"] if isinstance(result, dict) and result.get("text"))
+        if message_text:
+            return message_text, usage
+        if search_text:
+            return "\n\n".join(search_text), usage
+        return None, usage
+
+    return extract_text_from_output(data), usage
 
+# --- Incremental Parsing for Streamed Responses --- -
+def parse_sse_line(line: str):
+    """Returns the payload of an SSE 'data:' line, or None for blank lines, comments and other fields"""
+    if not line.startswith("data:"):
+        return None
+    return line[5:].strip()
+
+def extract_text_from_delta(chunk):
+    """Helper function to extract the text delta from a single streamed chunk"""
+    if not isinstance(chunk, dict):
+        return None
+
+    # Case 1: Chat completions chunk -> choices[0].delta.content
+    choices = chunk.get("choices")
+    if isinstance(choices, list):
+        if choices and isinstance(choices[0], dict):
+            delta = choices[0].get("delta")
+            if isinstance(delta, dict) and isinstance(delta.get("content"), str):
+                return delta["content"]
+        return None
+
+    # Case 2: Responses API event -> {"type": "response.output_text.delta", "delta": "..."}
+    if chunk.get("type") == "response.output_text.delta" and isinstance(chunk.get("delta"), str):
+        return chunk["delta"]
+
+    return None
+
+# --- Request Building Shared by Blocking and Streaming Calls --- -
+def build_request_body(user_prompt: str, config_page_instruction: str, request_type: str, max_tokens: int | None = None, model: str | None = None):
     # Just use the ConfigPage instruction directly, no extra words
     instruction = config_page_instruction
 
-    # Set model based on request type
-    model = config.MODELS.get(request_type, config.MODELS["outline"])
+    # Set model based on request type, unless the router picked one
+    model = model or config.MODELS.get(request_type, config.MODELS["outline"])
 
     # Create a simpler request body structure that works with current API
     request_body = {
@@ -125,7 +206,7 @@ async def call_openai_api(user_prompt: str, config_page_instruction: str, custom
                 "content": user_prompt
             }
         ],
-        "max_tokens": 2048
+        "max_tokens": max_tokens or config.DEFAULT_MAX_TOKENS
     }
     
     # Add model-specific parameters
@@ -138,92 +219,286 @@ async def call_openai_api(user_prompt: str, config_page_instruction: str, custom
         request_body["temperature"] = 1.0
         request_body["top_p"] = 1.0
 
-    # Print summarized version of request for debugging
-    print(f"[OPENAI_API] Request params: model={model}, max_tokens={request_body['max_tokens']}")
-    
-    # Debug the request body for search-enabled models
-    if "search" in model:
-        print(f"[OPENAI_API] Search model params include: {list(request_body.keys())}")
+    # Log summarized version of request for debugging
+    logger.debug("Request params: model=%s, max_tokens=%d", model, request_body["max_tokens"])
 
-    async with httpx.AsyncClient(timeout=60.0) as client: # Increased timeout
-        try:
-            print(f"[OPENAI_API] Sending request to {config.OPENAI_API_URL}...")
-            response = await client.post(config.OPENAI_API_URL, headers=headers, json=request_body)
-            print(f"[OPENAI_API] Response status: {response.status_code}")
+    return request_body
 
-            response.raise_for_status()  # Raise exception for bad status codes (4xx or 5xx)
-            data = response.json()
+def http_exception_from_status_error(e: httpx.HTTPStatusError):
+    try:
+        error_detail = e.response.json()
+        # Log only essential error message if available
+        error_message = error_detail.get("error", {}).get("message", "No message provided")
+        logger.warning("OpenAI API returned %d: %s", e.response.status_code, error_message)
+        detail = error_message
+    except Exception:
+        # Log limited raw text on parsing failure
+        error_text = e.response.text[:200] # Limit length
+        logger.warning("OpenAI API returned %d, could not parse error body. Raw start: %s...", e.response.status_code, error_text)
+        detail = f"OpenAI API error: {e.response.status_code} - Check logs for details."
+    # Pass Retry-After through so the scheduler (and the client) can back off for as long as upstream asks
+    retry_after = e.response.headers.get("Retry-After")
+    headers = {"Retry-After": retry_after} if retry_after else None
+    return HTTPException(status_code=e.response.status_code, detail=detail, headers=headers)
 
-            # Extract text from response using simpler ChatGPT API structure
-            print("[OPENAI_API] Attempting to extract text from response...")
-            
-            if "choices" in data and len(data["choices"]) > 0:
-                content = data["choices"][0].get("message", {}).get("content", "")
-                if content:
-                    print(f"[OPENAI_API] Extracted text via 'choices', length: {len(content)}")
-                    return content
-                    
-            # Fallback to more complex parsing if needed
-            print("[OPENAI_API] Using fallback extraction logic...")
-            output_content = extract_text_from_output(data)
+# --- Helper Function to Call OpenAI --- -
+async def call_openai_api(user_prompt: str, config_page_instruction: str, custom_instruction: str | None, request_type: str = "outline", client: httpx.AsyncClient | None = None, use_cache: bool = True, max_tokens: int | None = None):
+    if client is None:
+        # Outside the app (scripts, one-off calls) there is no shared client, so open a temporary one
+        async with create_http_client() as owned_client:
+            return await call_openai_api(user_prompt, config_page_instruction, custom_instruction, request_type, owned_client, use_cache, max_tokens)
+
+    logger.debug("Requesting '%s'. Prompt len: %d, Instruction len: %d", request_type, len(user_prompt), len(config_page_instruction))
+
+    build_started = time.perf_counter()
+    # Keyed on the body for the preferred model, so routing to another candidate still shares the cache entry
+    request_body = build_request_body(user_prompt, config_page_instruction, request_type, max_tokens)
+    candidates = route_request(user_prompt, config_page_instruction, request_type, request_body["max_tokens"])
+    observe_span("prompt_build", time.perf_counter() - build_started, candidates[0].key)
+
+    request_key = fingerprint(request_body)
+    cacheable = response_cache.is_enabled(request_type)
+    if use_cache and cacheable:
+        cached = await response_cache.get(request_key)
+        if cached is not None:
+            logger.debug("Cache hit for '%s', length: %d", request_type, len(cached))
+            return cached
+
+    deadline = request_deadline(request_type)
+    # Model and token usage of the attempt that produced the answer, for the history record
+    outcome = {}
+
+    async def call_candidate(candidate: Candidate, max_attempts: int):
+        headers = candidate.provider.headers()
+        body = request_body if candidate.model == request_body["model"] else build_request_body(user_prompt, config_page_instruction, request_type, max_tokens, candidate.model)
+
+        async def attempt(timeout_seconds: float, upstream_started: asyncio.Event):
+            tokens = estimate_tokens(body)
+            start = time.monotonic()
+            try:
+                async with upstream_scheduler.slot(candidate.key, request_type, tokens, deadline):
+                    upstream_started.set()
+                    start = time.monotonic()
+                    try:
+                        content = await post_completion(client, headers, body, timeout_seconds, candidate, outcome)
+                    except HTTPException as e:
+                        if e.status_code in FAILOVER_STATUS_CODES:
+                            model_router.record_failure(candidate.key)
+                        raise
+            except asyncio.CancelledError:
+                # Client gone or deadline hit: leaving the slot here also closes the upstream connection
+                reason = cancel_reason(deadline)
+                if reason is not None:
+                    stage = "in_flight" if upstream_started.is_set() else "queued"
+                    record_cancelled(candidate.key, reason, stage, time.monotonic() - start, tokens - body["max_tokens"])
+                raise
+            elapsed = time.monotonic() - start
+            resilient_caller.record_latency(candidate.key, elapsed)
+            model_router.record_success(candidate.key, elapsed)
+            return content
+
+        # Retries, hedging and the circuit breaker wrap each scheduled attempt
+        return await resilient_caller.call(candidate.key, attempt, deadline, max_attempts)
+
+    async def fetch():
+        # Tries the routed candidates in order, failing over on provider errors
+        content = await model_router.call(candidates, call_candidate, deadline)
+        if cacheable:
+            await response_cache.set(request_key, content)
+        return content, outcome.get("model", candidates[0].key), outcome.get("usage")
+
+    # Identical concurrent requests (double clicks, several tabs) share one upstream call. The call runs in the context
+    # of whichever request started it, so each request charges and records the answer under its own caller here.
+    started = time.monotonic()
+    content, model, usage = await upstream_calls.do(request_key, fetch, deadline)
+    charge_usage(usage)
+    generation_history.record(request_type, request_key, model, user_prompt, content, usage, time.monotonic() - started)
+    return content
+
+def route_request(user_prompt: str, config_page_instruction: str, request_type: str, max_tokens: int) -> list[Candidate]:
+    input_tokens = count_tokens(user_prompt)
+    return model_router.route(request_type, count_tokens(config_page_instruction) + input_tokens, max_tokens, input_tokens)
+
+def deadline_cut_off(error: httpx.RequestError, deadline: float | None) -> bool:
+    """Whether `error` is a timeout that only fired because its phases were capped at the request deadline.
+
+    That is our budget running out, not the upstream failing, so it must not count against the breaker or router.
+    """
+    return isinstance(error, httpx.TimeoutException) and deadline is not None and time.monotonic() >= deadline - 0.01
+
+async def post_completion(client: httpx.AsyncClient, headers: dict, request_body: dict, timeout_seconds: float | None = None, candidate: Candidate | None = None, outcome: dict | None = None):
+    """Sends one chat completion request upstream and returns the extracted text; `outcome` receives the model and usage,
+    which the caller charges (a coalesced call is charged to every request that shared it)."""
+    timeout = timeout_within(timeout_seconds) if timeout_seconds is not None else httpx.USE_CLIENT_DEFAULT
+    deadline = time.monotonic() + timeout_seconds if timeout_seconds is not None else None
+    model = candidate.key if candidate else request_body["model"]
+    url = candidate.provider.url if candidate else config.OPENAI_API_URL
+    try:
+        logger.debug("Sending request to %s...", url)
+        start = time.perf_counter()
+        response = await client.post(
+            url, headers=headers, content=dumps(request_body), timeout=timeout,
+            extensions={"trace": UpstreamTrace(model)},
+        )
+        observe_span("upstream_total", time.perf_counter() - start, model)
+        record_upstream(model, response.status_code)
+        logger.debug("Response status: %d", response.status_code)
+
+        response.raise_for_status()  # Raise exception for bad status codes (4xx or 5xx)
+        parse_started = time.perf_counter()
+        data = loads(response.content)
+        output_content, usage = parse_completion(data)
+        observe_span("parse", time.perf_counter() - parse_started, model)
+        record_usage(model, usage)
+        if outcome is not None:
+            outcome["model"], outcome["usage"] = model, usage
+
+        if output_content:
+            logger.debug("Extracted text, length: %d", len(output_content))
+            return output_content
+        else:
+            # If we couldn't find any text in the response
+            try:
+                # Log only keys and structure summary, not full data
+                response_summary = {k: type(v).__name__ for k, v in data.items()}
+                logger.error("Failed to extract text from OpenAI response. Structure summary: %s", response_summary)
+            except Exception as e:
+                logger.error("Failed to extract text from OpenAI response, could not summarize it: %s", e)
             
-            if output_content:
-                print(f"[OPENAI_API] Extracted text via fallback, length: {len(output_content)}")
-                return output_content
-            else:
-                # If we couldn't find any text in the response
-                print("[ERROR] Failed to extract text from OpenAI response")
-                try:
-                    # Log only keys and structure summary, not full data
-                    response_summary = {k: type(v).__name__ for k, v in data.items()}
-                    print(f"[ERROR] Response structure summary: {response_summary}")
-                except Exception as e:
-                    print(f"[ERROR] Could not summarize response data: {e}")
-                
-                raise HTTPException(status_code=500, detail="Failed to parse content from OpenAI API response.")
-
-        except httpx.HTTPStatusError as e:
-            print(f"[ERROR] HTTP status error: {e.response.status_code}")
+            raise HTTPException(status_code=500, detail="Failed to parse content from OpenAI API response.")
+
+    except HTTPException:
+        raise
+    except httpx.HTTPStatusError as e:
+        raise http_exception_from_status_error(e)
+    except httpx.RequestError as e:
+        if deadline_cut_off(e, deadline):
+            raise DeadlineExceeded() from e
+        record_upstream(model, "error")
+        logger.error("Request error connecting to OpenAI API: %s", e)
+        raise HTTPException(status_code=503, detail=f"Could not connect to OpenAI API: {e}")
+    except Exception as e:
+        logger.exception("Unexpected error during OpenAI API call: %s", e)
+        raise HTTPException(status_code=500, detail="An internal server error occurred.")
+
+# --- Streaming Variant: Yields Text Deltas as They Arrive --- -
+async def stream_openai_api(user_prompt: str, config_page_instruction: str, request_type: str, client: httpx.AsyncClient, max_tokens: int | None = None):
+    """Async generator over the completion text, forwarding each upstream delta without buffering."""
+    logger.debug("Streaming '%s'. Prompt len: %d, Instruction len: %d", request_type, len(user_prompt), len(config_page_instruction))
+
+    build_started = time.perf_counter()
+    max_tokens = max_tokens or config.DEFAULT_MAX_TOKENS
+    candidates = route_request(user_prompt, config_page_instruction, request_type, max_tokens)
+    observe_span("prompt_build", time.perf_counter() - build_started, candidates[0].key)
+    deadline = request_deadline(request_type)
+
+    for index, candidate in enumerate(candidates):
+        streamed = False
+        outcome = {}
+        parts = []
+        try:
+            async for delta in stream_candidate(candidate, user_prompt, config_page_instruction, request_type, client, max_tokens, deadline, outcome):
+                streamed = True
+                parts.append(delta)
+                yield delta
+            if parts:
+                # Same inputs hash as the blocking call, so a streamed answer can serve a later cache lookup
+                inputs_hash = fingerprint(build_request_body(user_prompt, config_page_instruction, request_type, max_tokens))
+                generation_history.record(request_type, inputs_hash, candidate.key, user_prompt, "".join(parts), outcome.get("usage"),
+                                          time.perf_counter() - build_started, streamed=True)
+            return
+        except HTTPException as e:
+            # Once text has reached the client, switching models would splice two different answers
+            if streamed or time.monotonic() >= deadline or not model_router.fail_over(candidates, index, e):
+                raise
+
+async def stream_candidate(candidate: Candidate, user_prompt: str, config_page_instruction: str, request_type: str, client: httpx.AsyncClient, max_tokens: int, deadline: float, outcome: dict | None = None):
+    headers = candidate.provider.headers()
+    request_body = build_request_body(user_prompt, config_page_instruction, request_type, max_tokens, candidate.model)
+    request_body["stream"] = True
+    # Ask for a final chunk carrying token usage, so streamed calls are metered like blocking ones
+    request_body["stream_options"] = {"include_usage": True}
+    model = candidate.key
+    tokens = estimate_tokens(request_body)
+
+    first_delta_at = None
+    total_chars = 0
+    stage = "queued"
+    # Streams are not retried once started, but still fail fast while the model's circuit is open
+    breaker = resilient_caller.breaker(model)
+    breaker.check()
+    start = time.perf_counter()
+    try:
+        async with upstream_scheduler.slot(model, request_type, tokens, deadline):
+            stage = "in_flight"
+            start = time.perf_counter()
             try:
-                error_detail = e.response.json()
-                # Log only essential error message if available
-                error_message = error_detail.get("error", {}).get("message", "No message provided")
-                print(f"[ERROR] OpenAI API error detail: {error_message}")
-                detail = error_message
-            except Exception:
-                # Log limited raw text on parsing failure
-                error_text = e.response.text[:200] # Limit length
-                print(f"[ERROR] Could not parse error response body. Raw start: {error_text}...")
-                detail = f"OpenAI API error: {e.response.status_code} - Check logs for details."
-            raise HTTPException(status_code=e.response.status_code, detail=detail)
-        except httpx.RequestError as e:
-            print(f"[ERROR] Request error connecting to OpenAI API: {e}")
-            raise HTTPException(status_code=503, detail=f"Could not connect to OpenAI API: {e}")
-        except Exception as e:
-            print(f"[ERROR] Unexpected error during OpenAI API call: {e}")
-            raise HTTPException(status_code=500, detail="An internal server error occurred.")
+                timeout = timeout_within(max(0.0, deadline - time.monotonic()))
+                async with client.stream("POST", candidate.provider.url, headers=headers, content=dumps(request_body), timeout=timeout, extensions={"trace": UpstreamTrace(model)}) as response:
+                    record_upstream(model, response.status_code)
+                    if response.is_error:
+                        await response.aread()
+                        response.raise_for_status()
 
-# --- Service Functions for Specific Tasks --- -
+                    async for line in response.aiter_lines():
+                        if time.monotonic() >= deadline:
+                            # Read timeouts only bound the gap between chunks; a slow steady stream is stopped here
+                            record_cancelled(model, "deadline", stage, time.perf_counter() - start, tokens - max_tokens, total_chars // 4)
+                            raise DeadlineExceeded()
+                        payload = parse_sse_line(line)
+                        if payload is None:
+                            continue
+                        if payload == "[DONE]":
+                            break
+                        chunk = loads(payload)
+                        delta = extract_text_from_delta(chunk)
+                        if delta:
+                            if first_delta_at is None:
+                                first_delta_at = time.perf_counter()
+                                logger.debug("Upstream time to first delta: %.0fms", (first_delta_at - start) * 1000)
+                            total_chars += len(delta)
+                            yield delta
+                        elif chunk.get("usage"):
+                            record_usage(model, chunk["usage"])
+                            charge_usage(chunk["usage"])
+                            if outcome is not None:
+                                outcome["usage"] = chunk["usage"]
 
-async def generate_outline(content_description: str, content_type: str, base_system_instruction: str):
-    print(f"[SERVICE] Generating outline. Desc len: {len(content_description)}, Type: {content_type}")
-    prompt = f"Generate a detailed outline for the following content:\nType: {content_type}\nDescription: {content_description}"
-    return await call_openai_api(prompt, base_system_instruction, None, "outline")
+            except httpx.HTTPStatusError as e:
+                error = http_exception_from_status_error(e)
+                if error.status_code >= 500:
+                    breaker.record_failure()
+                if error.status_code in FAILOVER_STATUS_CODES:
+                    model_router.record_failure(model)
+                raise error
+            except httpx.RequestError as e:
+                if deadline_cut_off(e, deadline):
+                    record_cancelled(model, "deadline", stage, time.perf_counter() - start, tokens - max_tokens, total_chars // 4)
+                    raise DeadlineExceeded() from e
+                record_upstream(model, "error")
+                logger.error("Request error connecting to OpenAI API: %s", e)
+                breaker.record_failure()
+                model_router.record_failure(model)
+                raise HTTPException(status_code=503, detail=f"Could not connect to OpenAI API: {e}")
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client gone mid-stream: leaving the `async with` blocks closes the upstream connection and frees the slot
+        reason = cancel_reason(deadline)
+        if reason is not None:
+            record_cancelled(model, reason, stage, time.perf_counter() - start, tokens - max_tokens, total_chars // 4)
+        raise
+    breaker.record_success()
+    elapsed = time.perf_counter() - start
+    observe_span("upstream_total", elapsed, model)
+    model_router.record_success(model, elapsed)
 
-async def optimize_content(content: str, platform: str, content_type: str, base_system_instruction: str):
-    print(f"[SERVICE] Optimizing content. Len: {len(content)}, Platform: {platform}, Type: {content_type}")
-    prompt = f"Optimize the following content for the {platform} platform. The original content is for {content_type}.\n\nContent:\n{content}"
-    return await call_openai_api(prompt, base_system_instruction, None, "optimize")
+    logger.debug("Stream finished, %d characters in %.0fms", total_chars, elapsed * 1000)
 
-async def rewrite_content(content: str, style: str, base_system_instruction: str):
-    print(f"[SERVICE] Rewriting content. Len: {len(content)}, Style: {style}")
-    prompt = f"Rewrite the following content in a {style} style:\n\nContent:\n{content}"
-    return await call_openai_api(prompt, base_system_instruction, None, "rewrite")
+# --- Service Functions for Specific Tasks --- -
 
-async def generate_reply(comment: str, tone: str, base_system_instruction: str):
+async def generate_reply(comment: str, tone: str, base_system_instruction: str, client: httpx.AsyncClient | None = None, use_cache: bool = True):
     """Generates a reply to a given comment in a specified tone."""
-    print(f"[SERVICE] Generating reply. Comment len: {len(comment)}, Tone: {tone}")
-    prompt = f"Generate a {tone} reply to the following comment:\n\nComment:\n{comment}"
+    logger.debug("Generating reply. Comment len: %d, Tone: %s", len(comment), tone)
+    prompt = build_reply_prompt(comment, tone)
     # Use the base_system_instruction provided from ConfigPage or a default one
     instruction = base_system_instruction or "You are a helpful assistant that generates replies to comments."
-    return await call_openai_api(prompt, instruction, None, "reply") 
\ No newline at end of file
+    return await call_openai_api(prompt, instruction, None, "reply", client, use_cache, completion_budget("reply")) 
\ No newline at end of file
@@ -0,0 +1,302 @@
+import logging
+import re
+import unicodedata
+import config
+from services.metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+try:
+    import regex  # Optional (pulled in by tiktoken); \X matches Unicode extended grapheme clusters
+    _GRAPHEME = regex.compile(r"\X")
+except ImportError:
+    _GRAPHEME = None
+
+postprocess_results = registry.register(Counter(
+    "writer_pro_postprocess_total", "Optimized posts by the strongest fix needed to meet the platform limit.", ("platform", "outcome")))
+
+# --- Measuring Length the Way Each Platform Counts It --- -
+URL_PATTERN = re.compile(r"\b(?:https?://|www\.)[^\s<>\"'()]*[^\s<>\"'().,;:!?]", re.IGNORECASE)
+
+def _graphemes_fallback(text: str) -> list[str]:
+    """Approximate grapheme clusters without the regex module: combining marks, variation selectors,
+    skin tones, tag sequences and ZWJ joins extend the previous cluster; regional indicators pair up."""
+    clusters = []
+    for char in text:
+        if clusters:
+            previous = clusters[-1]
+            code = ord(char)
+            if (unicodedata.category(char) in ("Mn", "Me", "Mc") or 0xFE00 <= code <= 0xFE0F or 0x1F3FB <= code <= 0x1F3FF
+                    or 0xE0020 <= code <= 0xE007F or code == 0x200D or previous[-1] == "\u200d"
+                    or (previous == "\r" and char == "\n")
+                    or (len(previous) == 1 and 0x1F1E6 <= ord(previous) <= 0x1F1FF and 0x1F1E6 <= code <= 0x1F1FF)):
+                clusters[-1] = previous + char
+                continue
+        clusters.append(char)
+    return clusters
+
+def graphemes(text: str) -> list[str]:
+    return _GRAPHEME.findall(text) if _GRAPHEME is not None else _graphemes_fallback(text)
+
+NON_ASCII = re.compile(r"[^\x00-\x7f]+")
+
+def _non_ascii_runs(text: str) -> list[str]:
+    """Runs of non-ASCII characters, each with the character before it, which a combining mark or keycap attaches to.
+    Outside these runs every character is its own cluster, so mostly-English posts are segmented almost for free."""
+    return [text[max(0, match.start() - 1):match.end()] for match in NON_ASCII.finditer(text)]
+
+def grapheme_length(text: str) -> int:
+    """User-perceived characters: an emoji with skin tone or a flag counts once, as LinkedIn and Instagram count it."""
+    length = len(text) - text.count("\r\n")
+    if text.isascii():
+        return length
+    # Segment all runs in one call; clusters always break around a control character, so NUL keeps them apart
+    runs = "\x00".join(_non_ascii_runs(text))
+    return length - (len(runs) - len(graphemes(runs)))
+
+def _is_emoji(cluster: str) -> bool:
+    first = ord(cluster[0])
+    return first >= 0x1F000 or 0x2600 <= first <= 0x27BF or "\ufe0f" in cluster or (first >= 0x2000 and "\u200d" in cluster)
+
+def _twitter_weight(text: str) -> int:
+    weight = len(text)
+    if text.isascii():
+        return weight
+    for run in _non_ascii_runs(text):
+        weight -= len(run)
+        for cluster in graphemes(run):
+            if _is_emoji(cluster):
+                weight += 2  # Any emoji sequence, however many code points it joins
+                continue
+            for char in cluster:
+                code = ord(char)
+                # Latin, Greek, Cyrillic and common punctuation count 1; CJK and everything else counts 2
+                weight += 1 if code <= 0x10FF or 0x2000 <= code <= 0x200D or 0x2010 <= code <= 0x201F or 0x2032 <= code <= 0x2037 else 2
+    return weight
+
+def twitter_length(text: str) -> int:
+    """Weighted length as X/Twitter counts it against 280: NFC code points weighted 1 or 2, emoji 2, links TWITTER_URL_LENGTH."""
+    text = unicodedata.normalize("NFC", text)
+    length = 0
+    position = 0
+    for match in URL_PATTERN.finditer(text):
+        length += _twitter_weight(text[position:match.start()]) + config.TWITTER_URL_LENGTH
+        position = match.end()
+    return length + _twitter_weight(text[position:])
+
+LENGTH_FUNCTIONS = {"twitter": (twitter_length, "weighted")}
+
+def character_limit(platform: str) -> int:
+    return config.PLATFORM_LIMITS.get(platform, config.PLATFORM_LIMITS["default"])
+
+def length_function(platform: str):
+    """(measure, unit name) for `platform`; grapheme clusters unless the platform weighs characters differently."""
+    return LENGTH_FUNCTIONS.get(platform, (grapheme_length, "graphemes"))
+
+# --- Per-Platform Whitespace and Markdown Normalisation --- -
+WRAPPING_QUOTES = {'"': '"', "“": "”", "'": "'"}
+ZERO_WIDTH = re.compile("[\u200b\u2060\ufeff]")  # Not U+200D: joiners hold emoji sequences together
+CODE_FENCE = re.compile(r"^[ \t]*```[^\n]*\n?", re.MULTILINE)
+HEADING = re.compile(r"^[ \t]*#{1,6}[ \t]+", re.MULTILINE)  # "# Title"; a hashtag has no space after the #
+RULE = re.compile(r"^[ \t]*([-*_])(?:[ \t]*\1){2,}[ \t]*$", re.MULTILINE)
+BULLET = re.compile(r"^([ \t]*)[*+][ \t]+", re.MULTILINE)
+LINK = re.compile(r"\[([^\]\n]+)\]\((\S+?)\)")
+BOLD = re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1")
+ITALIC = re.compile(r"(?<![\w*])([*_])(?=\S)(.+?)(?<=\S)\1(?![\w*])")
+INLINE_CODE = re.compile(r"`([^`\n]+)`")
+LINE_INDENT = re.compile(r"^[ \t]+", re.MULTILINE)
+INNER_SPACES = re.compile(r"[ \t]{2,}|\t")
+TRAILING_SPACES = re.compile(r"[ \t]+$", re.MULTILINE)
+BLANK_LINES = re.compile(r"\n{3,}")
+
+def _strip_wrapping_quotes(text: str) -> str:
+    # The optimize prompt quotes the original content, and models often echo the quotes around their answer
+    closing = WRAPPING_QUOTES.get(text[:1])
+    if closing and len(text) > 1 and text.endswith(closing) and closing not in text[1:-1]:
+        return text[1:-1].strip()
+    return text
+
+def _plain_link(match: re.Match) -> str:
+    label, url = match.group(1), match.group(2)
+    return url if label == url else f"{label} {url}"
+
+def strip_markdown(text: str) -> str:
+    """Markdown syntax to the plain text a post shows: headings, emphasis, code and rules lose their markers,
+    links become "label url" and `*`/`+` bullets become "•"."""
+    # Each pattern only runs if its marker occurs at all; most posts have little or no markdown
+    if "```" in text:
+        text = CODE_FENCE.sub("", text)
+    if "#" in text:
+        text = HEADING.sub("", text)
+    if "*" in text or "+" in text or "-" in text or "_" in text:
+        text = BULLET.sub(r"\1• ", RULE.sub("", text))
+    if "](" in text:
+        text = LINK.sub(_plain_link, text)
+    if "*" not in text and "_" not in text and "`" not in text:
+        return text
+    # Emphasis markers are only stripped between links, so an underscore inside a URL survives
+    pieces = []
+    position = 0
+    for match in URL_PATTERN.finditer(text):
+        pieces += [_strip_emphasis(text[position:match.start()]), match.group()]
+        position = match.end()
+    pieces.append(_strip_emphasis(text[position:]))
+    return "".join(pieces)
+
+def _strip_emphasis(text: str) -> str:
+    return INLINE_CODE.sub(r"\1", ITALIC.sub(r"\2", BOLD.sub(r"\2", text)))
+
+def normalize(text: str, platform: str) -> str:
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n")
+    text = _strip_wrapping_quotes(ZERO_WIDTH.sub("", text).strip())
+    if platform not in config.PLATFORMS_WITH_MARKDOWN:
+        text = strip_markdown(text)
+        # Indentation only means something to markdown; in a post it is stray whitespace
+        text = INNER_SPACES.sub(" ", LINE_INDENT.sub("", text))
+    text = TRAILING_SPACES.sub("", text)
+    return BLANK_LINES.sub("\n\n", text).strip()
+
+# --- Trimming at Hashtag and Sentence Boundaries --- -
+TRAILING_HASHTAGS = re.compile(r"(?:^|\s+)((?:#\w+\s*)+)$")
+HASHTAG = re.compile(r"#\w+")
+SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*(?=\s)|\n")
+WORD_END = re.compile(r"\S(?=\s)")
+
+def split_trailing_hashtags(text: str) -> tuple[str, str, list[str]]:
+    """(body, separator, hashtags) for a post ending in a block of hashtags."""
+    match = TRAILING_HASHTAGS.search(text)
+    if match is None:
+        return text, "", []
+    return text[:match.start()], text[match.start():match.start(1)], HASHTAG.findall(match.group(1))
+
+def _longest_fitting(candidates: list, fits):
+    """Binary search over candidates ordered by length, for the longest one that fits; None if none does."""
+    best = None
+    low, high = 0, len(candidates) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        if fits(candidates[middle]):
+            best = candidates[middle]
+            low = middle + 1
+        else:
+            high = middle - 1
+    return best
+
+def trim_to_limit(text: str, limit: int, measure) -> tuple[str, list[str]] | None:
+    """Drops trailing hashtags (keeping one), then whole sentences from the end (keeping one), then the last
+    hashtag. Returns the trimmed text and the fixes applied, or None if not even one sentence fits."""
+    body, separator, tags = split_trailing_hashtags(text)
+    fixes = []
+
+    def compose(body_text: str, kept: list[str]) -> str:
+        if not kept:
+            return body_text
+        return f"{body_text}{separator or ' '}{' '.join(kept)}" if body_text else " ".join(kept)
+
+    def fits(candidate: str) -> bool:
+        return measure(candidate) <= limit
+
+    if len(tags) > 1:
+        kept = _longest_fitting([tags[:count] for count in range(1, len(tags) + 1)], lambda kept: fits(compose(body, kept)))
+        if kept is None:
+            kept = tags[:1]
+        if len(kept) < len(tags):
+            fixes.append("hashtags_dropped")
+            tags = kept
+    if fits(compose(body, tags)):
+        return compose(body, tags), fixes
+
+    # Offsets where a sentence or line ends; normalize() has already removed spaces before line breaks
+    ends = set()
+    for match in SENTENCE_END.finditer(body):
+        end = match.start() if match.group() == "\n" else match.end()
+        if end and not body[end - 1].isspace():
+            ends.add(end)
+    ends = sorted(ends)
+    for kept in (tags, []):
+        best = _longest_fitting(ends, lambda end: fits(compose(body[:end], kept)))
+        if best is not None:
+            fixes.append("sentences_dropped")
+            if len(kept) < len(tags):
+                fixes.append("hashtags_dropped")
+            return compose(body[:best], kept), fixes
+    return None
+
+def truncate_words(text: str, limit: int, measure) -> str:
+    """Last resort: cuts at the last whole word that fits and adds an ellipsis."""
+    ellipsis = "…"
+    ends = [match.end() for match in WORD_END.finditer(text)]
+    best = _longest_fitting(ends, lambda end: measure(text[:end] + ellipsis) <= limit)
+    if best is not None:
+        return text[:best] + ellipsis
+    clusters = graphemes(text)
+    while clusters and measure("".join(clusters) + ellipsis) > limit:
+        clusters.pop()
+    return "".join(clusters) + ellipsis if clusters else ""
+
+# --- Fitting a Generated Post to Its Platform --- -
+class FitResult:
+    __slots__ = ("text", "platform", "limit", "unit", "length", "original_length", "fixes", "needs_model")
+
+    def __init__(self, text: str, platform: str, limit: int, unit: str, length: int):
+        self.text = text
+        self.platform = platform
+        self.limit = limit
+        self.unit = unit
+        self.length = length
+        self.original_length = length
+        self.fixes: list[str] = []
+        self.needs_model = False
+
+    @property
+    def outcome(self) -> str:
+        for fix in ("truncated", "model_shortened", "sentences_dropped", "hashtags_dropped", "normalized"):
+            if fix in self.fixes:
+                return fix
+        return "unchanged"
+
+    def report(self) -> dict:
+        return {
+            "platform": self.platform,
+            "limit": self.limit,
+            "unit": self.unit,
+            "length": self.length,
+            "originalLength": self.original_length,
+            "withinLimit": self.length <= self.limit,
+            "fixes": self.fixes,
+        }
+
+def fit_to_limit(text: str, platform: str, max_trim_ratio: float | None = None) -> FitResult:
+    """Normalises `text` for `platform` and trims it to the platform limit.
+
+    With `max_trim_ratio`, a trim that would cut more than that share of the length is not applied; the
+    result is left over the limit with `needs_model` set, for the caller to ask the model to shorten it.
+    Without it the result always fits, cut word by word with an ellipsis if no sentence boundary works.
+    """
+    measure, unit = length_function(platform)
+    limit = character_limit(platform)
+    cleaned = normalize(text, platform)
+    result = FitResult(cleaned, platform, limit, unit, measure(cleaned))
+    if cleaned != text.strip():
+        result.fixes.append("normalized")
+    if result.length <= limit:
+        return result
+
+    trimmed = trim_to_limit(cleaned, limit, measure)
+    if trimmed is not None and (max_trim_ratio is None or measure(trimmed[0]) >= (1 - max_trim_ratio) * result.length):
+        result.text, fixes = trimmed
+        result.fixes += fixes
+    elif max_trim_ratio is not None:
+        result.needs_model = True
+        return result
+    else:
+        result.text = truncate_words(cleaned, limit, measure)
+        result.fixes.append("truncated")
+    result.length = measure(result.text)
+    return result
+
+def record_outcome(result: FitResult):
+    platform = result.platform if result.platform in config.PLATFORM_LIMITS else "default"
+    postprocess_results.inc(platform=platform, outcome=result.outcome)
+    if result.fixes:
+        logger.debug("Fitted '%s' post: %d -> %d %s (%s)", platform, result.original_length, result.length, result.unit, ", ".join(result.fixes))
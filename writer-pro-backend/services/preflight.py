@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import re
+import time
+import httpx
+from fastapi import HTTPException
+import config
+from services.metrics import observe_span
+from services.openai import call_openai_api
+from services.platform_text import fit_to_limit, record_outcome
+from services.prompts import build_condense_prompt, build_optimize_prompt, build_rewrite_prompt, build_shorten_prompt
+from services.tokens import completion_budget, count_tokens, token_windows, tokenizer_name
+
+logger = logging.getLogger(__name__)
+
+# --- Pre-Flight Token Budgeting and Chunked Map-Reduce for Oversized Content --- -
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+REQUEST_OVERHEAD_TOKENS = 64  # Prompt template wording and chat formatting around the content
+
+def check_context_window(request_type: str, instruction_tokens: int, input_tokens: int, max_tokens: int):
+    model = config.MODELS.get(request_type, config.MODELS["outline"])
+    context = config.MODEL_CONTEXT_TOKENS.get(model)
+    if context is not None and instruction_tokens + input_tokens + REQUEST_OVERHEAD_TOKENS + max_tokens > context:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Request needs about {instruction_tokens + input_tokens + max_tokens} tokens, more than the {context} token context of '{model}'.",
+        )
+
+def split_into_chunks(text: str, max_tokens: int) -> list[str]:
+    """Greedily packs paragraphs (then sentences, then words, then token windows) into chunks of at most `max_tokens`."""
+    pieces = []
+    for paragraph in PARAGRAPH_BREAK.split(text.strip()):
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_END.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+                continue
+            words = sentence.split(" ")
+            step = max(1, len(words) * max_tokens // count_tokens(sentence))
+            for i in range(0, len(words), step):
+                run = " ".join(words[i:i + step])
+                # Text without spaces (CJK, a long URL) is still too big here: cut it at token boundaries
+                pieces += [run] if count_tokens(run) <= max_tokens else token_windows(run, max_tokens)
+
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        # Each join adds a paragraph break, about one token
+        piece_tokens = count_tokens(piece) + 1
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def largest_chunk_tokens(chunks: list[str]) -> int:
+    return max(count_tokens(chunk) for chunk in chunks)
+
+async def map_chunks(prompts: list[str], instruction: str, request_type: str, client: httpx.AsyncClient, use_cache: bool, max_tokens: int):
+    semaphore = asyncio.Semaphore(config.CHUNK_MAX_CONCURRENCY)
+
+    async def run(prompt: str):
+        async with semaphore:
+            return await call_openai_api(prompt, instruction, None, request_type, client, use_cache, max_tokens)
+
+    return await asyncio.gather(*(run(prompt) for prompt in prompts))
+
+def token_report(instruction_tokens: int, content_tokens: int, max_tokens: int, chunks: int):
+    return {
+        "tokenizer": tokenizer_name(),
+        "instructionTokens": instruction_tokens,
+        "contentTokens": content_tokens,
+        "maxTokens": max_tokens,
+        "chunks": chunks,
+    }
+
+async def enforce_platform_limit(text: str, platform: str, instruction: str, client: httpx.AsyncClient, use_cache: bool = True):
+    """Normalises an optimized post and fits it to the platform limit locally. The model is asked to shorten it
+    only when trimming would cut more than POSTPROCESS_MAX_TRIM_RATIO; returns (text, length report or None)."""
+    if not config.POSTPROCESS_ENABLED:
+        return text, None
+    started = time.perf_counter()
+    result = fit_to_limit(text, platform, config.POSTPROCESS_MAX_TRIM_RATIO if config.POSTPROCESS_SHORTEN_WITH_MODEL else None)
+    observe_span("postprocess", time.perf_counter() - started)
+    if result.needs_model:
+        excess = result.length - result.limit
+        logger.info("optimize: '%s' post is %d %s over its limit, asking the model to shorten it", platform, excess, result.unit)
+        try:
+            shortened = await call_openai_api(build_shorten_prompt(result.text, platform, excess, result.limit), instruction, None,
+                                              "optimize", client, use_cache, completion_budget("optimize", platform))
+        except HTTPException as e:
+            # The original answer is still usable; trimming it harder beats failing the request
+            logger.warning("optimize: shorten call failed (%s), trimming locally", e.detail)
+            shortened = None
+        original_length = result.length
+        result = fit_to_limit(shortened if shortened is not None else result.text, platform)
+        result.original_length = original_length
+        if shortened is not None:
+            result.fixes.insert(0, "model_shortened")
+    record_outcome(result)
+    return result.text, result.report()
+
+async def optimize_content(content: str, platform: str, instruction: str, client: httpx.AsyncClient, use_cache: bool = True):
+    """Optimizes content for a platform; oversized content is condensed per chunk, then optimized as a whole.
+    Returns (text, token report, length report or None)."""
+    instruction_tokens = count_tokens(instruction)
+    content_tokens = count_tokens(content)
+    max_tokens = completion_budget("optimize", platform)
+    logger.debug("optimize: instruction=%d, content=%d, max_tokens=%d (%s)", instruction_tokens, content_tokens, max_tokens, tokenizer_name())
+
+    if content_tokens <= config.CHUNK_INPUT_TOKENS:
+        check_context_window("optimize", instruction_tokens, content_tokens, max_tokens)
+        text = await call_openai_api(build_optimize_prompt(content, platform), instruction, None, "optimize", client, use_cache, max_tokens)
+        text, length_report = await enforce_platform_limit(text, platform, instruction, client, use_cache)
+        return text, token_report(instruction_tokens, content_tokens, max_tokens, 1), length_report
+
+    chunks = split_into_chunks(content, config.CHUNK_INPUT_TOKENS)
+    logger.info("optimize: content split into %d chunks", len(chunks))
+    check_context_window("optimize", instruction_tokens, largest_chunk_tokens(chunks), config.CHUNK_INPUT_TOKENS // 3)
+    # Map: condense each chunk to at most a third of its size. Reduce: optimize the combined notes
+    condense_prompts = [build_condense_prompt(chunk, part, len(chunks)) for part, chunk in enumerate(chunks, start=1)]
+    notes = await map_chunks(condense_prompts, instruction, "optimize", client, use_cache, config.CHUNK_INPUT_TOKENS // 3)
+    combined = "\n\n".join(notes)
+    check_context_window("optimize", instruction_tokens, count_tokens(combined), max_tokens)
+    text = await call_openai_api(build_optimize_prompt(combined, platform), instruction, None, "optimize", client, use_cache, max_tokens)
+    text, length_report = await enforce_platform_limit(text, platform, instruction, client, use_cache)
+    return text, token_report(instruction_tokens, content_tokens, max_tokens, len(chunks)), length_report
+
+async def rewrite_content(content: str, style: str, instruction: str, client: httpx.AsyncClient, use_cache: bool = True):
+    """Rewrites content in a style; oversized content is rewritten chunk by chunk and joined in order."""
+    instruction_tokens = count_tokens(instruction)
+    content_tokens = count_tokens(content)
+
+    if content_tokens <= config.CHUNK_INPUT_TOKENS:
+        max_tokens = completion_budget("rewrite", content_tokens=content_tokens)
+        logger.debug("rewrite: instruction=%d, content=%d, max_tokens=%d (%s)", instruction_tokens, content_tokens, max_tokens, tokenizer_name())
+        check_context_window("rewrite", instruction_tokens, content_tokens, max_tokens)
+        text = await call_openai_api(build_rewrite_prompt(content, style), instruction, None, "rewrite", client, use_cache, max_tokens)
+        return text, token_report(instruction_tokens, content_tokens, max_tokens, 1)
+
+    chunks = split_into_chunks(content, config.CHUNK_INPUT_TOKENS)
+    max_tokens = completion_budget("rewrite", content_tokens=config.CHUNK_INPUT_TOKENS)
+    logger.info("rewrite: content=%d tokens split into %d chunks, max_tokens=%d per chunk", content_tokens, len(chunks), max_tokens)
+    check_context_window("rewrite", instruction_tokens, largest_chunk_tokens(chunks), max_tokens)
+    parts = await map_chunks([build_rewrite_prompt(chunk, style) for chunk in chunks], instruction, "rewrite", client, use_cache, max_tokens)
+    return "\n\n".join(parts), token_report(instruction_tokens, content_tokens, max_tokens, len(chunks))
@@ -0,0 +1,70 @@
+import logging
+from string import Formatter
+import config
+
+logger = logging.getLogger(__name__)
+
+# --- Prompt Template Registry --- -
+class PromptTemplate:
+    """A user-prompt template parsed once at import into literal text and field slots, so rendering is a single join."""
+    __slots__ = ("name", "source", "fields", "_pieces")
+
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.source = source
+        pieces = []
+        fields = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if spec or conversion:
+                raise ValueError(f"Prompt '{name}': format specs and conversions are not supported ({{{field}}})")
+            if literal:
+                pieces.append((False, literal))
+            if field is not None:
+                pieces.append((True, field))
+                fields.append(field)
+        self._pieces = tuple(pieces)
+        self.fields = frozenset(fields)
+
+    def render(self, **values) -> str:
+        return "".join(
+            (value if isinstance(value := values[text], str) else str(value)) if is_field else text
+            for is_field, text in self._pieces
+        )
+
+PROMPTS: dict[str, PromptTemplate] = {}
+
+def register_prompt(name: str, source: str) -> PromptTemplate:
+    template = PromptTemplate(name, source)
+    PROMPTS[name] = template
+    return template
+
+# Variable content goes last, so the instruction-like start of each prompt is the same for every call
+OUTLINE_PROMPT = register_prompt("outline", "{description}")
+OPTIMIZE_PROMPT = register_prompt("optimize", "Optimize the following content for the '{platform}' platform. Aim for a character limit of {character_limit}.\n\nOriginal Content:\n\"{content}\"")
+REWRITE_PROMPT = register_prompt("rewrite", "Rewrite the following content in a {style} style while maintaining the core meaning:\n\nOriginal Content:\n\"{content}\"")
+REPLY_PROMPT = register_prompt("reply", "Generate a {tone} reply to the following comment:\n\nComment:\n{comment}")
+SHORTEN_PROMPT = register_prompt("shorten", "Shorten this '{platform}' post by at least {excess} characters so it fits in {character_limit}. Keep its meaning, voice, links and hashtags, and reply with the post only.\n\nPost:\n\"{content}\"")
+CONDENSE_PROMPT = register_prompt("condense", "This is part {part} of {parts} of a longer piece. Condense it into its key points, keeping facts, names and tone:\n\nContent:\n\"{content}\"")
+
+# --- Prompt Construction Shared by the Content, Streaming and Batch Endpoints --- -
+DEFAULT_REPLY_INSTRUCTION = "You are a helpful assistant replying to comments."
+
+def build_outline_prompt(description: str):
+    return OUTLINE_PROMPT.render(description=description)
+
+def build_optimize_prompt(content: str, platform: str):
+    character_limit = config.PLATFORM_LIMITS.get(platform, config.PLATFORM_LIMITS["default"])
+    logger.debug("Platform character limit: %d", character_limit)
+    return OPTIMIZE_PROMPT.render(platform=platform, character_limit=character_limit, content=content)
+
+def build_rewrite_prompt(content: str, style: str):
+    return REWRITE_PROMPT.render(style=style, content=content)
+
+def build_reply_prompt(comment: str, tone: str):
+    return REPLY_PROMPT.render(tone=tone, comment=comment)
+
+def build_shorten_prompt(content: str, platform: str, excess: int, character_limit: int):
+    return SHORTEN_PROMPT.render(platform=platform, excess=excess, character_limit=character_limit, content=content)
+
+def build_condense_prompt(content: str, part: int, parts: int):
+    return CONDENSE_PROMPT.render(part=part, parts=parts, content=content)
@@ -0,0 +1,323 @@
+import asyncio
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+import config
+from services.jsoncodec import dumps
+from services.metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+rate_limited = registry.register(Counter(
+    "writer_pro_rate_limited_total", "Requests rejected by the per-caller limiter.", ("route", "reason")))
+
+# --- Sliding-Window Counters, Local or Shared Between Worker Processes --- -
+SYNC_EARLY_FRACTION = 0.1  # Sync before the interval once one key has this share of its limit unsynced
+class WindowCounter:
+    """Counts for the current and previous fixed window of one key.
+
+    Each window holds [shared, in_flight, pending]: the total last read from the shared store, the local
+    amount being written to it right now, and the local amount not yet written. Without a shared store
+    everything stays in `pending`.
+    """
+    __slots__ = ("seconds", "windows", "touched")
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.windows: dict[int, list] = {}
+        self.touched = 0.0
+
+    def add(self, amount: float, now: float) -> float:
+        """Adds to the current window and returns the amount not yet written to the shared store."""
+        index = int(now // self.seconds)
+        slot = self.windows.get(index)
+        if slot is None:
+            slot = self.windows[index] = [0.0, 0.0, 0.0]
+            for old in [old for old in self.windows if old < index - 1]:
+                del self.windows[old]
+        slot[2] += amount
+        self.touched = now
+        return slot[2]
+
+    def estimate(self, now: float) -> tuple[float, float, float]:
+        """(sliding-window count, current window count, previous window count); the previous window is weighted
+        by how much of it still overlaps the last `seconds`."""
+        index = int(now // self.seconds)
+        current = self.windows.get(index)
+        previous = self.windows.get(index - 1)
+        current_count = sum(current) if current else 0.0
+        previous_count = sum(previous) if previous else 0.0
+        overlap = 1.0 - (now % self.seconds) / self.seconds
+        return previous_count * overlap + current_count, current_count, previous_count
+
+    def retry_after(self, threshold: float, now: float) -> int:
+        """Seconds until the estimate falls to `threshold` if nothing else is added."""
+        _, current_count, previous_count = self.estimate(now)
+        elapsed = (now % self.seconds) / self.seconds
+        # Within this window: previous * (1 - f) + current <= threshold once f >= 1 - (threshold - current) / previous
+        if current_count <= threshold and previous_count > 0:
+            needed = 1.0 - (threshold - current_count) / previous_count
+            return max(1, math.ceil((needed - elapsed) * self.seconds))
+        # Otherwise in the next window, where this window's count is the one fading out
+        needed = 1.0 - threshold / current_count if current_count > 0 else 0.0
+        return max(1, math.ceil((1.0 - elapsed + needed) * self.seconds))
+
+class SharedCounterStore:
+    """SQLite table that every worker process adds its counts to. Calls block; run them in a thread."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS rate_counters (
+                key TEXT NOT NULL,
+                window INTEGER NOT NULL,
+                count REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (key, window)
+            )"""
+        )
+
+    def sync(self, deltas: list[tuple]) -> dict[tuple, float]:
+        """Adds `deltas` [(key, window, amount, expires_at)] and returns every live (key, window) total."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO rate_counters (key, window, count, expires_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (key, window) DO UPDATE SET count = count + excluded.count",
+                    deltas,
+                )
+                self._conn.execute("DELETE FROM rate_counters WHERE expires_at < ?", (now,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            # One scan beats a lookup per key once there are thousands of callers
+            rows = self._conn.execute("SELECT key, window, count FROM rate_counters").fetchall()
+        return {(key, window): count for key, window, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class RateLimiter:
+    """Per-caller request limits (per endpoint) and token quotas (across endpoints).
+
+    Checks only touch in-process counters, so they stay in the microseconds. With a shared store,
+    `sync_forever` exchanges counts with the other workers every interval; a caller spread across
+    workers can overshoot a limit by at most what those workers admit within one interval.
+    """
+
+    def __init__(self, shared: SharedCounterStore | None = None):
+        self.shared = shared
+        self._counters: dict[str, WindowCounter] = {}
+        self._syncing = False
+        self._wake: asyncio.Event | None = None
+
+    def counter(self, key: str, seconds: float) -> WindowCounter:
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = WindowCounter(seconds)
+        return counter
+
+    def check_request(self, caller: str, route: str, now: float) -> tuple[bool, int, int, int]:
+        """Counts one request if allowed. Returns (allowed, limit, remaining, retry_after)."""
+        limit = config.RATE_LIMIT_ENDPOINT_REQUESTS.get(route, config.RATE_LIMIT_REQUESTS)
+        counter = self.counter(f"req:{caller}:{route}", config.RATE_LIMIT_WINDOW_SECONDS)
+        count = counter.estimate(now)[0]
+        if count + 1 > limit:
+            return False, limit, 0, counter.retry_after(limit - 1, now)
+        if counter.add(1, now) >= limit * SYNC_EARLY_FRACTION:
+            self._sync_soon()
+        return True, limit, max(0, int(limit - count - 1)), 0
+
+    def check_tokens(self, caller: str, now: float) -> tuple[bool, int]:
+        """Whether the caller still has token quota left. Returns (allowed, retry_after)."""
+        if not config.TOKEN_QUOTA:
+            return True, 0
+        counter = self.counter(f"tok:{caller}", config.TOKEN_QUOTA_WINDOW_SECONDS)
+        if counter.estimate(now)[0] < config.TOKEN_QUOTA:
+            return True, 0
+        return False, counter.retry_after(config.TOKEN_QUOTA * 0.99, now)
+
+    def charge_tokens(self, caller: str, tokens: int, now: float):
+        if config.TOKEN_QUOTA and tokens:
+            if self.counter(f"tok:{caller}", config.TOKEN_QUOTA_WINDOW_SECONDS).add(tokens, now) >= config.TOKEN_QUOTA * SYNC_EARLY_FRACTION:
+                self._sync_soon()
+
+    def _sync_soon(self):
+        # A burst from one caller should not have to wait out the interval before other workers see it
+        if self._wake is not None:
+            self._wake.set()
+
+    def prune(self, now: float):
+        """Drops counters with nothing in their last two windows."""
+        for key in [key for key, counter in self._counters.items() if now - counter.touched > 2 * counter.seconds]:
+            del self._counters[key]
+
+    async def sync(self):
+        if self.shared is None:
+            self.prune(time.time())
+            return
+        if self._syncing:
+            return
+        self._syncing = True
+        now = time.time()
+        deltas, wanted, slots = [], [], []
+        for key, counter in self._counters.items():
+            for window, slot in counter.windows.items():
+                if slot[2]:
+                    slot[1], slot[2] = slot[1] + slot[2], 0.0
+                    deltas.append((key, window, slot[1], (window + 2) * counter.seconds))
+                wanted.append((key, window))
+                slots.append(slot)
+        try:
+            totals = await asyncio.to_thread(self.shared.sync, deltas)
+        except Exception:
+            # Put the unwritten counts back so they go out with the next sync
+            for slot in slots:
+                slot[1], slot[2] = 0.0, slot[1] + slot[2]
+            raise
+        else:
+            # The shared total includes what this worker just wrote, so the in-flight amount is now counted there
+            for wanted_key, slot in zip(wanted, slots):
+                slot[0], slot[1] = totals.get(wanted_key, 0.0), 0.0
+        finally:
+            self._syncing = False
+        self.prune(now)
+
+    async def sync_forever(self, interval: float):
+        self._wake = asyncio.Event() if self.shared is not None else None
+        while True:
+            if self._wake is None:
+                await asyncio.sleep(interval)
+            else:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning("Rate limit sync failed: %s", e)
+
+    def close(self):
+        if self.shared is not None:
+            self.shared.close()
+
+rate_limiter = RateLimiter(SharedCounterStore(config.RATE_LIMIT_DB_PATH) if config.RATE_LIMIT_DB_PATH else None)
+
+# --- Caller Identification and Token Charging --- -
+_caller: ContextVar[str | None] = ContextVar("rate_limit_caller", default=None)
+_api_keys = {hashlib.sha256(key.encode()).hexdigest()[:16] for key in config.RATE_LIMIT_API_KEYS}
+
+def identify_caller(scope) -> str:
+    """`key:<hash prefix>` for a configured API key, else `ip:<client address>`; unknown keys count as their address.
+
+    X-Forwarded-For is never read here: the client controls its leftmost entries. Behind a proxy listed in
+    FORWARDED_ALLOW_IPS, uvicorn has already set `client` to the rightmost hop that proxy did not add itself.
+    """
+    for name, value in scope["headers"]:
+        if name == b"x-api-key":
+            digest = hashlib.sha256(value).hexdigest()[:16]
+            if digest in _api_keys:
+                return f"key:{digest}"
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
+
+def current_caller() -> str | None:
+    """The caller of the current request, as named by CallerMiddleware; None outside a request."""
+    return _caller.get()
+
+def act_for_caller(caller: str | None):
+    """Attributes work done outside a request (e.g. a background job) to `caller`, for token charging and history."""
+    _caller.set(caller)
+
+def charge_usage(usage: dict | None):
+    """Charges the caller of the current request for the tokens OpenAI reported; no-op outside a request."""
+    caller = _caller.get()
+    if caller is None or not config.RATE_LIMIT_ENABLED or not isinstance(usage, dict):
+        return
+    total = usage.get("total_tokens")
+    if not isinstance(total, (int, float)):
+        total = (usage.get("prompt_tokens", usage.get("input_tokens")) or 0) + (usage.get("completion_tokens", usage.get("output_tokens")) or 0)
+    rate_limiter.charge_tokens(caller, total, time.time())
+
+class CallerMiddleware:
+    """Pure ASGI middleware naming the caller of each POST request, for token charging and generation history.
+
+    Mounted whether or not limits are enforced, outside RateLimitMiddleware, which reads the name from here.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        token = _caller.set(identify_caller(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _caller.reset(token)
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware enforcing per-caller limits on POST endpoints (the ones that reach OpenAI)."""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        caller = _caller.get() or identify_caller(scope)
+        route = scope["path"]
+        now = time.time()
+        tokens_ok, retry_after = self.limiter.check_tokens(caller, now)
+        if not tokens_ok:
+            rate_limited.inc(route=route, reason="tokens")
+            await self._reject(send, f"Token quota of {config.TOKEN_QUOTA} per {config.TOKEN_QUOTA_WINDOW_SECONDS:.0f}s exceeded.", retry_after, config.TOKEN_QUOTA, 0)
+            return
+        allowed, limit, remaining, retry_after = self.limiter.check_request(caller, route, now)
+        if not allowed:
+            rate_limited.inc(route=route, reason="requests")
+            await self._reject(send, f"Rate limit of {limit} requests per {config.RATE_LIMIT_WINDOW_SECONDS:.0f}s exceeded.", retry_after, limit, 0)
+            return
+
+        limit_headers = [(b"x-ratelimit-limit", str(limit).encode()), (b"x-ratelimit-remaining", str(remaining).encode())]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + limit_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    @staticmethod
+    async def _reject(send, detail: str, retry_after: int, limit: int, remaining: int):
+        body = dumps({"detail": detail})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+                (b"x-ratelimit-limit", str(limit).encode()),
+                (b"x-ratelimit-remaining", str(remaining).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
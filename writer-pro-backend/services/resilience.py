@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from fastapi import HTTPException
+import config
+from services.scheduler import DeadlineExceeded, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# --- Retries, Hedged Requests and Circuit Breakers for Upstream Calls --- -
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+BREAKER_FAILURE_STATUS_CODES = {500, 502, 503, 504}
+
+class LatencyTracker:
+    """Recent successful call latencies for one model, used to pick the hedging threshold."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float):
+        if len(self._samples) < config.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class CircuitBreaker:
+    """Fails fast while a model is unhealthy; lets one trial call through every reset period."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.retry_at = 0.0
+        self.rejections = 0
+
+    def check(self):
+        if self.state == "closed":
+            return
+        now = time.monotonic()
+        if now < self.retry_at:
+            self.rejections += 1
+            retry_after = max(1, int(self.retry_at - now))
+            raise HTTPException(
+                status_code=503,
+                detail=f"Upstream model '{self.model}' is temporarily unavailable, please retry shortly.",
+                headers={"Retry-After": str(retry_after)},
+            )
+        # Half-open: this caller is the trial; everyone else keeps failing fast until it reports back
+        self.state = "half_open"
+        self.retry_at = now + config.BREAKER_RESET_SECONDS
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("Circuit for '%s' closed", self.model)
+        self.state = "closed"
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= config.BREAKER_FAILURE_THRESHOLD:
+            if self.state != "open":
+                logger.warning("Circuit for '%s' opened after %d failures", self.model, self.consecutive_failures)
+            self.state = "open"
+            self.retry_at = time.monotonic() + config.BREAKER_RESET_SECONDS
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures, "rejections": self.rejections}
+
+class ResilientCaller:
+    def __init__(self):
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._latencies: dict[str, LatencyTracker] = {}
+        self.counters = {"attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+
+    def record_latency(self, model: str, seconds: float):
+        """Upstream latency of one successful attempt, excluding time spent queued in the scheduler."""
+        self.latencies(model).record(seconds)
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(model)
+        return self._breakers[model]
+
+    def latencies(self, model: str) -> LatencyTracker:
+        if model not in self._latencies:
+            self._latencies[model] = LatencyTracker()
+        return self._latencies[model]
+
+    async def call(self, model: str, attempt, deadline: float, max_attempts: int | None = None):
+        """Runs `attempt(timeout_seconds, upstream_started)` with bounded retries (decorrelated jitter) until `deadline`."""
+        breaker = self.breaker(model)
+        breaker.check()
+        delay = config.RETRY_BASE_DELAY
+        max_attempts = max_attempts or config.RETRY_MAX_ATTEMPTS
+        for attempt_number in range(1, max_attempts + 1):
+            try:
+                result = await self._hedged(model, attempt, deadline)
+            except DeadlineExceeded:
+                raise  # Our own budget ran out: not an upstream failure, and nothing is left to retry with
+            except HTTPException as e:
+                if e.status_code in BREAKER_FAILURE_STATUS_CODES:
+                    breaker.record_failure()
+                if e.status_code not in RETRYABLE_STATUS_CODES or attempt_number == max_attempts:
+                    raise
+                delay = min(config.RETRY_MAX_DELAY, random.uniform(config.RETRY_BASE_DELAY, delay * 3))
+                retry_after = parse_retry_after(e.headers)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                if time.monotonic() + delay >= deadline:
+                    logger.info("Not retrying '%s': backoff would pass the request deadline", model)
+                    raise
+                logger.info("Attempt %d for '%s' failed (%s), retrying in %.2fs", attempt_number, model, e.status_code, delay)
+                self.counters["retries"] += 1
+                await asyncio.sleep(delay)
+                breaker.check()
+            else:
+                breaker.record_success()
+                return result
+
+    async def _timed(self, attempt, deadline: float, upstream_started: asyncio.Event):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.counters["deadline_exceeded"] += 1
+            raise DeadlineExceeded()
+        self.counters["attempts"] += 1
+        try:
+            # Bounds the whole attempt, scheduler queueing included; httpx timeouts alone only bound each read
+            return await asyncio.wait_for(attempt(remaining, upstream_started), remaining)
+        except asyncio.TimeoutError:
+            self.counters["deadline_exceeded"] += 1
+            raise DeadlineExceeded()
+
+    def _hedge_threshold(self, model: str):
+        if not config.HEDGE_ENABLED:
+            return None
+        if self.counters["hedges"] >= self.counters["attempts"] * config.HEDGE_BUDGET_RATIO:
+            return None  # Hedging budget spent; extra load would only make a slow upstream slower
+        return self.latencies(model).percentile(config.HEDGE_PERCENTILE)
+
+    async def _hedged(self, model: str, attempt, deadline: float):
+        threshold = self._hedge_threshold(model)
+        first_started = asyncio.Event()
+        first = asyncio.create_task(self._timed(attempt, deadline, first_started))
+        if threshold is None:
+            return await first
+
+        try:
+            # The threshold is upstream latency, so start the clock once the attempt leaves the scheduler queue
+            started = asyncio.create_task(first_started.wait())
+            await asyncio.wait({first, started}, return_when=asyncio.FIRST_COMPLETED)
+            started.cancel()
+            if not first.done():
+                await asyncio.wait({first}, timeout=threshold)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if first.done():
+            return first.result()
+
+        # The first call is slower than the p95 threshold: race a second one and keep whichever finishes first
+        self.counters["hedges"] += 1
+        second = asyncio.create_task(self._timed(attempt, deadline, asyncio.Event()))
+        pending = {first, second}
+        try:
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        hedge_thresholds = {model: tracker.percentile(config.HEDGE_PERCENTILE) for model, tracker in self._latencies.items()}
+        return {
+            **self.counters,
+            "breakers": {model: breaker.stats() for model, breaker in self._breakers.items()},
+            "hedge_threshold_s": hedge_thresholds,
+        }
+
+resilient_caller = ResilientCaller()
@@ -0,0 +1,163 @@
+import logging
+import random
+import time
+from fastapi import HTTPException
+import config
+from services.resilience import resilient_caller
+
+logger = logging.getLogger(__name__)
+
+# --- Model Routing Across OpenAI-Compatible Providers --- -
+# Errors that say something about this provider or model rather than about the request itself
+FAILOVER_STATUS_CODES = {401, 403, 404, 408, 429, 500, 502, 503, 504}
+
+class Provider:
+    __slots__ = ("name", "url", "api_key")
+
+    def __init__(self, name: str, url: str, api_key: str | None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+
+    def headers(self) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if self.name == "openai":
+            if not self.api_key or self.api_key == "YOUR_OPENAI_API_KEY_HERE":
+                logger.error("OpenAI API key not configured")
+                raise HTTPException(status_code=500, detail="OpenAI API key not configured on the server.")
+        elif not self.api_key:
+            # Self-hosted servers usually run without authentication
+            return headers
+        headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+class Candidate:
+    """One routable model. `key` is the configured name and labels its scheduler, breaker and metrics."""
+    __slots__ = ("key", "provider", "model")
+
+    def __init__(self, key: str, provider: Provider, model: str):
+        self.key = key
+        self.provider = provider
+        self.model = model
+
+class RouteStats:
+    """Exponentially weighted upstream latency (successful calls) and error rate for one candidate."""
+    __slots__ = ("latency", "error_rate", "samples")
+
+    def __init__(self):
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.samples = 0
+
+    def record(self, seconds: float | None):
+        alpha = config.ROUTER_EWMA_ALPHA
+        if seconds is not None:
+            # Seed from the first success so one sample does not start from zero
+            self.latency = seconds if self.latency == 0.0 else (1 - alpha) * self.latency + alpha * seconds
+        self.error_rate = (1 - alpha) * self.error_rate + alpha * (0.0 if seconds is not None else 1.0)
+        self.samples += 1
+
+def providers_from_config() -> dict[str, Provider]:
+    return {name: Provider(name, settings["url"], settings["api_key"]) for name, settings in config.PROVIDERS.items()}
+
+def estimated_cost(model: str, prompt_tokens: int, max_tokens: int) -> float:
+    input_price, output_price = config.MODEL_COSTS.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + max_tokens * output_price) / 1_000_000
+
+class ModelRouter:
+    def __init__(self, providers: dict[str, Provider]):
+        self.providers = providers
+        self._candidates: dict[str, Candidate] = {}
+        self._stats: dict[str, RouteStats] = {}
+        self.counters = {"routed": 0, "fast_tier": 0, "explored": 0, "failovers": 0}
+
+    def candidate(self, key: str) -> Candidate:
+        candidate = self._candidates.get(key)
+        if candidate is None:
+            # Only a known provider name counts as a prefix; fine-tuned OpenAI model names contain colons too
+            provider_name, _, model = key.partition(":")
+            if provider_name not in self.providers or provider_name == "openai" and not model:
+                provider_name, model = "openai", key
+            candidate = self._candidates[key] = Candidate(key, self.providers[provider_name], model)
+        return candidate
+
+    def stats_for(self, key: str) -> RouteStats:
+        if key not in self._stats:
+            self._stats[key] = RouteStats()
+        return self._stats[key]
+
+    def record_success(self, key: str, seconds: float):
+        self.stats_for(key).record(seconds)
+
+    def record_failure(self, key: str):
+        self.stats_for(key).record(None)
+
+    def score(self, key: str, position: int, prompt_tokens: int, max_tokens: int) -> float:
+        """Lower is better: expected seconds, plus penalties for errors, cost and distance from the preferred model."""
+        stats = self.stats_for(key)
+        if stats.samples < config.ROUTER_MIN_SAMPLES:
+            return float("inf")
+        return (
+            stats.latency
+            + config.ROUTER_ERROR_PENALTY_SECONDS * stats.error_rate
+            + config.ROUTER_COST_WEIGHT * estimated_cost(self.candidate(key).model, prompt_tokens, max_tokens)
+            + config.ROUTER_ORDER_BIAS_SECONDS * position
+        )
+
+    def route(self, request_type: str, prompt_tokens: int, max_tokens: int, input_tokens: int) -> list[Candidate]:
+        """Candidates to try in order: the fast tier for short inputs, then the configured models by score."""
+        self.counters["routed"] += 1
+        keys = config.MODEL_CANDIDATES.get(request_type, config.MODEL_CANDIDATES["outline"])
+        fits = [key for key in keys if self._fits(key, prompt_tokens, max_tokens)] or keys[:1]
+        # Candidates without enough samples sort by configured position, after every scored candidate
+        ranked = sorted(fits, key=lambda key: (self.score(key, keys.index(key), prompt_tokens, max_tokens), keys.index(key)))
+        if len(ranked) > 1 and random.random() < config.ROUTER_EXPLORE_RATIO:
+            self.counters["explored"] += 1
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        # Models whose circuit is open go last: tried only once everything healthier has failed
+        ranked.sort(key=self._circuit_open)
+
+        fast = config.FAST_TIER_MODEL
+        if (fast and request_type in config.FAST_TIER_REQUEST_TYPES and fast not in ranked
+                and input_tokens <= config.FAST_TIER_MAX_INPUT_TOKENS and max_tokens <= config.FAST_TIER_MAX_COMPLETION_TOKENS
+                and not self._circuit_open(fast)):
+            self.counters["fast_tier"] += 1
+            ranked.insert(0, fast)
+        return [self.candidate(key) for key in ranked]
+
+    def _fits(self, key: str, prompt_tokens: int, max_tokens: int) -> bool:
+        context = config.MODEL_CONTEXT_TOKENS.get(key)
+        return context is None or prompt_tokens + max_tokens <= context
+
+    def _circuit_open(self, key: str) -> bool:
+        breaker = resilient_caller.breaker(key)
+        return breaker.state == "open" and time.monotonic() < breaker.retry_at
+
+    async def call(self, candidates: list[Candidate], call_candidate, deadline: float):
+        """Runs `call_candidate(candidate, max_attempts)` down the list until one succeeds or a non-failover error."""
+        for index, candidate in enumerate(candidates):
+            last = index == len(candidates) - 1
+            try:
+                return await call_candidate(candidate, config.RETRY_MAX_ATTEMPTS if last else config.ROUTER_ATTEMPTS_BEFORE_FAILOVER)
+            except HTTPException as e:
+                if time.monotonic() >= deadline or not self.fail_over(candidates, index, e):
+                    raise
+
+    def fail_over(self, candidates: list[Candidate], index: int, error: HTTPException) -> bool:
+        """Whether to move on to the next candidate after `candidates[index]` failed with `error`."""
+        if index == len(candidates) - 1 or error.status_code not in FAILOVER_STATUS_CODES:
+            return False
+        self.counters["failovers"] += 1
+        logger.warning("'%s' failed (%d), failing over to '%s'", candidates[index].key, error.status_code, candidates[index + 1].key)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "models": {
+                key: {"latency_ewma_s": round(stats.latency, 4), "error_rate": round(stats.error_rate, 4), "samples": stats.samples}
+                for key, stats in self._stats.items()
+            },
+        }
+
+model_router = ModelRouter(providers_from_config())
@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+import config
+from services.metrics import observe_span
+from services.tokens import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Adaptive Concurrency Limiter and Priority Scheduler for Upstream Calls --- -
+class DeadlineExceeded(HTTPException):
+    """504 raised locally when a request's deadline passes; it says nothing about upstream health."""
+
+    def __init__(self, detail: str = "Upstream request deadline exceeded."):
+        super().__init__(status_code=504, detail=detail)
+
+def estimate_tokens(request_body: dict) -> int:
+    """Token cost of a request for the tokens/min budget: prompt tokens plus the completion budget."""
+    return count_message_tokens(request_body.get("messages", [])) + request_body.get("max_tokens", 0)
+
+class TokenBucket:
+    """Continuously refilling budget of `per_minute` units, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (requests larger than the bucket wait for a full bucket)."""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+class _Waiter:
+    def __init__(self, request_type: str, tokens: int):
+        self.request_type = request_type
+        self.tokens = tokens
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+class ModelLimiter:
+    """Per-model AIMD concurrency limit plus requests/min and tokens/min buckets, with a priority queue."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.limit = float(config.SCHEDULER_INITIAL_CONCURRENCY)
+        self.active = 0
+        self.paused_until = 0.0
+        self.requests_bucket = TokenBucket(config.SCHEDULER_REQUESTS_PER_MINUTE)
+        self.tokens_bucket = TokenBucket(config.SCHEDULER_TOKENS_PER_MINUTE)
+        self._queue = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self.counters = {"started": 0, "rate_limited": 0, "queued": 0, "deadline_expired": 0, "cancelled_on_grant": 0}
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def acquire(self, request_type: str, tokens: int, deadline: float | None = None):
+        waiter = _Waiter(request_type, tokens)
+        priority = config.REQUEST_PRIORITIES.get(request_type, max(config.REQUEST_PRIORITIES.values()) + 1)
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self._dispatch()
+        if not waiter.future.done():
+            self.counters["queued"] += 1
+        try:
+            if deadline is None:
+                await waiter.future
+            else:
+                # wait_for cancels the waiter on timeout, and _dispatch skips cancelled waiters
+                await asyncio.wait_for(waiter.future, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.counters["deadline_expired"] += 1
+            raise DeadlineExceeded("Request deadline passed while waiting for an upstream slot.")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted a slot just as the caller went away; hand it to the next waiter
+                self.release(rate_limited=False, retry_after=None, success=False)
+            raise
+        task = asyncio.current_task()
+        if task is not None and task.cancelling():
+            # wait_for returns the result when the slot is granted in the same tick as a cancel (client gone,
+            # last coalesced waiter left), swallowing the cancel; give the slot back instead of calling upstream
+            self.counters["cancelled_on_grant"] += 1
+            self.release(rate_limited=False, retry_after=None, success=False)
+            raise asyncio.CancelledError()
+        waited = time.monotonic() - waiter.enqueued_at
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def release(self, rate_limited: bool, retry_after: float | None, success: bool = True):
+        self.active -= 1
+        if rate_limited:
+            # Multiplicative decrease, and hold every request for this model until upstream says to retry
+            self.counters["rate_limited"] += 1
+            self.limit = max(float(config.SCHEDULER_MIN_CONCURRENCY), self.limit / 2)
+            pause = retry_after if retry_after is not None else config.SCHEDULER_DEFAULT_RETRY_AFTER
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            logger.warning("429 from '%s', limit now %.1f, paused %.1fs", self.model, self.limit, pause)
+        elif success:
+            # Additive increase: roughly +1 per window of `limit` successful calls
+            self.limit = min(float(config.SCHEDULER_MAX_CONCURRENCY), self.limit + 1 / self.limit)
+        self._dispatch()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._queue:
+            _, _, waiter = self._queue[0]
+            if waiter.future.done():
+                heapq.heappop(self._queue)  # Cancelled while queued
+                continue
+            if self.active >= int(self.limit):
+                return
+            delay = max(
+                self.paused_until - now,
+                self.requests_bucket.wait_time(1, now),
+                self.tokens_bucket.wait_time(waiter.tokens, now),
+            )
+            if delay > 0:
+                self._schedule_wakeup(delay)
+                return
+            heapq.heappop(self._queue)
+            self.requests_bucket.take(1)
+            self.tokens_bucket.take(waiter.tokens)
+            self.active += 1
+            self.counters["started"] += 1
+            waiter.future.set_result(None)
+
+    def _schedule_wakeup(self, delay: float):
+        if self._wakeup is not None and not self._wakeup.cancelled():
+            self._wakeup.cancel()
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def queue_depth(self) -> dict:
+        depth = {}
+        for _, _, waiter in self._queue:
+            if not waiter.future.done():
+                depth[waiter.request_type] = depth.get(waiter.request_type, 0) + 1
+        return depth
+
+    def stats(self) -> dict:
+        started = self.counters["started"]
+        return {
+            **self.counters,
+            "concurrency_limit": round(self.limit, 2),
+            "active": self.active,
+            "queue_depth": self.queue_depth(),
+            "avg_wait_ms": round(self.wait_seconds_total / started * 1000, 1) if started else 0.0,
+            "max_wait_ms": round(self.wait_seconds_max * 1000, 1),
+            "paused_for_s": round(max(0.0, self.paused_until - time.monotonic()), 2),
+        }
+
+class UpstreamScheduler:
+    def __init__(self):
+        self._limiters: dict[str, ModelLimiter] = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        if model not in self._limiters:
+            self._limiters[model] = ModelLimiter(model)
+        return self._limiters[model]
+
+    @asynccontextmanager
+    async def slot(self, model: str, request_type: str, tokens: int, deadline: float | None = None):
+        """Waits for a slot on `model` (504 if `deadline` passes first); a 429 raised inside the block backs the model off."""
+        limiter = self.limiter(model)
+        queued_at = time.perf_counter()
+        await limiter.acquire(request_type, tokens, deadline)
+        observe_span("queue_wait", time.perf_counter() - queued_at, model)
+        try:
+            yield
+        except HTTPException as e:
+            if e.status_code == 429:
+                limiter.release(rate_limited=True, retry_after=parse_retry_after(e.headers))
+            else:
+                limiter.release(rate_limited=False, retry_after=None, success=False)
+            raise
+        except BaseException:
+            limiter.release(rate_limited=False, retry_after=None, success=False)
+            raise
+        else:
+            limiter.release(rate_limited=False, retry_after=None)
+
+    def stats(self) -> dict:
+        return {model: limiter.stats() for model, limiter in self._limiters.items()}
+
+def parse_retry_after(headers: dict | None) -> float | None:
+    if not headers:
+        return None
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+upstream_scheduler = UpstreamScheduler()
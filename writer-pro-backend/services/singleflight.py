@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import time
+from services.scheduler import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# --- In-Flight Request Coalescing --- -
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Runs at most one upstream call per key; concurrent callers with the same key share its result or error.
+
+    The shared call is only cancelled once every waiter has gone away. Each waiter stops waiting at its own
+    `deadline`, and if the call runs out of the deadline it was started with, waiters that still have time start
+    it again under theirs, so a caller with a short budget never cuts the call short for one with a longer budget.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self.counters = {"leaders": 0, "coalesced": 0, "abandoned": 0, "restarted": 0}
+
+    async def do(self, key: str, coro_factory, deadline: float | None = None):
+        while True:
+            call = self._calls.get(key)
+            if call is None or call.task.done():
+                call = _Call(asyncio.create_task(coro_factory()))
+                self._calls[key] = call
+                call.task.add_done_callback(lambda _, call=call: self._forget(key, call))
+                self.counters["leaders"] += 1
+            else:
+                self.counters["coalesced"] += 1
+                logger.debug("Joining in-flight call %s (%d waiting)", key[:12], call.waiters)
+
+            call.waiters += 1
+            try:
+                return await self._wait(call, deadline)
+            except DeadlineExceeded:
+                if deadline is None or time.monotonic() >= deadline or not call.task.done():
+                    raise
+                # The call ran out of the budget of the caller that started it; this caller still has time
+                self.counters["restarted"] += 1
+                logger.debug("Call %s hit another caller's deadline, starting it again", key[:12])
+            finally:
+                call.waiters -= 1
+                if call.waiters == 0 and not call.task.done():
+                    logger.debug("Last waiter left, cancelling call %s", key[:12])
+                    call.task.cancel()
+                    self._forget(key, call)
+                    self.counters["abandoned"] += 1
+
+    @staticmethod
+    async def _wait(call: _Call, deadline: float | None):
+        # shield() so one waiter disconnecting or giving up does not cancel the call for everyone else
+        if deadline is None:
+            return await asyncio.shield(call.task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(call.task), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded() from None
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": self.in_flight()}
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+upstream_calls = SingleFlight()
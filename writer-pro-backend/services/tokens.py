@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+import config
+
+logger = logging.getLogger(__name__)
+
+# --- Pre-Flight Token Counting --- -
+# tiktoken stores each vocabulary under the sha1 of its download URL; if that file is present we never touch the network
+VOCAB_URLS = {
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+}
+ESTIMATE_PIECE_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]|\s+")
+
+def _load_encoding():
+    url = VOCAB_URLS.get(config.TOKENIZER_ENCODING)
+    if url is None:
+        return None
+    vocab_file = os.path.join(config.TOKENIZER_CACHE_DIR, hashlib.sha1(url.encode()).hexdigest())
+    if not os.path.exists(vocab_file):
+        logger.info("No bundled '%s' vocabulary in %s, using estimates", config.TOKENIZER_ENCODING, config.TOKENIZER_CACHE_DIR)
+        return None
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken is not installed, using estimates")
+        return None
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", config.TOKENIZER_CACHE_DIR)
+    return tiktoken.get_encoding(config.TOKENIZER_ENCODING)
+
+_encoding = None
+_encoding_loaded = False
+
+def get_encoding():
+    """The BPE encoding, loaded lazily on first use; None means counts are estimated."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding = _load_encoding()
+        _encoding_loaded = True
+    return _encoding
+
+def tokenizer_name() -> str:
+    return config.TOKENIZER_ENCODING if get_encoding() is not None else "estimate"
+
+def estimate_tokens(text: str) -> int:
+    """Offline approximation of BPE counts: common words are one token, long words ~6 letters per token,
+    digits in groups of 3 and one token per symbol."""
+    count = 0
+    for piece in ESTIMATE_PIECE_PATTERN.findall(text):
+        if piece.isspace():
+            count += piece.count("\n") > 0  # Spaces merge into the next word; line breaks cost a token
+        elif piece.isascii():
+            count += math.ceil(len(piece) / 6)
+        else:
+            count += 1  # Non-ASCII (accents, CJK, emoji) is closer to a token per character
+    return count
+
+# Keyed on a digest of the text, so the cache holds 16 bytes per entry instead of whole request bodies.
+# Counted on the event loop and from worker threads (InstructionStore.register), so every access holds the lock
+_counts: OrderedDict[bytes, int] = OrderedDict()
+_counts_lock = threading.Lock()
+
+def count_tokens(text: str) -> int:
+    """Token count for `text`, LRU-cached so repeated system instructions are only encoded once."""
+    key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+    with _counts_lock:
+        count = _counts.get(key)
+        if count is not None:
+            _counts.move_to_end(key)
+            return count
+    # Encoded outside the lock: two threads may count the same text, but neither waits on the other
+    encoding = get_encoding()
+    count = estimate_tokens(text) if encoding is None else len(encoding.encode(text, disallowed_special=()))
+    with _counts_lock:
+        _counts[key] = count
+        _counts.move_to_end(key)
+        while len(_counts) > config.TOKEN_COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+    return count
+
+def token_windows(text: str, max_tokens: int) -> list[str]:
+    """Cuts `text` into consecutive pieces of at most `max_tokens` tokens at token boundaries, for text with no
+    spaces to split on (CJK, a long URL). Pieces can end mid-word; joined back together they are `text`."""
+    encoding = get_encoding()
+    if encoding is not None:
+        _, offsets = encoding.decode_with_offsets(encoding.encode(text, disallowed_special=()))
+        cuts = offsets[max_tokens::max_tokens]
+    else:
+        cuts, used = [], 0
+        for match in ESTIMATE_PIECE_PATTERN.finditer(text):
+            piece = match.group()
+            # A run of letters is estimated at 6 per token, so a long one can be cut inside
+            step = 6 if piece.isascii() and piece.isalpha() else len(piece)
+            for offset in range(0, len(piece), step):
+                tokens = estimate_tokens(piece[offset:offset + step])
+                if used and used + tokens > max_tokens:
+                    cuts.append(match.start() + offset)
+                    used = 0
+                used += tokens
+    windows = [text[start:end] for start, end in zip([0, *cuts], [*cuts, len(text)]) if end > start]
+    pieces = []
+    for window in windows:
+        # BPE can merge differently either side of a cut, so a window may re-encode a token or two over
+        if len(window) > 1 and count_tokens(window) > max_tokens:
+            middle = len(window) // 2
+            pieces += token_windows(window[:middle], max_tokens) + token_windows(window[middle:], max_tokens)
+        else:
+            pieces.append(window)
+    return pieces
+
+def count_message_tokens(messages: list[dict]) -> int:
+    # Chat formatting adds a few tokens per message on top of the content
+    return sum(count_tokens(message.get("content") or "") + 4 for message in messages) + 3
+
+def completion_budget(request_type: str, platform: str | None = None, content_tokens: int = 0) -> int:
+    """max_tokens sized to the expected output instead of a flat 2048."""
+    if request_type == "optimize":
+        character_limit = config.PLATFORM_LIMITS.get(platform, config.PLATFORM_LIMITS["default"])
+        budget = character_limit // 3 + 64  # ~3 characters per token leaves room for hashtags, emoji and URLs
+    elif request_type == "rewrite":
+        budget = int(content_tokens * 1.3) + 128
+    elif request_type == "reply":
+        budget = 512
+    else:
+        budget = config.DEFAULT_MAX_TOKENS
+    return min(budget, config.MAX_COMPLETION_TOKENS)
@@ -0,0 +1,113 @@
+import asyncio
+import time
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+import config
+import models
+from routes import batch
+from services.deadlines import DeadlineMiddleware, request_deadline
+from services.jsoncodec import loads
+from services.scheduler import DeadlineExceeded
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Replaces the upstream call with one that takes `seconds` (or `delays[comment]`) and honours the deadline it
+    runs under. Comments in `errors` raise that error instead; `active` and `peak` count concurrent calls."""
+    settings = {"seconds": 0.1, "delays": {}, "errors": {}, "active": 0, "peak": 0}
+
+    async def call_openai_api(prompt, instruction, custom_instruction, request_type, client, use_cache, max_tokens):
+        deadline = request_deadline(request_type)
+        comment = next((comment for comment in {**settings["delays"], **settings["errors"]} if comment in prompt), None)
+        settings["active"] += 1
+        settings["peak"] = max(settings["peak"], settings["active"])
+        try:
+            await asyncio.sleep(settings["delays"].get(comment, settings["seconds"]))
+        finally:
+            settings["active"] -= 1
+        if comment in settings["errors"]:
+            raise settings["errors"][comment]
+        if time.monotonic() > deadline:
+            raise DeadlineExceeded()
+        return prompt
+
+    monkeypatch.setattr(batch, "call_openai_api", call_openai_api)
+    return settings
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(batch.router)
+    app.add_middleware(DeadlineMiddleware)
+    app.state.http_client = None
+    app.state.instruction_store = None
+    return TestClient(app)
+
+def run_batch(client, jobs: list[dict], headers: dict | None = None) -> tuple[list[dict], dict]:
+    response = client.post("/batch", json={"jobs": jobs}, headers=headers or {})
+    assert response.status_code == 200
+    lines = [loads(line) for line in response.text.splitlines()]
+    return lines[:-1], lines[-1]
+
+def replies(count: int) -> list[dict]:
+    return [{"type": "reply", "id": f"job-{i}", "comment": f"comment {i}", "tone": "friendly"} for i in range(count)]
+
+@pytest.mark.parametrize("headers", [None, {"X-Request-Timeout": "0.25"}])
+def test_queued_items_do_not_spend_their_deadline_waiting(client, upstream, monkeypatch, headers):
+    monkeypatch.setattr(config, "REQUEST_DEADLINES", {request_type: 0.25 for request_type in config.REQUEST_DEADLINES})
+    monkeypatch.setattr(config, "BATCH_MAX_CONCURRENCY", 2)
+    # Four waves of 0.1s each: the batch outlasts one budget, but no item does
+    results, summary = run_batch(client, replies(8), headers)
+    assert summary["failed"] == 0
+    assert all(result["status"] == "ok" for result in results)
+
+def test_slow_item_still_hits_its_own_deadline(client, upstream, monkeypatch):
+    monkeypatch.setattr(config, "REQUEST_DEADLINES", {request_type: 0.25 for request_type in config.REQUEST_DEADLINES})
+    upstream["seconds"] = 0.3
+    results, summary = run_batch(client, replies(1))
+    assert summary["failed"] == 1
+    assert results[0]["error"]["status"] == 504
+
+def test_one_failing_item_does_not_fail_the_others(client, upstream):
+    upstream["errors"] = {"rate limited": HTTPException(status_code=429, detail="Slow down"), "crash": RuntimeError("bug")}
+    jobs = replies(2) + [
+        {"type": "reply", "id": "limited", "comment": "rate limited", "tone": "calm"},
+        {"type": "reply", "id": "crashed", "comment": "crash", "tone": "calm"},
+        {"type": "reply", "id": "no-tone", "comment": "missing its tone"},
+        {"type": "rewrite", "id": "no-style", "content": "text", "base_system_instruction": "Rewrite."},
+    ]
+    results, summary = run_batch(client, jobs)
+    outcomes = {result["id"]: (result["status"], result.get("error", {}).get("status")) for result in results}
+    assert outcomes == {
+        "job-0": ("ok", None), "job-1": ("ok", None),
+        "limited": ("error", 429), "crashed": ("error", 500), "no-tone": ("error", 422), "no-style": ("error", 422),
+    }
+    assert summary["failed"] == 4
+    assert summary["jobs"] == 6
+
+def test_results_stream_in_completion_order_with_their_index(client, upstream):
+    upstream["delays"] = {"comment 0": 0.3, "comment 1": 0.2, "comment 2": 0.1}
+    results, summary = run_batch(client, replies(3))
+    assert [result["index"] for result in results] == [2, 1, 0]
+    assert [result["id"] for result in results] == ["job-2", "job-1", "job-0"]
+    assert all(f"comment {result['index']}" in result["result"] for result in results)
+    assert summary["done"]
+
+def test_concurrency_is_capped(client, upstream, monkeypatch):
+    monkeypatch.setattr(config, "BATCH_MAX_CONCURRENCY", 3)
+    upstream["seconds"] = 0.05
+    results, summary = run_batch(client, replies(10))
+    assert summary["failed"] == 0
+    assert sorted(result["index"] for result in results) == list(range(10))
+    assert upstream["peak"] == 3
+
+def test_batch_size_is_validated(client, monkeypatch):
+    monkeypatch.setattr(config, "BATCH_MAX_JOBS", 2)
+    assert client.post("/batch", json={"jobs": []}).status_code == 422
+    assert client.post("/batch", json={"jobs": replies(3)}).status_code == 422
+
+def test_shorthand_expands_after_explicit_jobs():
+    request = models.BatchRequest(jobs=replies(1), content="Post", platforms=["twitter", "linkedin"], styles=["formal"])
+    assert [(job.type, job.platform or job.style) for job in batch.expand_jobs(request)] == [
+        ("reply", None), ("optimize", "twitter"), ("optimize", "linkedin"), ("rewrite", "formal"),
+    ]
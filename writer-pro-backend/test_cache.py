@@ -0,0 +1,140 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+import config
+from services import cache, openai
+from services.cache import ResponseCache, cache_allowed, fingerprint
+from services.history import generation_history
+from services.router import model_router
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the wall clock the cache reads, so TTLs can be crossed without sleeping."""
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"model": "m", "messages": [{"role": "user", "content": "hi"}]}) == fingerprint({"messages": [{"content": "hi", "role": "user"}], "model": "m"})
+    assert fingerprint({"model": "m", "max_tokens": 10}) != fingerprint({"model": "m", "max_tokens": 11})
+
+def test_least_recently_used_entry_is_evicted_first():
+    async def run():
+        lru = ResponseCache(max_entries=3, max_bytes=1024, ttl_seconds=60)
+        for key in "abc":
+            await lru.set(key, key.upper())
+        assert await lru.get("a") == "A"  # Now the most recently used
+        await lru.set("d", "D")
+        assert [await lru.get(key) for key in "abcd"] == ["A", None, "C", "D"]
+        assert lru.counters["evictions"] == 1
+
+    asyncio.run(run())
+
+def test_entries_are_also_bounded_by_size():
+    async def run():
+        lru = ResponseCache(max_entries=100, max_bytes=10, ttl_seconds=60)
+        await lru.set("a", "aaaa")
+        await lru.set("b", "ééé")  # 6 bytes of UTF-8
+        await lru.set("c", "cccc")
+        assert await lru.get("a") is None
+        assert lru.stats()["bytes"] == 10
+        await lru.set("huge", "x" * 11)  # Larger than the whole cache: not stored, nothing evicted
+        assert await lru.get("huge") is None
+        assert [await lru.get(key) for key in "bc"] == ["ééé", "cccc"]
+
+    asyncio.run(run())
+
+def test_entries_expire_after_the_ttl(clock):
+    async def run():
+        lru = ResponseCache(max_entries=10, max_bytes=1024, ttl_seconds=60)
+        await lru.set("key", "value")
+        clock.value += 60
+        assert await lru.get("key") == "value"
+        clock.value += 1
+        assert await lru.get("key") is None
+        assert (lru.counters["expirations"], lru.counters["misses"], lru.stats()["entries"]) == (1, 1, 0)
+
+    asyncio.run(run())
+
+def test_sqlite_tier_survives_a_restart_and_honours_the_ttl(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def run():
+        before = ResponseCache(max_entries=10, max_bytes=1024, ttl_seconds=60, sqlite_path=path)
+        await before.set("kept", "from disk")
+        clock.value += 30
+        await before.set("stale", "too old")
+        before.close()
+
+        after = ResponseCache(max_entries=10, max_bytes=1024, ttl_seconds=60, sqlite_path=path)
+        assert await after.get("kept") == "from disk"
+        assert await after.get("kept") == "from disk"  # Promoted to memory by the first read
+        assert (after.counters["disk_hits"], after.counters["hits"]) == (1, 1)
+
+        clock.value += 45
+        assert await after.get("stale") == "too old"
+        clock.value += 30
+        assert await after.get("stale") is None
+        assert after._disk.purge_expired() == 2
+        after.close()
+
+    asyncio.run(run())
+
+def test_misses_fall_back_to_recent_history(clock):
+    class History:
+        async def lookup(self, key: str, not_before: float):
+            assert not_before == clock.value - 60
+            return ("remembered", clock.value - 50) if key == "known" else None
+
+    async def run():
+        lru = ResponseCache(max_entries=10, max_bytes=1024, ttl_seconds=60)
+        lru.attach_history(History())
+        assert await lru.get("known") == "remembered"
+        assert await lru.get("unknown") is None
+        clock.value += 11  # Expires with the original generation, not a fresh TTL
+        assert await lru.get("known") == "remembered"
+        assert lru.counters["history_hits"] == 2
+
+    asyncio.run(run())
+
+@pytest.mark.parametrize("headers, allowed", [
+    ({}, True),
+    ({"X-Cache-Bypass": "true"}, False),
+    ({"X-Cache-Bypass": "1"}, False),
+    ({"X-Cache-Bypass": "no"}, True),
+    ({"Cache-Control": "no-cache"}, False),
+    ({"Cache-Control": "max-age=0"}, True),
+])
+def test_cache_bypass_headers(monkeypatch, headers, allowed):
+    lru = ResponseCache(max_entries=10, max_bytes=1024, ttl_seconds=60)
+    monkeypatch.setattr(cache, "response_cache", lru)
+    app = FastAPI()
+
+    @app.get("/")
+    def route(use_cache: bool = Depends(cache_allowed)):
+        return use_cache
+
+    assert TestClient(app).get("/", headers=headers).json() is allowed
+    assert lru.counters["bypasses"] == (0 if allowed else 1)
+
+def test_bypass_skips_the_cached_answer_but_refreshes_it(monkeypatch):
+    lru = ResponseCache(max_entries=10, max_bytes=1024, ttl_seconds=60)
+    monkeypatch.setattr(openai, "response_cache", lru)
+    monkeypatch.setitem(config.CACHE_ENABLED, "reply", True)
+    monkeypatch.setattr(model_router.providers["openai"], "api_key", "test-key")
+    monkeypatch.setattr(generation_history, "record", lambda *args, **kwargs: None)
+    answers = iter(["first", "second"])
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": next(answers)}}],
+                                         "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6}})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+            return [await openai.call_openai_api("Cached prompt", "instruction", None, "reply", client, use_cache, 50)
+                    for use_cache in (True, True, False, True)]
+
+    assert asyncio.run(run()) == ["first", "first", "second", "second"]
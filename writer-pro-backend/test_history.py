@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from routes.history import router
+from services import history, ratelimit
+from services.history import GenerationHistory, HistoryStore, search_query
+from services.ratelimit import act_for_caller
+
+ALICE, BOB = "key:alice", "key:bob"
+
+def row(caller: str, prompt: str, output: str = "output", request_type: str = "reply", created_at: float = 1000.0) -> tuple:
+    return (created_at, request_type, "/generate-reply", "hash", "gpt-4o", prompt, output, 10, 20, None, 150.0, 0, caller)
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    yield store
+    store.close()
+
+def test_pages_walk_every_record_once_newest_first(store):
+    store.insert_many([row(ALICE if i % 3 else BOB, f"prompt {i}", request_type="outline" if i % 2 else "reply") for i in range(36)])
+    seen, before = [], None
+    while True:
+        page = store.page(ALICE, before, 10)
+        seen += [record["id"] for record in page]
+        if len(page) < 10:
+            break
+        before = page[-1]["id"]
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == len(set(seen)) == 24
+
+    outlines = store.page(ALICE, None, 100, "outline")
+    assert outlines and all(record["request_type"] == "outline" and record["caller"] == ALICE for record in outlines)
+
+def test_search_matches_every_word_and_prefixes(store):
+    store.insert_many([
+        row(ALICE, "Plan the product launch", "A launch checklist"),
+        row(ALICE, "Weekly update", "Nothing about launches"),
+        row(ALICE, "Launch retrospective", "What went wrong"),
+        row(BOB, "Bob's launch plan", "Private to Bob"),
+    ])
+    assert store.searchable
+    assert [record["prompt"] for record in store.search(ALICE, search_query("launch plan"), None, 10)] == ["Plan the product launch"]
+    assert len(store.search(ALICE, search_query("launch*"), None, 10)) == 3
+    newest = store.search(ALICE, search_query("launch"), None, 1)
+    assert [record["prompt"] for record in newest] == ["Launch retrospective"]
+    assert [record["prompt"] for record in store.search(ALICE, search_query("launch"), newest[0]["id"], 10)] == ["Plan the product launch"]
+
+def test_search_query_quotes_each_word():
+    assert search_query('launch "plan" draft*') == '"launch" """plan""" "draft"*'
+    assert search_query("* **") == ""
+
+def test_callers_only_see_their_own_records(store):
+    store.insert_many([row(ALICE, "alice secret"), row(BOB, "bob secret"), row(None, "from before callers were recorded")])
+    alice_id = store.page(ALICE, None, 10)[0]["id"]
+    assert [record["prompt"] for record in store.page(BOB, None, 10)] == ["bob secret"]
+    assert store.get(BOB, alice_id) is None
+    assert store.get(ALICE, alice_id)["prompt"] == "alice secret"
+    assert [record["prompt"] for record in store.search(BOB, search_query("secret"), None, 10)] == ["bob secret"]
+
+def test_records_are_attributed_to_the_current_caller(store):
+    recorder = GenerationHistory()
+    recorder.store = store
+
+    async def run():
+        act_for_caller(ALICE)
+        recorder.record("reply", "hash", "gpt-4o", "prompt", "output", {"prompt_tokens": 3, "completion_tokens": 4}, 0.25)
+        await recorder.flush()
+
+    asyncio.run(run())
+    [record] = store.page(ALICE, None, 10)
+    assert (record["prompt_tokens"], record["completion_tokens"], record["latency_ms"]) == (3, 4, 250.0)
+
+@pytest.fixture
+def client(store, monkeypatch):
+    monkeypatch.setattr(history.generation_history, "store", store)
+    monkeypatch.setattr(ratelimit, "_api_keys", {ratelimit.hashlib.sha256(key.encode()).hexdigest()[:16] for key in ("alice", "bob")})
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+def test_history_endpoints_need_an_api_key(client):
+    for path in ("/history", "/history/search?q=launch", "/history/1"):
+        assert client.get(path).status_code == 403
+        assert client.get(path, headers={"X-API-Key": "not-configured"}).status_code == 403
+
+def test_history_endpoints_are_scoped_to_the_key(client, store):
+    alice, bob = ratelimit.identify_caller({"headers": [(b"x-api-key", b"alice")]}), ratelimit.identify_caller({"headers": [(b"x-api-key", b"bob")]})
+    store.insert_many([row(alice, "alice launch"), row(bob, "bob launch")])
+    alice_id = store.page(alice, None, 10)[0]["id"]
+
+    page = client.get("/history", headers={"X-API-Key": "bob"}).json()
+    assert [item["prompt"] for item in page["items"]] == ["bob launch"]
+    assert page["nextCursor"] is None
+    assert [item["prompt"] for item in client.get("/history/search?q=launch", headers={"X-API-Key": "bob"}).json()["items"]] == ["bob launch"]
+    assert client.get(f"/history/{alice_id}", headers={"X-API-Key": "bob"}).status_code == 404
+    assert client.get(f"/history/{alice_id}", headers={"X-API-Key": "alice"}).json()["prompt"] == "alice launch"
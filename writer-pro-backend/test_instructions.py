@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from services.instructions import InstructionStore, instruction_hash
+
+@pytest.fixture
+def store(tmp_path):
+    store = InstructionStore(str(tmp_path / "instructions.sqlite3"), memory_entries=8)
+    yield store
+    store.close()
+
+def test_registered_instructions_resolve_from_memory_then_sqlite(store, tmp_path):
+    registered = store.register("Write like a pirate.")
+    assert registered["hash"] == instruction_hash("Write like a pirate.")
+    assert store.cached(registered["hash"]) == "Write like a pirate."
+
+    other = InstructionStore(str(tmp_path / "instructions.sqlite3"), memory_entries=8)
+    try:
+        assert other.cached(registered["hash"]) is None
+        assert other.get(registered["hash"]) == "Write like a pirate."
+        assert other.cached(registered["hash"]) == "Write like a pirate."
+        assert other.get(instruction_hash("never registered")) is None
+    finally:
+        other.close()
+
+def test_memory_is_consistent_under_concurrent_use(store):
+    instructions = [f"Instruction {i}" for i in range(64)]
+
+    def use(offset: int):
+        for i in range(400):
+            instruction = instructions[(i + offset) % len(instructions)]
+            key = instruction_hash(instruction)
+            if i % 3 == 0:
+                store.register(instruction)
+            assert store.get(key) in (instruction, None)
+            assert store.cached(key) in (instruction, None)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(use, range(0, 64, 8)))
+    assert len(store._memory) == 8
+    assert all(store.get(instruction_hash(instruction)) == instruction for instruction in instructions)
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import sqlite3
+import time
+import pytest
+from fastapi import HTTPException
+import config
+from services import jobs
+from services.jobs import JobStore, JobWorkerPool
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+def test_jobs_are_claimed_oldest_first_and_only_once(store):
+    first = store.submit("outline", {"contentDescription": "first"})
+    second = store.submit("outline", {"contentDescription": "second"})
+    assert store.queue_depth() == 2
+    assert store.get(first)["status"] == "queued"
+
+    claimed = store.claim_next("worker-a")
+    assert (claimed["id"], claimed["type"], json.loads(claimed["payload"])) == (first, "outline", {"contentDescription": "first"})
+    assert store.claim_next("worker-b")["id"] == second
+    assert store.claim_next("worker-c") is None
+    assert store.get(first)["status"] == "running"
+
+def test_finish_records_the_outcome_for_the_owning_worker_only(store):
+    job_id = store.submit("outline", {})
+    store.claim_next("worker-a")
+    store.finish(job_id, "worker-b", "succeeded", "not mine")
+    assert store.get(job_id)["status"] == "running"
+
+    store.finish(job_id, "worker-a", "failed", None, {"status": 502, "detail": "upstream"})
+    job = store.get(job_id)
+    assert job["status"] == "failed"
+    assert json.loads(job["error"]) == {"status": 502, "detail": "upstream"}
+    assert job["finished_at"] is not None
+    assert not store.heartbeat(job_id, "worker-a")
+
+def test_cancelled_jobs_stop_heartbeating(store):
+    job_id = store.submit("outline", {})
+    store.claim_next("worker-a")
+    assert store.heartbeat(job_id, "worker-a")
+    assert store.cancel(job_id)
+    assert not store.heartbeat(job_id, "worker-a")
+    assert not store.cancel(job_id)
+
+def test_running_jobs_of_a_dead_process_are_requeued_after_a_restart(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.sqlite3")
+    crashed = JobStore(path)
+    job_id = crashed.submit("outline", {"contentDescription": "survives"})
+    crashed.claim_next("dead-worker")
+    crashed.close()
+
+    monkeypatch.setattr(config, "JOB_STALE_SECONDS", 0)
+    restarted = JobStore(path)
+    try:
+        time.sleep(0.01)
+        assert restarted.maintain() == (1, 0)
+        assert restarted.get(job_id)["status"] == "queued"
+        assert restarted.claim_next("new-worker")["id"] == job_id
+    finally:
+        restarted.close()
+
+def test_expired_jobs_are_purged(store, monkeypatch):
+    monkeypatch.setattr(config, "JOB_RESULT_TTL_SECONDS", -1)
+    job_id = store.submit("outline", {})
+    assert store.get(job_id) is None
+    assert store.maintain() == (0, 1)
+
+class FlakyStore(JobStore):
+    """Fails the first `failures` finish calls as SQLite does when another process holds the write lock."""
+
+    def __init__(self, path: str, failures: int):
+        super().__init__(path)
+        self.failures = failures
+
+    def finish(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        super().finish(*args, **kwargs)
+
+def run_pool(store: JobStore, until, timeout: float = 5):
+    async def run():
+        pool = JobWorkerPool(store, None, size=1)
+        pool.start()
+        try:
+            deadline = time.monotonic() + timeout
+            while not until() and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+        finally:
+            await pool.stop()
+        return pool
+
+    return asyncio.run(run())
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setattr(config, "JOB_POLL_INTERVAL", 0.01)
+
+    async def outline(payload, client):
+        if payload.get("fail"):
+            raise HTTPException(status_code=502, detail="upstream failed")
+        return f"outline for {payload['contentDescription']}"
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "outline", outline)
+
+def test_worker_runs_jobs_and_records_failures(store, handler):
+    ok = store.submit("outline", {"contentDescription": "launch"})
+    failed = store.submit("outline", {"contentDescription": "launch", "fail": True})
+    unknown = store.submit("poem", {})
+    run_pool(store, lambda: store.queue_depth() == 0 and store.get(unknown)["status"] != "running")
+
+    assert (store.get(ok)["status"], store.get(ok)["result"]) == ("succeeded", "outline for launch")
+    assert json.loads(store.get(failed)["error"]) == {"status": 502, "detail": "upstream failed"}
+    assert json.loads(store.get(unknown)["error"])["status"] == 400
+
+@pytest.mark.parametrize("failures", [1, 2])
+def test_worker_survives_the_store_failing_to_record_a_result(tmp_path, handler, monkeypatch, failures):
+    store = FlakyStore(str(tmp_path / "jobs.sqlite3"), failures)
+    try:
+        first = store.submit("outline", {"contentDescription": "first"})
+        second = store.submit("outline", {"contentDescription": "second"})
+        run_pool(store, lambda: store.get(second)["status"] == "succeeded")
+        assert store.get(second)["result"] == "outline for second"
+
+        if failures == 1:
+            # The result could not be saved, so the job is marked failed
+            assert store.get(first)["status"] == "failed"
+            assert json.loads(store.get(first)["error"])["status"] == 500
+        else:
+            # Marking it failed did not work either: its lease goes stale and maintenance requeues it
+            assert store.get(first)["status"] == "running"
+            monkeypatch.setattr(config, "JOB_STALE_SECONDS", 0)
+            time.sleep(0.01)
+            assert store.maintain() == (1, 0)
+            assert store.get(first)["status"] == "queued"
+    finally:
+        store.close()
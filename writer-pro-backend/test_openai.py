@@ -0,0 +1,147 @@
+import asyncio
+import time
+import httpx
+import pytest
+from fastapi import HTTPException
+import config
+from services.jsoncodec import dumps, loads
+from services.openai import extract_text_from_delta, parse_completion, parse_sse_line, post_completion, stream_candidate
+from services.resilience import resilient_caller
+from services.router import Candidate, Provider, model_router
+from services.scheduler import DeadlineExceeded
+
+class StalledStream(httpx.AsyncByteStream):
+    """Sends one delta, then stalls until the read timeout the client asked for, as a slow but healthy upstream does."""
+
+    def __init__(self, request: httpx.Request):
+        self.request = request
+
+    async def __aiter__(self):
+        yield b'data: {"choices": [{"delta": {"content": "Hi"}}]}\n\n'
+        await asyncio.sleep(self.request.extensions["timeout"]["read"])
+        raise httpx.ReadTimeout("timed out", request=self.request)
+
+def stalled_upstream(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, stream=StalledStream(request))
+
+def stream(key: str, deadline_in: float):
+    candidate = Candidate(key, Provider("stub", "http://upstream.test/v1/chat/completions", None), "stub-model")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(stalled_upstream)) as client:
+            return [delta async for delta in stream_candidate(candidate, "prompt", "instruction", "reply", client, 50, time.monotonic() + deadline_in)]
+
+    return asyncio.run(run())
+
+def test_stream_cut_off_by_the_request_deadline_is_not_an_upstream_failure(monkeypatch):
+    monkeypatch.setattr(config, "BREAKER_FAILURE_THRESHOLD", 3)
+    for _ in range(5):
+        with pytest.raises(DeadlineExceeded) as raised:
+            stream("stub:deadline", 0.05)
+        assert raised.value.status_code == 504
+    assert resilient_caller.breaker("stub:deadline").state == "closed"
+    assert resilient_caller.breaker("stub:deadline").consecutive_failures == 0
+    assert model_router.stats_for("stub:deadline").samples == 0
+
+def test_stream_read_timeout_before_the_deadline_counts_against_the_model(monkeypatch):
+    monkeypatch.setattr(config, "HTTP_READ_TIMEOUT", 0.05)
+    with pytest.raises(HTTPException) as raised:
+        stream("stub:read-timeout", 30)
+    assert raised.value.status_code == 503
+    assert resilient_caller.breaker("stub:read-timeout").consecutive_failures == 1
+    assert model_router.stats_for("stub:read-timeout").error_rate > 0
+
+USAGE = {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15}
+
+@pytest.mark.parametrize("data, expected", [
+    ({"choices": [{"message": {"role": "assistant", "content": "Plain"}}], "usage": USAGE}, ("Plain", USAGE)),
+    ({"choices": [{"message": {"content": [{"type": "text", "text": "Two "}, {"type": "text", "text": "parts"}]}}]}, ("Two parts", None)),
+    ({"output": [
+        {"type": "web_search_call", "web_search_results": [{"text": "search result"}]},
+        {"type": "message", "content": [{"type": "output_text", "text": "Answer ", "annotations": []}]},
+        {"type": "message", "content": [{"type": "output_text", "text": "continued"}]},
+    ], "usage": USAGE}, ("Answer continued", USAGE)),
+    ({"output": [
+        {"type": "web_search_call", "web_search_results": [{"text": "first"}, {"title": "no text"}, "junk"]},
+        {"type": "web_search_call", "web_search_results": [{"text": "second"}]},
+    ]}, ("first\n\nsecond", None)),
+    ({"text": "Top-level text"}, ("Top-level text", None)),
+    ([{"type": "message", "text": "From a bare list"}], ("From a bare list", None)),
+    ("Just a string", ("Just a string", None)),
+])
+def test_parse_completion_shapes(data, expected):
+    assert parse_completion(loads(dumps(data))) == expected
+
+@pytest.mark.parametrize("data", [
+    {},
+    {"choices": []},
+    {"choices": [None]},
+    {"choices": [{"finish_reason": "length"}]},
+    {"choices": [{"message": {"role": "assistant", "content": None, "refusal": "No."}}]},
+    {"choices": [{"message": {"content": [{"type": "image"}, "junk"]}}]},
+    {"output": []},
+    {"output": ["junk", None, {"type": "reasoning"}]},
+    {"output": [{"type": "web_search_call", "web_search_results": None}]},
+    None,
+    42,
+])
+def test_parse_completion_without_text(data):
+    text, _ = parse_completion(data)
+    assert text is None
+
+def test_partial_payloads_fall_through_to_the_next_shape():
+    # A chat completion whose message is empty still yields the Responses API output next to it
+    data = {"choices": [{"message": {"content": ""}}], "output": [{"type": "message", "content": "From output"}], "usage": USAGE}
+    assert parse_completion(data) == ("From output", USAGE)
+
+@pytest.mark.parametrize("line, expected", [
+    ('data: {"a": 1}', '{"a": 1}'),
+    ("data:[DONE]", "[DONE]"),
+    ("", None),
+    (": keep-alive", None),
+    ("event: message", None),
+])
+def test_parse_sse_line(line, expected):
+    assert parse_sse_line(line) == expected
+
+@pytest.mark.parametrize("chunk, expected", [
+    ({"choices": [{"delta": {"content": "Hi"}}]}, "Hi"),
+    ({"choices": [{"delta": {"role": "assistant"}}]}, None),
+    ({"choices": [], "usage": USAGE}, None),
+    ({"type": "response.output_text.delta", "delta": "Hey"}, "Hey"),
+    ({"type": "response.completed"}, None),
+    ("not a chunk", None),
+])
+def test_extract_text_from_delta(chunk, expected):
+    assert extract_text_from_delta(chunk) == expected
+
+def post(body: bytes, status_code: int = 200):
+    async def run():
+        transport = httpx.MockTransport(lambda request: httpx.Response(status_code, content=body, headers={"Content-Type": "application/json"}))
+        async with httpx.AsyncClient(transport=transport) as client:
+            outcome = {}
+            return await post_completion(client, {}, {"model": "gpt-4o", "messages": []}, None, None, outcome), outcome
+
+    return asyncio.run(run())
+
+def test_post_completion_returns_text_and_usage():
+    text, outcome = post(dumps({"choices": [{"message": {"content": "Done"}}], "usage": USAGE}))
+    assert text == "Done"
+    assert outcome == {"model": "gpt-4o", "usage": USAGE}
+
+@pytest.mark.parametrize("body, detail", [
+    (b'{"choices": [{"message": {"content": "cut off', "An internal server error occurred."),
+    (b"<html>Bad gateway</html>", "An internal server error occurred."),
+    (b"", "An internal server error occurred."),
+    (dumps({"choices": [{"message": {"content": None}}]}), "Failed to parse content from OpenAI API response."),
+    (dumps({"output": []}), "Failed to parse content from OpenAI API response."),
+])
+def test_post_completion_rejects_malformed_and_empty_payloads(body, detail):
+    with pytest.raises(HTTPException) as raised:
+        post(body)
+    assert (raised.value.status_code, raised.value.detail) == (500, detail)
+
+def test_post_completion_passes_upstream_errors_through():
+    with pytest.raises(HTTPException) as raised:
+        post(dumps({"error": {"message": "Rate limit reached", "type": "rate_limit"}}), 429)
+    assert raised.value.status_code == 429
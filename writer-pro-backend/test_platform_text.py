@@ -0,0 +1,108 @@
+import pytest
+import config
+from services import platform_text
+from services.platform_text import fit_to_limit, grapheme_length, normalize, trim_to_limit, truncate_words, twitter_length
+
+FLAG = "\U0001F1EE\U0001F1F3"
+FAMILY = "\U0001F468\u200d\U0001F469\u200d\U0001F467"
+THUMBS_UP_DARK = "\U0001F44D\U0001F3FF"
+DECOMPOSED_E = "e\u0301"
+
+@pytest.fixture(params=["regex", "fallback"])
+def segmenter(request, monkeypatch):
+    """Runs a test with the regex module's segmentation and again with the fallback used when it is missing."""
+    if request.param == "fallback":
+        monkeypatch.setattr(platform_text, "_GRAPHEME", None)
+    elif platform_text._GRAPHEME is None:
+        pytest.skip("regex module not installed")
+
+@pytest.mark.parametrize("text, expected", [
+    ("plain ascii", 11),
+    ("line\r\nbreak", 10),
+    (FLAG, 1),
+    (FAMILY, 1),
+    (THUMBS_UP_DARK, 1),
+    (f"caf{DECOMPOSED_E}", 4),
+    (f"Go {FLAG}{FLAG} {FAMILY}!", 8),
+])
+def test_grapheme_length(segmenter, text, expected):
+    assert grapheme_length(text) == expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("hello", 5),
+    ("see https://example.com/a/very/long/path?with=query_strings_that_go_on", 4 + config.TWITTER_URL_LENGTH),
+    ("www.example.com.", config.TWITTER_URL_LENGTH + 1),  # The full stop is not part of the link
+    (FAMILY, 2),
+    (THUMBS_UP_DARK, 2),
+    ("❤️", 2),
+    ("日本語", 6),
+    (f"caf{DECOMPOSED_E}", 4),  # Counted after NFC, where é is one code point
+    ("Привет “world”", 14),
+])
+def test_twitter_length(segmenter, text, expected):
+    assert twitter_length(text) == expected
+
+def test_normalize_strips_markdown_except_on_blog():
+    text = '"# Launch day\n\n**Big** news: read [the post](https://example.com/a_b)   now\n* one\n* two"'
+    assert normalize(text, "twitter") == "Launch day\n\nBig news: read the post https://example.com/a_b now\n• one\n• two"
+    assert normalize(text, "blog") == "# Launch day\n\n**Big** news: read [the post](https://example.com/a_b)   now\n* one\n* two"
+
+def test_normalize_keeps_hashtags_and_collapses_blank_lines():
+    assert normalize("Ship it\u200b \n\n\n\n#launch #startup  ", "linkedin") == "Ship it\n\n#launch #startup"
+
+def test_trim_drops_hashtags_first_but_keeps_one():
+    text = "One. Two. #alpha #beta #gamma"
+    assert trim_to_limit(text, 23, len) == ("One. Two. #alpha #beta", ["hashtags_dropped"])
+    assert trim_to_limit(text, 16, len) == ("One. Two. #alpha", ["hashtags_dropped"])
+
+def test_trim_drops_sentences_once_hashtags_are_down_to_one():
+    text = "First point. Second point. Third point.\n\n#alpha #beta"
+    assert trim_to_limit(text, 35, len) == ("First point. Second point.\n\n#alpha", ["hashtags_dropped", "sentences_dropped"])
+    # The last hashtag goes only when even one sentence will not fit beside it
+    assert trim_to_limit(text, 13, len) == ("First point.", ["hashtags_dropped", "sentences_dropped", "hashtags_dropped"])
+    assert trim_to_limit(text, 5, len) is None
+
+def test_trim_measures_with_twitter_weights():
+    text = "短い文。 " + "日本語の文章です! " * 20
+    trimmed, fixes = trim_to_limit(text, 280, twitter_length)
+    assert twitter_length(trimmed) <= 280
+    assert trimmed.endswith("!")
+    assert fixes == ["sentences_dropped"]
+
+def test_truncate_words_adds_an_ellipsis():
+    assert truncate_words("one two three four", 12, len) == "one two…"
+    assert truncate_words("unbreakable", 5, len) == "unbr…"
+    assert truncate_words(FAMILY * 3, 5, twitter_length) == FAMILY + "…"
+
+def test_fit_within_limit_is_unchanged():
+    result = fit_to_limit("Short post #tag", "twitter")
+    assert result.text == "Short post #tag"
+    assert result.outcome == "unchanged"
+    assert result.report() == {"platform": "twitter", "limit": 280, "unit": "weighted", "length": 15,
+                               "originalLength": 15, "withinLimit": True, "fixes": []}
+
+def test_fit_counts_graphemes_on_other_platforms(monkeypatch):
+    monkeypatch.setitem(config.PLATFORM_LIMITS, "linkedin", 10)
+    result = fit_to_limit(FAMILY * 10, "linkedin")
+    assert result.unit == "graphemes"
+    assert result.length == 10
+    assert result.outcome == "unchanged"
+
+def test_fit_leaves_big_cuts_to_the_model():
+    text = "A first sentence that is short. " + "Then a long run-on sentence that keeps going " * 10
+    result = fit_to_limit(text, "twitter", max_trim_ratio=0.2)
+    assert result.needs_model
+    assert result.text == text.strip()
+    assert not result.report()["withinLimit"]
+
+def test_fit_without_ratio_always_fits():
+    text = "A first sentence that is short. " + "Then a long run-on sentence that keeps going " * 10
+    result = fit_to_limit(text, "twitter")
+    assert result.text == "A first sentence that is short."
+    assert result.outcome == "sentences_dropped"
+
+    result = fit_to_limit("word " * 100, "twitter")
+    assert result.text.endswith("…")
+    assert result.length <= 280
+    assert result.outcome == "truncated"
+    assert result.report()["originalLength"] == 499
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import pytest
+from fastapi import HTTPException
+import config
+from services import tokens
+from services.preflight import check_context_window, split_into_chunks
+from services.tokens import completion_budget, count_tokens, token_windows
+
+class FourCharacterEncoding:
+    """Stands in for a BPE vocabulary: every four characters are one token."""
+
+    def encode(self, text: str, disallowed_special=()) -> list[int]:
+        return list(range(0, len(text), 4))
+
+    def decode_with_offsets(self, token_ids: list[int]) -> tuple[str, list[int]]:
+        return "", token_ids
+
+@pytest.fixture(params=["estimate", "encoding"])
+def tokenizer(request, monkeypatch):
+    """Runs a test with the offline estimate and again with an encoding, as when the vocabulary is bundled."""
+    monkeypatch.setattr(tokens, "_counts", OrderedDict())
+    monkeypatch.setattr(tokens, "_encoding_loaded", True)
+    monkeypatch.setattr(tokens, "_encoding", FourCharacterEncoding() if request.param == "encoding" else None)
+
+def assert_chunked(text: str, chunks: list[str], max_tokens: int):
+    assert all(count_tokens(chunk) <= max_tokens for chunk in chunks)
+    assert "".join("".join(chunks).split()) == "".join(text.split())
+
+def test_paragraphs_are_packed_together_up_to_the_limit(tokenizer):
+    paragraphs = [f"Paragraph {i} has a handful of ordinary words in it." for i in range(12)]
+    text = "\n\n".join(paragraphs)
+    chunks = split_into_chunks(text, 60)
+    assert 1 < len(chunks) < len(paragraphs)
+    assert [paragraph for chunk in chunks for paragraph in chunk.split("\n\n")] == paragraphs
+    assert_chunked(text, chunks, 60)
+
+def test_long_sentences_fall_back_to_words(tokenizer):
+    text = " ".join(["word"] * 400)
+    chunks = split_into_chunks(text, 50)
+    assert len(chunks) > 1
+    assert all(set(chunk.split()) == {"word"} for chunk in chunks)
+    assert_chunked(text, chunks, 50)
+
+@pytest.mark.parametrize("text", [
+    "日本語の文章です" * 2000,
+    "https://example.com/" + "a1b2c3/" * 7000,
+    "Intro sentence. " + "ｘ" * 3000 + " and a tail",
+])
+def test_text_without_spaces_is_cut_at_token_boundaries(tokenizer, text):
+    chunks = split_into_chunks(text, 500)
+    assert len(chunks) > 1
+    assert_chunked(text, chunks, 500)
+
+def test_token_windows_rejoin_to_the_text(tokenizer):
+    text = "supercalifragilistic" * 50 + "東京" * 100
+    windows = token_windows(text, 37)
+    assert "".join(windows) == text
+    assert all(count_tokens(window) <= 37 for window in windows)
+
+def test_chunks_fit_the_context_window(tokenizer, monkeypatch):
+    monkeypatch.setitem(config.MODEL_CONTEXT_TOKENS, config.MODELS["rewrite"], 2000)
+    chunks = split_into_chunks("長" * 20000, 1000)
+    largest = max(count_tokens(chunk) for chunk in chunks)
+    check_context_window("rewrite", 100, largest, 500)
+    with pytest.raises(HTTPException) as raised:
+        check_context_window("rewrite", 100, 20000, 500)
+    assert raised.value.status_code == 413
+
+@pytest.mark.parametrize("request_type, platform, content_tokens, expected", [
+    ("optimize", "twitter", 0, 280 // 3 + 64),
+    ("optimize", None, 0, config.PLATFORM_LIMITS["default"] // 3 + 64),
+    ("rewrite", None, 1000, 1428),
+    ("rewrite", None, 100000, config.MAX_COMPLETION_TOKENS),
+    ("reply", None, 0, 512),
+    ("outline", None, 0, config.DEFAULT_MAX_TOKENS),
+])
+def test_completion_budget(request_type, platform, content_tokens, expected):
+    assert completion_budget(request_type, platform, content_tokens) == expected
+
+def test_token_counts_are_cached_safely_across_threads(tokenizer, monkeypatch):
+    texts = [f"instruction number {i}" for i in range(200)]
+    expected = [count_tokens(text) for text in texts]
+    monkeypatch.setattr(tokens, "_counts", OrderedDict())
+    monkeypatch.setattr(config, "TOKEN_COUNT_CACHE_SIZE", 50)
+
+    def count_all(offset: int) -> list[int]:
+        return [count_tokens(texts[(i + offset) % len(texts)]) for i in range(2000)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(count_all, range(0, 200, 25)))
+    for offset, counts in zip(range(0, 200, 25), results):
+        assert counts == [expected[(i + offset) % len(texts)] for i in range(2000)]
+    assert len(tokens._counts) == 50
@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+import config
+from services import ratelimit
+from services.ratelimit import RateLimiter, SharedCounterStore, WindowCounter, act_for_caller, charge_usage, identify_caller
+
+START = 6000.0  # The start of a 60-second window
+
+@pytest.fixture(autouse=True)
+def small_limits(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_WINDOW_SECONDS", 60.0)
+    monkeypatch.setattr(config, "RATE_LIMIT_REQUESTS", 3)
+    monkeypatch.setattr(config, "RATE_LIMIT_ENDPOINT_REQUESTS", {})
+    monkeypatch.setattr(config, "TOKEN_QUOTA", 100)
+    monkeypatch.setattr(config, "TOKEN_QUOTA_WINDOW_SECONDS", 60.0)
+
+def test_previous_window_fades_out_linearly():
+    counter = WindowCounter(60)
+    for _ in range(6):
+        counter.add(1, START + 30)
+    assert counter.estimate(START + 59.9)[0] == 6
+    # At the window edge the previous window still counts in full, then fades over the next window
+    assert counter.estimate(START + 60)[0] == 6
+    assert counter.estimate(START + 90)[0] == pytest.approx(3)
+    assert counter.estimate(START + 119.99)[0] == pytest.approx(0, abs=0.01)
+    assert counter.estimate(START + 120)[0] == 0
+
+def test_old_windows_are_dropped_on_add():
+    counter = WindowCounter(60)
+    first = int(START // 60)
+    for offset in (0, 60, 120):
+        counter.add(1, START + offset)
+    assert sorted(counter.windows) == [first + 1, first + 2]
+    counter.add(1, START + 240)
+    assert sorted(counter.windows) == [first + 4]
+
+def test_requests_up_to_the_limit_are_admitted():
+    limiter = RateLimiter()
+    results = [limiter.check_request("ip:1", "/generate-reply", START + i) for i in range(4)]
+    assert [allowed for allowed, *_ in results] == [True, True, True, False]
+    assert [remaining for _, _, remaining, _ in results[:3]] == [2, 1, 0]
+    assert results[3][1] == 3
+    assert results[3][3] >= 1
+    # Limits are per caller and per endpoint
+    assert limiter.check_request("ip:2", "/generate-reply", START + 4)[0]
+    assert limiter.check_request("ip:1", "/rewrite-content", START + 4)[0]
+
+def test_endpoint_limit_overrides_the_default(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_ENDPOINT_REQUESTS", {"/batch": 1})
+    limiter = RateLimiter()
+    assert limiter.check_request("ip:1", "/batch", START)[0]
+    assert not limiter.check_request("ip:1", "/batch", START + 1)[0]
+
+def test_retry_after_points_at_the_first_admitted_moment():
+    limiter = RateLimiter()
+    for i in range(3):
+        limiter.check_request("ip:1", "/generate-reply", START + 10)
+    allowed, _, _, retry_after = limiter.check_request("ip:1", "/generate-reply", START + 10)
+    assert not allowed
+    assert retry_after == 70
+    assert not limiter.check_request("ip:1", "/generate-reply", START + 10 + retry_after - 2)[0]
+    assert limiter.check_request("ip:1", "/generate-reply", START + 10 + retry_after)[0]
+
+def test_rejected_requests_are_not_counted():
+    limiter = RateLimiter()
+    for i in range(10):
+        limiter.check_request("ip:1", "/generate-reply", START + i)
+    assert limiter.counter("req:ip:1:/generate-reply", 60).estimate(START + 10)[0] == 3
+
+def test_token_quota(monkeypatch):
+    limiter = RateLimiter()
+    limiter.charge_tokens("ip:1", 60, START)
+    assert limiter.check_tokens("ip:1", START + 1) == (True, 0)
+    limiter.charge_tokens("ip:1", 50, START + 1)
+    allowed, retry_after = limiter.check_tokens("ip:1", START + 2)
+    assert not allowed and retry_after >= 1
+    assert limiter.check_tokens("ip:2", START + 2)[0]
+
+    monkeypatch.setattr(config, "TOKEN_QUOTA", 0)
+    assert limiter.check_tokens("ip:1", START + 2) == (True, 0)
+
+def test_idle_counters_are_pruned():
+    limiter = RateLimiter()
+    limiter.check_request("ip:1", "/generate-reply", START)
+    limiter.prune(START + 119)
+    assert limiter._counters
+    limiter.prune(START + 121)
+    assert not limiter._counters
+
+def test_charge_usage_follows_the_current_caller(monkeypatch):
+    limiter = RateLimiter()
+    monkeypatch.setattr(ratelimit, "rate_limiter", limiter)
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", True)
+
+    async def run():
+        charge_usage({"total_tokens": 40})  # Outside a request: nobody to charge
+        act_for_caller("key:job-owner")
+        charge_usage({"prompt_tokens": 30, "completion_tokens": 20})
+
+    asyncio.run(run())
+    assert list(limiter._counters) == ["tok:key:job-owner"]
+    assert sum(sum(window) for window in limiter._counters["tok:key:job-owner"].windows.values()) == 50
+
+def test_identify_caller(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_api_keys", {ratelimit.hashlib.sha256(b"secret").hexdigest()[:16]})
+
+    def scope(*headers):
+        return {"headers": list(headers), "client": ("10.0.0.1", 5000)}
+
+    assert identify_caller(scope((b"x-api-key", b"secret"))).startswith("key:")
+    assert identify_caller(scope((b"x-api-key", b"unknown"))) == "ip:10.0.0.1"
+    # A forged X-Forwarded-For does not change the caller; uvicorn resolves trusted proxies into `client`
+    assert identify_caller(scope((b"x-forwarded-for", b"203.0.113.9, 10.0.0.2"))) == "ip:10.0.0.1"
+
+def test_shared_store_carries_counts_between_workers(tmp_path):
+    path = str(tmp_path / "ratelimit.sqlite3")
+    first, second = RateLimiter(SharedCounterStore(path)), RateLimiter(SharedCounterStore(path))
+    now = ratelimit.time.time()
+    try:
+        assert second.check_request("ip:1", "/generate-reply", now)[0]
+        asyncio.run(second.sync())
+        for _ in range(2):
+            assert first.check_request("ip:1", "/generate-reply", now)[0]
+        asyncio.run(first.sync())
+        asyncio.run(second.sync())
+        # Each worker admitted within its own count, but together they have reached the limit
+        assert not second.check_request("ip:1", "/generate-reply", now)[0]
+        # A sync does not count the first worker's own requests twice
+        asyncio.run(first.sync())
+        assert first.counter("req:ip:1:/generate-reply", 60).estimate(now)[0] == 3
+    finally:
+        first.close()
+        second.close()
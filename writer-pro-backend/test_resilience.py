@@ -0,0 +1,143 @@
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+import config
+from services import resilience
+from services.resilience import CircuitBreaker, ResilientCaller
+from services.scheduler import DeadlineExceeded
+
+@pytest.fixture(autouse=True)
+def fast_settings(monkeypatch):
+    monkeypatch.setattr(config, "BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(config, "BREAKER_RESET_SECONDS", 30.0)
+    monkeypatch.setattr(config, "RETRY_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(config, "RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(config, "RETRY_MAX_DELAY", 0.002)
+    monkeypatch.setattr(config, "HEDGE_ENABLED", False)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake time.monotonic for the breaker; only for tests that never start an event loop."""
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+def test_breaker_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker("m")
+    for _ in range(2):
+        breaker.record_failure()
+        breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(HTTPException) as raised:
+        breaker.check()
+    assert raised.value.status_code == 503
+    assert raised.value.headers["Retry-After"] == "30"
+    assert breaker.rejections == 1
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("m")
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker("m")
+    for _ in range(3):
+        breaker.record_failure()
+    clock[0] += 30
+    breaker.check()  # The trial call
+    assert breaker.state == "half_open"
+    with pytest.raises(HTTPException):
+        breaker.check()  # Everyone else fails fast until the trial reports back
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.check()
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker("m")
+    for _ in range(3):
+        breaker.record_failure()
+    clock[0] += 30
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock[0] += 29
+    with pytest.raises(HTTPException):
+        breaker.check()
+    clock[0] += 1
+    breaker.check()
+    assert breaker.state == "half_open"
+
+def call(caller: ResilientCaller, outcomes: list, deadline_in: float = 10.0):
+    """Runs caller.call with an attempt that raises or returns each of `outcomes` in turn."""
+    calls = []
+
+    async def attempt(timeout_seconds, upstream_started):
+        calls.append(timeout_seconds)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def run():
+        return await caller.call("m", attempt, time.monotonic() + deadline_in)
+
+    return asyncio.run(run()), calls
+
+def test_retries_transient_errors_then_succeeds():
+    caller = ResilientCaller()
+    result, calls = call(caller, [HTTPException(status_code=502), HTTPException(status_code=429), "ok"])
+    assert result == "ok"
+    assert len(calls) == 3
+    assert caller.counters["retries"] == 2
+    assert caller.breaker("m").state == "closed"
+    assert caller.breaker("m").consecutive_failures == 0
+
+def test_client_errors_are_not_retried():
+    caller = ResilientCaller()
+    with pytest.raises(HTTPException) as raised:
+        call(caller, [HTTPException(status_code=400), "ok"])
+    assert raised.value.status_code == 400
+    assert caller.counters["retries"] == 0
+
+def test_upstream_failures_open_the_breaker():
+    caller = ResilientCaller()
+    with pytest.raises(HTTPException):
+        call(caller, [HTTPException(status_code=503)] * 3)
+    assert caller.breaker("m").state == "open"
+    with pytest.raises(HTTPException) as raised:
+        call(caller, ["ok"])
+    assert raised.value.status_code == 503
+
+def test_local_deadline_expiry_does_not_count_against_the_breaker():
+    caller = ResilientCaller()
+    for _ in range(5):
+        with pytest.raises(DeadlineExceeded):
+            call(caller, [DeadlineExceeded()])
+    # Already past the deadline before the attempt starts
+    for _ in range(5):
+        with pytest.raises(DeadlineExceeded):
+            call(caller, ["ok"], deadline_in=-1)
+    assert caller.breaker("m").state == "closed"
+    assert caller.breaker("m").consecutive_failures == 0
+    assert caller.counters["retries"] == 0
+
+def test_attempt_slower_than_the_deadline_is_cut_off():
+    caller = ResilientCaller()
+
+    async def slow(timeout_seconds, upstream_started):
+        await asyncio.sleep(5)
+
+    async def run():
+        return await caller.call("m", slow, time.monotonic() + 0.05)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert time.monotonic() - started < 1
+    assert caller.breaker("m").consecutive_failures == 0
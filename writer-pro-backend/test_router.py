@@ -0,0 +1,129 @@
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+import config
+from services.resilience import resilient_caller
+from services.router import ModelRouter, Provider, RouteStats
+
+@pytest.fixture
+def router(monkeypatch):
+    """A router over three reply candidates, with exploration off and costs left out of the score."""
+    monkeypatch.setitem(config.MODEL_CANDIDATES, "reply", ["primary", "backup:second", "backup:third"])
+    monkeypatch.setattr(config, "ROUTER_MIN_SAMPLES", 3)
+    monkeypatch.setattr(config, "ROUTER_EWMA_ALPHA", 0.5)
+    monkeypatch.setattr(config, "ROUTER_EXPLORE_RATIO", 0)
+    monkeypatch.setattr(config, "ROUTER_COST_WEIGHT", 0)
+    monkeypatch.setattr(config, "ROUTER_ORDER_BIAS_SECONDS", 2)
+    monkeypatch.setattr(config, "FAST_TIER_MODEL", None)
+    monkeypatch.setattr(resilient_caller, "_breakers", {})
+    return ModelRouter({"openai": Provider("openai", "http://openai.test", "key"), "backup": Provider("backup", "http://backup.test", None)})
+
+def route(router: ModelRouter, input_tokens: int = 1000, max_tokens: int = 500) -> list[str]:
+    return [candidate.key for candidate in router.route("reply", input_tokens, max_tokens, input_tokens)]
+
+def warm(router: ModelRouter, key: str, seconds: float, failures: int = 0):
+    for _ in range(config.ROUTER_MIN_SAMPLES):
+        router.record_success(key, seconds)
+    for _ in range(failures):
+        router.record_failure(key)
+
+def test_ewma_seeds_from_the_first_success_and_tracks_errors(monkeypatch):
+    monkeypatch.setattr(config, "ROUTER_EWMA_ALPHA", 0.5)
+    stats = RouteStats()
+    stats.record(None)
+    assert (stats.latency, stats.error_rate, stats.samples) == (0.0, 0.5, 1)
+    stats.record(2.0)
+    assert (stats.latency, stats.error_rate) == (2.0, 0.25)
+    stats.record(4.0)
+    assert (stats.latency, stats.error_rate) == (3.0, 0.125)
+    stats.record(None)  # Failures move the error rate but not the latency
+    assert (stats.latency, stats.error_rate, stats.samples) == (3.0, 0.5625, 4)
+
+def test_record_success_and_failure_update_each_candidate(router):
+    router.record_success("primary", 1.5)
+    router.record_failure("backup:second")
+    assert router.stats()["models"] == {
+        "primary": {"latency_ewma_s": 1.5, "error_rate": 0.0, "samples": 1},
+        "backup:second": {"latency_ewma_s": 0.0, "error_rate": 0.5, "samples": 1},
+    }
+
+def test_candidates_keep_their_configured_order_until_they_have_samples(router):
+    assert route(router) == ["primary", "backup:second", "backup:third"]
+    warm(router, "backup:third", 0.1)
+    # Only scored candidates move; the rest follow in configured order
+    assert route(router) == ["backup:third", "primary", "backup:second"]
+
+def test_ranking_weighs_latency_errors_and_position(router):
+    warm(router, "primary", 5.0)
+    warm(router, "backup:second", 3.5)
+    warm(router, "backup:third", 1.0)
+    # second saves 1.5s but sits one position (2s) later; third saves 4s against a 4s bias and ties, so position decides
+    assert route(router) == ["primary", "backup:third", "backup:second"]
+
+    router.record_success("backup:third", 0.5)
+    assert route(router) == ["backup:third", "primary", "backup:second"]
+
+    for _ in range(3):
+        router.record_failure("backup:third")
+    assert route(router)[-1] == "backup:third"
+
+def test_open_circuits_and_small_contexts_push_candidates_back(router, monkeypatch):
+    breaker = resilient_caller.breaker("primary")
+    breaker.state, breaker.retry_at = "open", time.monotonic() + 60
+    assert route(router) == ["backup:second", "backup:third", "primary"]
+
+    breaker.retry_at = time.monotonic() - 1  # Due a trial call: ranked normally again
+    assert route(router) == ["primary", "backup:second", "backup:third"]
+
+    monkeypatch.setitem(config.MODEL_CONTEXT_TOKENS, "backup:second", 1000)
+    assert route(router) == ["primary", "backup:third"]
+
+def test_fast_tier_goes_first_for_short_inputs(router, monkeypatch):
+    monkeypatch.setattr(config, "FAST_TIER_MODEL", "fast")
+    assert route(router, input_tokens=100, max_tokens=100) == ["fast", "primary", "backup:second", "backup:third"]
+    assert route(router, input_tokens=config.FAST_TIER_MAX_INPUT_TOKENS + 1)[0] == "primary"
+    assert router.counters["fast_tier"] == 1
+
+def test_candidate_keys_name_their_provider(router):
+    assert (router.candidate("backup:second").provider.name, router.candidate("backup:second").model) == ("backup", "second")
+    fine_tuned = router.candidate("ft:gpt-4o:acme::abc123")
+    assert (fine_tuned.provider.name, fine_tuned.model) == ("openai", "ft:gpt-4o:acme::abc123")
+
+def call(router: ModelRouter, failures: dict[str, int], deadline_in: float = 30) -> tuple[str, list]:
+    """Runs router.call over the three candidates, each failing with the status in `failures`."""
+    tried = []
+
+    async def call_candidate(candidate, max_attempts):
+        tried.append((candidate.key, max_attempts))
+        if candidate.key in failures:
+            raise HTTPException(status_code=failures[candidate.key], detail="failed")
+        return candidate.key
+
+    candidates = router.route("reply", 1000, 500, 1000)
+    return asyncio.run(router.call(candidates, call_candidate, time.monotonic() + deadline_in)), tried
+
+def test_failover_follows_the_ranked_order(router, monkeypatch):
+    monkeypatch.setattr(config, "ROUTER_ATTEMPTS_BEFORE_FAILOVER", 1)
+    monkeypatch.setattr(config, "RETRY_MAX_ATTEMPTS", 3)
+    result, tried = call(router, {"primary": 503, "backup:second": 429})
+    assert result == "backup:third"
+    # Only the last candidate gets the full retry budget
+    assert tried == [("primary", 1), ("backup:second", 1), ("backup:third", 3)]
+    assert router.counters["failovers"] == 2
+
+def test_request_errors_and_the_last_candidate_do_not_fail_over(router):
+    with pytest.raises(HTTPException) as raised:
+        call(router, {"primary": 400})
+    assert raised.value.status_code == 400
+    assert router.counters["failovers"] == 0
+
+    with pytest.raises(HTTPException) as raised:
+        call(router, {"primary": 503, "backup:second": 503, "backup:third": 502})
+    assert raised.value.status_code == 502
+    assert router.counters["failovers"] == 2
+
+def test_no_failover_once_the_deadline_has_passed(router):
+    with pytest.raises(HTTPException):
+        call(router, {"primary": 503}, deadline_in=-1)
+    assert router.counters["failovers"] == 0
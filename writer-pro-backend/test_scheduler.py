@@ -0,0 +1,124 @@
+import asyncio
+import time
+import pytest
+import config
+from services.scheduler import DeadlineExceeded, ModelLimiter, TokenBucket, UpstreamScheduler
+
+@pytest.fixture(autouse=True)
+def single_slot(monkeypatch):
+    monkeypatch.setattr(config, "SCHEDULER_INITIAL_CONCURRENCY", 1)
+    monkeypatch.setattr(config, "SCHEDULER_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(config, "SCHEDULER_REQUESTS_PER_MINUTE", 10_000)
+    monkeypatch.setattr(config, "SCHEDULER_TOKENS_PER_MINUTE", 10_000_000)
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)  # One unit per second
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    # Larger than the bucket: waits for a full bucket rather than forever
+    assert bucket.wait_time(500, now + 60) == 0.0
+
+def test_released_slot_goes_to_highest_priority_waiter(settle):
+    async def run():
+        limiter = ModelLimiter("m")
+        await limiter.acquire("optimize", 10)
+        order = []
+
+        async def wait(request_type):
+            await limiter.acquire(request_type, 10)
+            order.append(request_type)
+
+        waiters = [asyncio.create_task(wait("optimize")), asyncio.create_task(wait("reply"))]
+        await settle()
+        assert limiter.queue_depth() == {"optimize": 1, "reply": 1}
+
+        limiter.release(rate_limited=False, retry_after=None)
+        await settle()
+        assert order == ["reply"]
+        assert limiter.active == 1
+
+        limiter.release(rate_limited=False, retry_after=None)
+        await asyncio.gather(*waiters)
+        assert order == ["reply", "optimize"]
+        limiter.release(rate_limited=False, retry_after=None)
+        assert limiter.active == 0
+
+    asyncio.run(run())
+
+def test_deadline_expires_while_queued():
+    async def run():
+        limiter = ModelLimiter("m")
+        await limiter.acquire("reply", 10)
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded) as raised:
+            await limiter.acquire("reply", 10, deadline=started + 0.05)
+        assert raised.value.status_code == 504
+        assert time.monotonic() - started < 1
+        assert limiter.counters["deadline_expired"] == 1
+        assert limiter.queue_depth() == {}
+
+        # The expired waiter must not take the slot when it frees up
+        limiter.release(rate_limited=False, retry_after=None)
+        assert limiter.active == 0
+
+    asyncio.run(run())
+
+def test_cancelled_waiter_leaves_the_queue(settle):
+    async def run():
+        limiter = ModelLimiter("m")
+        await limiter.acquire("reply", 10)
+        waiter = asyncio.create_task(limiter.acquire("reply", 10))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.queue_depth() == {}
+        limiter.release(rate_limited=False, retry_after=None)
+        assert limiter.active == 0
+
+    asyncio.run(run())
+
+@pytest.mark.parametrize("deadline", [None, 60.0])
+def test_slot_granted_to_a_cancelled_waiter_is_handed_back(settle, deadline):
+    async def run():
+        limiter = ModelLimiter("m")
+        await limiter.acquire("reply", 10)
+        waiter = asyncio.create_task(limiter.acquire("reply", 10, None if deadline is None else time.monotonic() + deadline))
+        await settle()
+        # The slot is granted and the waiter cancelled in the same tick, as when a client disconnect frees a slot
+        limiter.release(rate_limited=False, retry_after=None)
+        waiter.cancel()
+        results = await asyncio.gather(waiter, return_exceptions=True)
+        assert isinstance(results[0], asyncio.CancelledError)
+        assert limiter.active == 0
+
+    asyncio.run(run())
+
+def test_rate_limited_call_halves_the_limit_and_pauses(monkeypatch):
+    monkeypatch.setattr(config, "SCHEDULER_MIN_CONCURRENCY", 1)
+
+    async def run():
+        limiter = ModelLimiter("m")
+        limiter.limit = 8.0
+        await limiter.acquire("reply", 10)
+        limiter.release(rate_limited=True, retry_after=2.0)
+        assert limiter.limit == 4.0
+        assert limiter.paused_until - time.monotonic() == pytest.approx(2.0, abs=0.1)
+        assert limiter.counters["rate_limited"] == 1
+
+    asyncio.run(run())
+
+def test_slot_context_releases_on_error():
+    async def run():
+        scheduler = UpstreamScheduler()
+        with pytest.raises(RuntimeError):
+            async with scheduler.slot("m", "reply", 10):
+                raise RuntimeError("upstream blew up")
+        assert scheduler.limiter("m").active == 0
+        async with scheduler.slot("m", "reply", 10):
+            assert scheduler.limiter("m").active == 1
+        assert scheduler.limiter("m").active == 0
+
+    asyncio.run(run())
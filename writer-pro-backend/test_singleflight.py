@@ -0,0 +1,180 @@
+import asyncio
+import time
+import httpx
+import pytest
+import config
+from services import ratelimit
+from services.history import generation_history
+from services.openai import call_openai_api
+from services.ratelimit import RateLimiter, act_for_caller
+from services.router import model_router
+from services.scheduler import DeadlineExceeded
+from services.singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_call(settle):
+    async def run():
+        flight = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+
+        waiters = [asyncio.create_task(flight.do("key", fetch)) for _ in range(5)]
+        await settle()
+        release.set()
+        assert await asyncio.gather(*waiters) == ["answer"] * 5
+        assert len(calls) == 1
+        assert flight.counters["leaders"] == 1
+        assert flight.counters["coalesced"] == 4
+        assert flight.in_flight() == 0
+
+        # Finished calls are forgotten, so the next caller starts a fresh one
+        assert await flight.do("key", fetch) == "answer"
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+def test_error_is_shared_by_every_waiter():
+    async def run():
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight.counters["leaders"] == 1
+
+    asyncio.run(run())
+
+def test_one_waiter_leaving_keeps_the_call_for_the_others(settle):
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "answer"
+
+        leaving = asyncio.create_task(flight.do("key", fetch))
+        staying = asyncio.create_task(flight.do("key", fetch))
+        await settle()
+        leaving.cancel()
+        await settle()
+        release.set()
+        assert await staying == "answer"
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        assert flight.counters["abandoned"] == 0
+
+    asyncio.run(run())
+
+def test_call_is_cancelled_once_every_waiter_leaves(settle):
+    async def run():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flight.do("key", fetch)) for _ in range(2)]
+        await settle()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert flight.counters["abandoned"] == 1
+        assert flight.in_flight() == 0
+
+    asyncio.run(run())
+
+def test_waiter_stops_at_its_own_deadline_without_cancelling_the_call(settle):
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "answer"
+
+        patient = asyncio.create_task(flight.do("key", fetch, time.monotonic() + 10))
+        await settle()
+        with pytest.raises(DeadlineExceeded):
+            await flight.do("key", fetch, time.monotonic() + 0.05)
+        release.set()
+        assert await patient == "answer"
+        assert flight.counters["abandoned"] == 0
+
+    asyncio.run(run())
+
+def test_call_cut_off_by_its_leaders_deadline_restarts_for_waiters_with_time_left(settle):
+    async def run():
+        flight = SingleFlight()
+
+        def fetch_until(deadline: float):
+            async def fetch():
+                # Stands in for an upstream call that runs out of the deadline it was started with
+                await asyncio.sleep(0.1)
+                if time.monotonic() >= deadline:
+                    raise DeadlineExceeded()
+                return "answer"
+            return fetch
+
+        short = time.monotonic() + 0.05
+        leader = asyncio.create_task(flight.do("key", fetch_until(short), short))
+        await settle()
+        long = time.monotonic() + 10
+        assert await flight.do("key", fetch_until(long), long) == "answer"
+        with pytest.raises(DeadlineExceeded):
+            await leader
+        assert flight.counters["leaders"] == 2
+        assert flight.counters["restarted"] == 1
+
+    asyncio.run(run())
+
+def chat_completion(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={
+        "choices": [{"message": {"role": "assistant", "content": "Shared answer"}}],
+        "usage": {"prompt_tokens": 20, "completion_tokens": 10, "total_tokens": 30},
+    })
+
+def test_each_request_sharing_a_call_is_charged_and_recorded_for_itself(monkeypatch):
+    limiter = RateLimiter()
+    recorded = []
+    monkeypatch.setattr(ratelimit, "rate_limiter", limiter)
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(config, "TOKEN_QUOTA", 1000)
+    monkeypatch.setattr(config, "CACHE_ENABLED", {})
+    monkeypatch.setattr(model_router.providers["openai"], "api_key", "test-key")
+    monkeypatch.setattr(generation_history, "record", lambda *args, **kwargs: recorded.append(ratelimit.current_caller()))
+
+    async def run():
+        calls = 0
+
+        async def upstream(request: httpx.Request) -> httpx.Response:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.1)
+            return chat_completion(request)
+
+        async def request_as(caller: str):
+            act_for_caller(caller)
+            return await call_openai_api("Coalesced prompt", "instruction", None, "reply", client, False, 50)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+            results = await asyncio.gather(request_as("key:alice"), request_as("key:bob"))
+        assert results == ["Shared answer"] * 2
+        assert calls == 1
+
+    asyncio.run(run())
+    assert sorted(key for key in limiter._counters) == ["tok:key:alice", "tok:key:bob"]
+    assert all(sum(map(sum, counter.windows.values())) == 30 for counter in limiter._counters.values())
+    assert sorted(recorded) == ["key:alice", "key:bob"]